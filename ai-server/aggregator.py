@@ -0,0 +1,188 @@
+"""
+Rolling Time-Series Aggregation of Detection Results
+Per-intersection, per-class counts kept in fixed-size ring buffers at 1 s, 1 min
+and 1 h resolution. Updates are O(1) and queries O(buckets), so /analytics costs
+the same no matter how long the server has been running
+"""
+
+import threading
+import time
+
+# Resolution name -> (seconds per bucket, buckets kept)
+RESOLUTIONS = {
+    '1s': (1, 120),     # Last 2 minutes
+    '1m': (60, 120),    # Last 2 hours
+    '1h': (3600, 48),   # Last 2 days
+}
+
+# Minimum tracked time before vehicles_per_hour is reported (shorter spans extrapolate noise)
+MIN_RATE_WINDOW_SECONDS = 300
+
+
+class RingSeries:
+    """
+    Fixed-size ring of time buckets at one resolution
+
+    Each slot remembers which absolute bucket it holds, so a slot is lazily reset
+    when time wraps around to it instead of being cleared by a timer.
+    """
+
+    def __init__(self, resolution, size, width):
+        self.resolution = resolution
+        self.size = size
+        self.width = width
+        self._ids = [-1] * size
+        self._rows = [[0] * width for _ in range(size)]
+
+    def add(self, timestamp, values):
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.size
+        if self._ids[slot] != bucket:
+            if self._ids[slot] > bucket:
+                return  # Older than the ring covers
+            self._ids[slot] = bucket
+            self._rows[slot] = [0] * self.width
+        row = self._rows[slot]
+        for i, value in enumerate(values):
+            row[i] += value
+
+    def buckets(self, now, count):
+        """Last `count` buckets up to now, oldest first: list of (bucket start time, row)"""
+        newest = int(now // self.resolution)
+        result = []
+        for bucket in range(newest - min(count, self.size) + 1, newest + 1):
+            slot = bucket % self.size
+            row = self._rows[slot] if self._ids[slot] == bucket else [0] * self.width
+            result.append((bucket * self.resolution, row))
+        return result
+
+    def total(self, now, count):
+        """Column sums over the last `count` buckets"""
+        totals = [0] * self.width
+        for _, row in self.buckets(now, count):
+            for i, value in enumerate(row):
+                totals[i] += value
+        return totals
+
+
+class IntersectionSeries:
+    """All resolutions for one intersection plus the most recent result"""
+
+    def __init__(self, width):
+        self.lock = threading.Lock()
+        self.rings = {name: RingSeries(res, size, width) for name, (res, size) in RESOLUTIONS.items()}
+        self.latest_counts = None
+        self.latest_at = None
+        self.tracked_since = None  # First result with arrivals (unique tracked vehicles), None if untracked
+
+
+class TrafficAggregator:
+    """
+    Thread-safe rolling aggregates of detection results
+
+    Columns per bucket: frames, vehicles observed per class (summed over frames),
+    arrivals per class (confirmed new tracks, i.e. unique vehicles, from the stream trackers).
+    """
+
+    def __init__(self, vehicle_types):
+        self.vehicle_types = list(vehicle_types)
+        self.width = 1 + 2 * len(self.vehicle_types)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get(self, intersection_id, create=False):
+        with self._lock:
+            series = self._series.get(intersection_id)
+            if series is None and create:
+                series = IntersectionSeries(self.width)
+                self._series[intersection_id] = series
+            return series
+
+    def record(self, intersection_id, vehicle_counts, arrivals=None, timestamp=None):
+        """
+        Add one detection result
+
+        Args:
+            vehicle_counts: Vehicle type -> count in this frame
+            arrivals: Vehicle type -> number of newly tracked vehicles (None if the source is untracked)
+            timestamp: Frame time (epoch seconds, default now)
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        values = [1] + [vehicle_counts.get(t, 0) for t in self.vehicle_types]
+        values += [(arrivals or {}).get(t, 0) for t in self.vehicle_types]
+
+        series = self._get(intersection_id, create=True)
+        with series.lock:
+            for ring in series.rings.values():
+                ring.add(timestamp, values)
+            if series.latest_at is None or timestamp >= series.latest_at:
+                series.latest_counts = dict(vehicle_counts)
+                series.latest_at = timestamp
+            if arrivals is not None and (series.tracked_since is None or timestamp < series.tracked_since):
+                series.tracked_since = timestamp
+
+    def _window(self, totals):
+        n = len(self.vehicle_types)
+        frames = totals[0]
+        observed = dict(zip(self.vehicle_types, totals[1:1 + n]))
+        arrivals = dict(zip(self.vehicle_types, totals[1 + n:]))
+        return {
+            'frames': frames,
+            'average_vehicles': {t: round(c / frames, 2) if frames else 0 for t, c in observed.items()},
+            'average_total_vehicles': round(sum(observed.values()) / frames, 2) if frames else 0,
+            'arrivals': arrivals,
+            'total_arrivals': sum(arrivals.values())
+        }
+
+    def summary(self, intersection_id, now=None):
+        """
+        Current state and windowed aggregates for an intersection, or None if nothing was recorded
+
+        Windows: last minute (1 s buckets), last hour (1 min buckets), last 24 h (1 h buckets)
+        """
+        series = self._get(intersection_id)
+        if series is None:
+            return None
+        now = now if now is not None else time.time()
+        with series.lock:
+            rings = series.rings
+            fps_window = 10
+            recent_frames = rings['1s'].total(now, fps_window)[0]
+            windows = {
+                'last_minute': self._window(rings['1s'].total(now, 60)),
+                'last_hour': self._window(rings['1m'].total(now, 60)),
+                'last_24_hours': self._window(rings['1h'].total(now, 24)),
+            }
+            # Arrival rate over the tracked part of the last hour; None until it covers
+            # MIN_RATE_WINDOW_SECONDS (the arrivals so far are in windows.last_hour)
+            span = min(3600.0, now - series.tracked_since) if series.tracked_since is not None else 0.0
+            vehicles_per_hour = (round(windows['last_hour']['total_arrivals'] * 3600.0 / span)
+                                 if span >= MIN_RATE_WINDOW_SECONDS else None)
+            latest = series.latest_counts or {}
+            return {
+                'current': {
+                    'total_vehicles': sum(latest.values()),
+                    'vehicles_by_type': dict(latest),
+                    'last_update': series.latest_at,
+                    'fps': round(recent_frames / fps_window, 2)
+                },
+                'windows': windows,
+                'vehicles_per_hour': vehicles_per_hour,
+                'rate_window_seconds': round(max(span, 0.0))
+            }
+
+    def series(self, intersection_id, resolution='1m', count=60, now=None):
+        """Per-bucket totals at one resolution, oldest first"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}' (available: {', '.join(RESOLUTIONS)})")
+        series = self._get(intersection_id)
+        if series is None:
+            return []
+        now = now if now is not None else time.time()
+        with series.lock:
+            buckets = series.rings[resolution].buckets(now, count)
+        return [dict(self._window(row), start=start) for start, row in buckets]
+
+    def intersections(self):
+        with self._lock:
+            return list(self._series)
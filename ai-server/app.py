@@ -2,69 +2,240 @@ from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import threading
 import time
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
 import base64
+import hmac
+import atexit
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from batching import InferenceBatcher
+from stream_hub import StreamHub
+from frame_buffer import FrameStore
+from preprocessing import Preprocessor, PROFILES as PREPROCESS_PROFILES
+from backends import load_backend, compare_backends
+from worker_pool import WorkerPool, in_worker_process
+from model_loader import ModelNotReady
+from model_registry import ModelRegistry
+from motion_gate import MotionGateRegistry
+from tracker import TrackerRegistry
+from aggregator import TrafficAggregator
+from history import HistoryStore, parse_time
+from roi import RoiStore, crop as crop_to_region, inside as inside_region
+from postprocess import DetectionPostprocessor
+from metrics import MetricsRegistry, CallbackGauge, PROMETHEUS_CONTENT_TYPE
+from result_cache import ResultCache, content_key, perceptual_hash
+from quality import QualityController, LEVELS as QUALITY_LEVELS, cap_profile
+from serializers import DetectionSerializer, StreamEvent, negotiate_format, FORMATS as SERIALIZATION_FORMATS
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React app
 
-# Load YOLOv11 model
-model = YOLO('yolo11n.pt')  # Nano model (fastest)
-# model = YOLO('yolo11s.pt')  # Small model (balanced)
-# model = YOLO('yolo11m.pt')  # Medium model (accurate)
+# Metrics (Prometheus text format at /metrics); recording goes to lock-striped shards
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    'ai_stage_duration_seconds',
+    'Pipeline stage latency (upload_read, decode, preprocess, queue_wait, inference, postprocess, serialization)',
+    ('stage',))
+REQUEST_SECONDS = metrics.histogram('ai_request_duration_seconds', 'End-to-end request latency', ('endpoint',))
+REQUESTS_STARTED = metrics.counter('ai_requests_started_total', 'Requests started', ('endpoint',))
+REQUESTS_FINISHED = metrics.counter('ai_requests_finished_total', 'Requests finished', ('endpoint',))
 
-# IMAGE PREPROCESSING FUNCTIONS FOR BETTER TOY CAR DETECTION
-def preprocess_image(img):
+@contextmanager
+def track_request(endpoint):
+    """Count a request as in flight and record its end-to-end latency"""
+    REQUESTS_STARTED.inc(endpoint)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+        REQUESTS_FINISHED.inc(endpoint)
+
+# Inference backend configuration
+#   torch:    Ultralytics/PyTorch .pt weights (supports test-time augmentation)
+#   onnx:     ONNX Runtime on an exported .onnx model
+#   openvino: OpenVINO on an exported *_openvino_model directory
+# Export with: python train_custom_model.py --export onnx openvino --export-only --weights <model.pt>
+INFERENCE_BACKEND = os.environ.get('AI_BACKEND', 'torch')
+MODEL_PATH = os.environ.get('AI_MODEL_PATH', 'yolo11n.pt')  # Nano model (fastest)
+# MODEL_PATH = 'yolo11s.pt'  # Small model (balanced)
+# MODEL_PATH = 'yolo11m.pt'  # Medium model (accurate)
+# MODEL_PATH = 'runs/detect/toy_car_detection/weights/best.onnx'  # Custom model exported to ONNX
+INFERENCE_THREADS = int(os.environ.get('AI_INFERENCE_THREADS', 0)) or None  # None = library default
+MODEL_INPUT_SIZE = int(os.environ.get('AI_INPUT_SIZE', 640))
+
+# Worker pool mode: N model processes pinned to disjoint core sets (0 = in-process model)
+# AI_INFERENCE_THREADS then applies per worker (default: the size of its core set)
+INFERENCE_WORKERS = int(os.environ.get('AI_INFERENCE_WORKERS', 0))
+WORKER_TASK_TIMEOUT = float(os.environ.get('AI_WORKER_TASK_TIMEOUT', 30))  # Seconds before a worker counts as stuck
+
+def create_model(backend=INFERENCE_BACKEND, weights=MODEL_PATH):
+    """Load the model in-process, or start the worker pool that loads it once per worker"""
+    if INFERENCE_WORKERS > 0:
+        pool = WorkerPool(backend, weights, imgsz=MODEL_INPUT_SIZE, num_workers=INFERENCE_WORKERS,
+                          threads_per_worker=INFERENCE_THREADS, task_timeout=WORKER_TASK_TIMEOUT or None)
+        try:
+            return pool.wait_ready()  # A worker's model load error fails the load (and shows in /health)
+        except Exception:
+            pool.close()
+            raise
+    return load_backend(backend, weights, imgsz=MODEL_INPUT_SIZE, threads=INFERENCE_THREADS)
+
+# Dummy-frame inferences at the production input size before the server reports ready (0 = none)
+WARMUP_RUNS = int(os.environ.get('AI_WARMUP_RUNS', 3))
+
+def warm_up(model):
+    """Pay lazy initialization and kernel selection costs before the first real request"""
+    frame = np.random.default_rng(0).integers(0, 256, (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3), dtype=np.uint8)
+    params = dict(conf=0.3, iou=0.4, agnostic_nms=True, augment=model.supports_augment, half=False)
+    workers = max(1, INFERENCE_WORKERS)  # One call per pool worker at a time, so every worker warms up
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(WARMUP_RUNS):
+            list(pool.map(lambda _: model.predict([frame], **params), range(workers)))
+
+# Hot model swapping: POST /models/deploy loads, warms up and validates a model in the background,
+# then swaps it in; requests finish on the version they started on. The replaced version stays
+# loaded for instant rollback (AI_MODEL_KEEP_PREVIOUS=0 releases it once its requests drain)
+MODEL_KEEP_PREVIOUS = os.environ.get('AI_MODEL_KEEP_PREVIOUS', '1') != '0'
+MODEL_REFERENCE_DIR = os.environ.get('AI_MODEL_REFERENCE_DIR', 'datasets/toy_cars/images/val')
+MODEL_REFERENCE_IMAGES = int(os.environ.get('AI_MODEL_REFERENCE_IMAGES', 16))
+MODEL_MAX_SLOWDOWN = float(os.environ.get('AI_MODEL_MAX_SLOWDOWN', 2.0))   # Max p50 latency vs. the active model
+MODEL_MIN_AGREEMENT = float(os.environ.get('AI_MODEL_MIN_AGREEMENT', 0.8))  # Min share of the active model's boxes
+                                                                             # the candidate finds
+ADMIN_TOKEN = os.environ.get('AI_ADMIN_TOKEN')  # /models/deploy and /models/rollback need a matching X-Admin-Token
+                                               # (both are disabled while no token is configured)
+
+def reference_paths():
+    """An even sample of the images in AI_MODEL_REFERENCE_DIR (empty if it has none)"""
+    root = Path(MODEL_REFERENCE_DIR)
+    paths = sorted(p for p in root.rglob('*') if p.suffix.lower() in ('.jpg', '.jpeg', '.png')) if root.is_dir() else []
+    if len(paths) > MODEL_REFERENCE_IMAGES:
+        step = len(paths) / MODEL_REFERENCE_IMAGES
+        paths = [paths[int(i * step)] for i in range(MODEL_REFERENCE_IMAGES)]
+    return paths
+
+def reference_images():
+    """Validation frames read from AI_MODEL_REFERENCE_DIR (unreadable files are skipped)"""
+    return [img for img in (cv2.imread(str(p)) for p in reference_paths()) if img is not None]
+
+def validate_model(candidate, active):
+    """
+    Check a candidate model against the active version on the reference images
+    Passes if it runs, is at most MODEL_MAX_SLOWDOWN times slower and finds at least
+    MODEL_MIN_AGREEMENT of the active model's detections
+    """
+    images = reference_images()
+    if not images:
+        return {'passed': False, 'error': f"No readable reference images in {MODEL_REFERENCE_DIR}"}
+    params = dict(conf=0.3, iou=0.4, max_det=MAX_DETECTIONS, agnostic_nms=True, augment=False, half=False)
+    # The active model only runs through the batcher (models are not safe to call concurrently)
+    active_batched = SimpleNamespace(predict=lambda frames, **kw: [
+        batcher.infer(frame, model_version=active.id, **kw)[0] for frame in frames])
+
+    candidate_ms = []
+    for img in images:
+        start = time.perf_counter()
+        candidate.predict([img], **params)
+        candidate_ms.append((time.perf_counter() - start) * 1000)
+    active_ms = [batcher.infer(img, model_version=active.id, **params)[1]['inference_ms'] for img in images]
+    agreement = compare_backends(active_batched, candidate, images, min_iou=0.5, conf_tolerance=1.0, **params)
+
+    candidate_p50, active_p50 = float(np.median(candidate_ms)), float(np.median(active_ms))
+    return {
+        'passed': candidate_p50 <= active_p50 * MODEL_MAX_SLOWDOWN and agreement['match_rate'] >= MODEL_MIN_AGREEMENT,
+        'reference_images': len(images),
+        'source': MODEL_REFERENCE_DIR,
+        'candidate_p50_ms': round(candidate_p50, 2),
+        'active_p50_ms': round(active_p50, 2),
+        'max_slowdown': MODEL_MAX_SLOWDOWN,
+        'agreement': agreement['match_rate'],
+        'min_agreement': MODEL_MIN_AGREEMENT,
+        'active_detections': agreement['reference_detections'],
+        'mean_matched_iou': agreement['mean_matched_iou']
+    }
+
+MODEL_SWAPS = metrics.counter('ai_model_swaps_total', 'Model versions swapped in after startup (deployments and rollbacks)')
+
+def on_model_swap(old, new):
+    if old is not None:
+        result_cache.clear()  # Cached responses came from the old model
+        MODEL_SWAPS.inc()
+
+# Load YOLOv11 model in the background so the server binds its port immediately
+# (pool workers re-import this module when spawned; they load their own copy)
+models = ModelRegistry(create_model, warm_up if WARMUP_RUNS > 0 else None, validate_model,
+                       keep_previous=MODEL_KEEP_PREVIOUS, on_swap=on_model_swap)
+if not in_worker_process():
+    models.start(INFERENCE_BACKEND, MODEL_PATH)
+MODEL_NAME = os.path.basename(os.path.normpath(MODEL_PATH))
+
+# Micro-batching settings (trade a few ms of latency for throughput under concurrent load)
+BATCH_MAX_SIZE = int(os.environ.get('AI_BATCH_MAX_SIZE', 8))          # Max frames per forward pass
+BATCH_MAX_WAIT_MS = float(os.environ.get('AI_BATCH_MAX_WAIT_MS', 10))  # Max time a frame waits for a batch
+
+def run_model_batch(images, model_version=None, **params):
+    """Run one batched forward pass on a pinned model version, returning one Detections per image"""
+    with STAGE_SECONDS.time('inference'):
+        return models.get(model_version).predict(images, **params)
+
+# All inference goes through the batcher, so requests never contend on the model
+# (in pool mode one batch per worker can be in flight)
+batcher = InferenceBatcher(run_model_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                           concurrency=max(1, INFERENCE_WORKERS))
+
+def infer_frame(image, **params):
+    """
+    Batched inference on the active model version
+    The frame is pinned to that version, so a model swap never interrupts it
+    Returns: (result, batch_info, version)
+    """
+    try:
+        with models.acquire() as version:
+            result, batch_info = batcher.infer(image, model_version=version.id, **params)
+    except ModelNotReady as e:
+        raise RequestError(str(e), status=503, model_state=e.state)
+    return result, batch_info, version
+
+# IMAGE PREPROCESSING FOR BETTER TOY CAR DETECTION
+# Profiles: 'none' (raw frame), 'fast' (downscale first, luminance CLAHE, box denoise, sharpen),
+# 'quality' (full-resolution LAB CLAHE, non-local means denoise, sharpen)
+DEFAULT_PREPROCESS_PROFILE = os.environ.get('AI_PREPROCESS_PROFILE', 'quality')
+preprocessor = Preprocessor(target_size=MODEL_INPUT_SIZE)
+
+# Per-camera profile overrides (camera_id -> profile), set via /cameras/<camera_id>/preprocessing
+camera_preprocess_profiles = {}
+
+def preprocess_image(img, profile=None):
     """
     Enhance image quality for better toy car detection
-    - Increases contrast for better feature visibility
-    - Reduces noise
-    - Sharpens edges
-    """
-    # 1. Increase contrast using CLAHE (Contrast Limited Adaptive Histogram Equalization)
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-    l = clahe.apply(l)
-    enhanced = cv2.merge([l, a, b])
-    enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
-    
-    # 2. Denoise (reduce camera noise)
-    denoised = cv2.fastNlMeansDenoisingColored(enhanced, None, 10, 10, 7, 21)
-    
-    # 3. Sharpen edges for better detection
-    kernel = np.array([[-1, -1, -1],
-                       [-1,  9, -1],
-                       [-1, -1, -1]])
-    sharpened = cv2.filter2D(denoised, -1, kernel)
-    
-    return sharpened
-
-def estimate_orientation(bbox_coords, img_shape):
-    """
-    Estimate car orientation based on bounding box geometry
-    Returns: orientation string (front, back, left, right)
-    """
-    x1, y1, x2, y2 = bbox_coords
-    width = x2 - x1
-    height = y2 - y1
-    aspect_ratio = width / height if height > 0 else 1.0
-    
-    # Simple heuristic based on aspect ratio
-    # Side views tend to be wider, front/back views more square
-    if aspect_ratio > 1.4:  # Wide car (side view)
-        # Determine if left or right based on position
-        center_x = (x1 + x2) / 2
-        img_center_x = img_shape[1] / 2
-        return 'left' if center_x < img_center_x else 'right'
-    else:  # Front/back view (more square)
-        # Determine if front or back based on vertical position
-        center_y = (y1 + y2) / 2
-        img_center_y = img_shape[0] / 2
-        return 'front' if center_y < img_center_y else 'back'
+    Returns: (processed image, info with profile, scale and per-stage timings)
+    """
+    with STAGE_SECONDS.time('preprocess'):
+        return preprocessor.run(img, profile or DEFAULT_PREPROCESS_PROFILE)
+
+def resolve_preprocess_profile(requested=None, camera_id=None):
+    """Pick the preprocessing profile: explicit request > camera setting > server default"""
+    if requested:
+        return requested
+    if camera_id is not None and camera_id in camera_preprocess_profiles:
+        return camera_preprocess_profiles[camera_id]
+    return DEFAULT_PREPROCESS_PROFILE
+
+# Tracking: the stream detector runs every Nth frame and tracks are propagated in between;
+# speeds in km/h need a per-camera calibration (PUT /cameras/<camera_id>/tracking)
+trackers = TrackerRegistry(
+    detect_every=int(os.environ.get('AI_TRACK_DETECT_EVERY', 3)),
+    meters_per_pixel=float(os.environ.get('AI_METERS_PER_PIXEL', 0))  # 0 = uncalibrated
+)
+
+# Per-camera regions of interest (normalized polygons), persisted across restarts
+ROI_PATH = os.environ.get('AI_ROI_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'camera_roi.json'))
+roi_store = RoiStore(ROI_PATH)
 
 # Vehicle classes (COCO dataset indices)
 VEHICLE_CLASSES = {
@@ -74,195 +245,796 @@ VEHICLE_CLASSES = {
     7: 'truck',
     1: 'bicycle'
 }
+postprocessor = DetectionPostprocessor(VEHICLE_CLASSES)
+serializer = DetectionSerializer(postprocessor)
 
-# Global variables for tracking
-detection_data = {
-    'total_vehicles': 0,
-    'vehicles_by_type': {
-        'car': 0,
-        'truck': 0,
-        'bus': 0,
-        'motorcycle': 0,
-        'bicycle': 0
-    },
-    'current_detections': [],
-    'last_update': None,
-    'fps': 0
-}
+# Upper bound on detections per image (raise for busy intersections)
+MAX_DETECTIONS = int(os.environ.get('AI_MAX_DETECTIONS', 20))
 
-# Camera streams
-camera_streams = {}
+# Rolling per-intersection traffic counts (1 s / 1 min / 1 h buckets), fed by every detection result
+aggregator = TrafficAggregator(postprocessor.vehicle_types)
 
-@app.route('/', methods=['GET'])
-def home():
-    """Root endpoint with API information"""
-    return jsonify({
+# Intersection for results that do not name one, and camera -> intersection mapping
+# e.g. AI_CAMERA_INTERSECTIONS="cam1=north,cam2=north,cam3=south"
+DEFAULT_INTERSECTION_ID = os.environ.get('AI_INTERSECTION_ID', 'main')
+CAMERA_INTERSECTIONS = dict(
+    pair.split('=', 1) for pair in os.environ.get('AI_CAMERA_INTERSECTIONS', '').split(',') if '=' in pair
+)
+
+def resolve_intersection(requested=None, camera_id=None):
+    """Pick the intersection for a result: explicit request > camera mapping > server default"""
+    if requested:
+        return requested
+    return CAMERA_INTERSECTIONS.get(camera_id, DEFAULT_INTERSECTION_ID)
+
+# Durable detection history: Parquet files partitioned by intersection and day, compacted into
+# minute/hour rollups in the background (disable with AI_HISTORY=0)
+HISTORY_DIR = os.environ.get('AI_HISTORY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history'))
+HISTORY_ENABLED = os.environ.get('AI_HISTORY', '1') != '0'
+history = HistoryStore(HISTORY_DIR, postprocessor.vehicle_types) if HISTORY_ENABLED and not in_worker_process() else None
+if history is not None:
+    atexit.register(history.close)  # Flush buffered rows on shutdown
+
+def record_result(intersection_id, camera_id, vehicle_counts, arrivals=None, timestamp=None):
+    """Feed one detection result to the rolling aggregates and the history"""
+    aggregator.record(intersection_id, vehicle_counts, arrivals, timestamp)
+    if history is not None:
+        history.record(intersection_id, camera_id, vehicle_counts, arrivals, timestamp)
+
+# /detect result cache: byte-identical uploads with the same parameters (e.g. a paused camera feed)
+# reuse the earlier response; AI_RESULT_CACHE_PHASH=1 also matches re-encoded copies of the same frame
+# by a perceptual hash after decoding (AI_RESULT_CACHE_SIZE=0 disables the cache)
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('AI_RESULT_CACHE_SIZE', 256)),
+    max_bytes=int(os.environ.get('AI_RESULT_CACHE_MAX_MB', 64)) * 1024 * 1024,
+    ttl_seconds=float(os.environ.get('AI_RESULT_CACHE_TTL', 10))
+)
+RESULT_CACHE_PHASH = os.environ.get('AI_RESULT_CACHE_PHASH', '0') == '1'
+
+def result_cache_lookups():
+    stats = result_cache.get_stats()
+    lookups = {(f'{kind}_hit',): count for kind, count in stats['hits'].items()}
+    lookups[('miss',)] = stats['misses']
+    return lookups
+
+metrics.register(CallbackGauge('ai_result_cache_lookups_total', 'Result cache lookups by outcome',
+                               result_cache_lookups, ('result',), metric_type='counter'))
+metrics.gauge('ai_result_cache_entries', 'Cached /detect results', lambda: {(): result_cache.get_stats()['entries']})
+
+def cached_detection(entry, intersection_id, camera_id):
+    """Response for a cache hit (the result still counts towards the intersection's analytics)"""
+    body, mimetype, headers, vehicle_counts = entry
+    record_result(resolve_intersection(intersection_id, camera_id), camera_id, vehicle_counts)
+    return body, mimetype, dict(headers, **{'X-Cache': 'HIT'})
+
+# Camera streams: per-camera ring buffers holding only the newest frames
+FRAME_BUFFER_CAPACITY = int(os.environ.get('AI_FRAME_BUFFER_CAPACITY', 3))
+camera_streams = FrameStore(capacity=FRAME_BUFFER_CAPACITY)
+
+# Stream settings
+STREAM_MAX_FPS = float(os.environ.get('AI_STREAM_MAX_FPS', 10))  # Max inference rate per camera
+STREAM_KEEPALIVE_SECONDS = 15                                     # SSE keep-alive interval
+
+# Adaptive quality: when the p95 latency of /detect and stream detector runs exceeds the target
+# (or the inference queue backs up) step down through cheaper levels (no TTA, fast preprocessing,
+# smaller input, lower stream FPS) and back up when there is headroom again (0 = always full quality)
+LATENCY_TARGET_MS = float(os.environ.get('AI_LATENCY_TARGET_MS', 1000))
+QUALITY_TRANSITIONS = metrics.counter('ai_quality_transitions_total', 'Adaptive quality level changes', ('direction',))
+
+def apply_quality_level(old_level, new_level):
+    """Apply the settings that are not read per request (stream FPS cap)"""
+    stream_hub.set_max_fps(STREAM_MAX_FPS * QUALITY_LEVELS[new_level]['stream_fps'])
+    QUALITY_TRANSITIONS.inc('down' if new_level > old_level else 'up')
+
+quality_controller = QualityController(
+    LATENCY_TARGET_MS,
+    queue_depth_fn=lambda: batcher.get_stats()['queue_depth'],
+    max_queue_depth=int(os.environ.get('AI_QUALITY_MAX_QUEUE', 2 * BATCH_MAX_SIZE)),
+    on_change=apply_quality_level
+)
+metrics.gauge('ai_model_ready', 'Whether the model is loaded and warmed up', lambda: {(): int(models.ready)})
+metrics.gauge('ai_model_version', 'Active model version id', lambda: {(): models.active.id if models.active else None})
+metrics.gauge('ai_startup_seconds', 'Process start until the model was ready',
+              lambda: {(): models.startup.get_stats()['startup_seconds']})
+metrics.gauge('ai_first_request_seconds', 'Latency of the first /detect request after startup',
+              lambda: {(): models.startup.first_request_ms / 1000 if models.startup.first_request_ms is not None else None})
+metrics.gauge('ai_quality_level', 'Adaptive quality level (0 = full quality)',
+              lambda: {(): quality_controller.level})
+
+# Motion gating: stream frames that barely differ from the last inferred frame reuse its result
+# (defaults below, overridable per camera via /cameras/<camera_id>/motion)
+motion_gates = MotionGateRegistry(
+    enabled=os.environ.get('AI_MOTION_GATE', '1') != '0',
+    motion_threshold=float(os.environ.get('AI_MOTION_THRESHOLD', 0.005)),          # Fraction of changed pixels
+    max_staleness_seconds=float(os.environ.get('AI_MOTION_MAX_STALENESS', 2.0))    # Re-infer at least this often
+)
+
+class RequestError(Exception):
+    """Client error from the shared pipeline, mapped to an HTTP response by each server mode"""
+    
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': message, **extra}
+
+# SHARED PIPELINE (used by both the Flask server below and the ASGI server in asgi_app.py)
+
+def api_info():
+    """API information for the root endpoint"""
+    return {
         'message': 'YOLOv11 AI Detection Server',
         'version': '1.0.0',
         'status': 'running',
         'endpoints': {
             'health': '/health',
+            'liveness': '/health/live',
+            'readiness': '/health/ready',
             'detect_image': '/detect (POST)',
             'detect_stream': '/detect/stream/<camera_id> (GET)',
-            'analytics': '/analytics/<intersection_id> (GET)'
+            'ingest_frame': '/frames/<camera_id> (POST)',
+            'analytics': '/analytics/<intersection_id> (GET)',
+            'batching_stats': '/stats/batching (GET)',
+            'stream_stats': '/stats/streams (GET)',
+            'frame_stats': '/stats/frames (GET)',
+            'camera_preprocessing': '/cameras/<camera_id>/preprocessing (GET, PUT)',
+            'preprocessing_stats': '/stats/preprocessing (GET)',
+            'worker_stats': '/stats/workers (GET)',
+            'camera_motion': '/cameras/<camera_id>/motion (GET, PUT)',
+            'camera_roi': '/cameras/<camera_id>/roi (GET, PUT)',
+            'camera_tracking': '/cameras/<camera_id>/tracking (GET, PUT)',
+            'tracking_stats': '/stats/tracking (GET)',
+            'history': '/history/<intersection_id>?start=&end=&resolution= (GET)',
+            'peak_hours': '/history/<intersection_id>/peak-hours?days= (GET)',
+            'history_stats': '/stats/history (GET)',
+            'metrics': '/metrics (GET, Prometheus text format)',
+            'quality_stats': '/stats/quality (GET)',
+            'cache_stats': '/stats/cache (GET)',
+            'startup_stats': '/stats/startup (GET)',
+            'models': '/models (GET)',
+            'deploy_model': '/models/deploy (POST)',
+            'rollback_model': '/models/rollback (POST)',
+            'motion_stats': '/stats/motion (GET)'
         },
-        'model': 'YOLOv11n',
+        'model': active_model_name(),
+        'backend': active_model_backend(),
         'timestamp': datetime.now().isoformat()
+    }
+
+def active_model_name():
+    active = models.active
+    return active.name if active is not None else MODEL_NAME
+
+def active_model_backend():
+    active = models.active
+    return active.backend if active is not None else INFERENCE_BACKEND
+
+def health_info():
+    """Overall health: 'starting' while the model loads, 'unhealthy' if loading failed or the worker pool did"""
+    state = models.state
+    error = models.startup.error if state == 'failed' and models.startup is not None else None
+    active = models.active
+    if active is not None and getattr(active.model, 'error', None):
+        state, error = 'failed', active.model.error  # Worker pool crash loop
+    status = {'ready': 'healthy', 'failed': 'unhealthy'}.get(state, 'starting')
+    body = {
+        'status': status,
+        'model': active_model_name(),
+        'backend': active_model_backend(),
+        'model_state': state,
+        'timestamp': datetime.now().isoformat()
+    }
+    if error:
+        body['error'] = error
+    return body, 503 if state == 'failed' else 200
+
+def liveness_info():
+    """Liveness: the process is up and serving HTTP (whatever the model is doing)"""
+    return {'status': 'alive', 'timestamp': datetime.now().isoformat()}
+
+def readiness_info():
+    """Readiness: the model is loaded and warmed up; 503 until then"""
+    body = dict(models.startup.get_stats(), ready=models.ready, model=active_model_name(),
+                backend=active_model_backend())
+    return body, 200 if models.ready else 503
+
+def require_model():
+    """503 RequestError while the startup model is still loading"""
+    if not models.ready:
+        raise RequestError(f"Model is not ready ({models.state})", status=503, model_state=models.state)
+
+def select_format(requested=None, accept=None):
+    """Negotiate the response format, raising 406 for unsupported explicit formats"""
+    response_format = negotiate_format(requested, accept)
+    if response_format is None:
+        raise RequestError(f"Unsupported format '{requested}'", status=406,
+                           available_formats=list(SERIALIZATION_FORMATS))
+    return response_format
+
+def bypasses_cache(cache_control):
+    """True when the request's Cache-Control header asks for a fresh result (no-cache / no-store)"""
+    directives = {d.strip().lower() for d in (cache_control or '').split(',')}
+    return bool(directives & {'no-cache', 'no-store'})
+
+def run_detection(img_bytes, profile=None, camera_id=None, response_format='json', intersection_id=None,
+                  use_cache=True):
+    """
+    Detect vehicles in an encoded image
+    decode -> preprocess -> batched inference -> post-processing -> serialization
+    use_cache=False skips the result cache (neither read nor written)
+    Returns: (body, mimetype, extra response headers)
+    """
+    print(f"   Image size: {len(img_bytes)} bytes")
+    
+    if len(img_bytes) == 0:
+        print("❌ Empty image data")
+        raise RequestError('Empty image file')
+    
+    require_model()
+    request_start = time.perf_counter()
+    level = quality_controller.current()
+    
+    # Identical upload with the same parameters: reuse the cached response
+    # (the quality level sets augment / input size / profile cap, so results of other levels or models don't match)
+    active_id = models.active.id
+    cache_params = (profile, camera_id, response_format, level['level'], active_id)
+    cache_keys = [content_key(img_bytes, *cache_params)] if result_cache.enabled and use_cache else []
+    cached = result_cache.get(cache_keys[0]) if cache_keys else None
+    if cached is not None:
+        print("♻️  Result cache hit (identical upload)")
+        return cached_detection(cached, intersection_id, camera_id)
+    
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    with STAGE_SECONDS.time('decode'):
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    if img is None:
+        print("❌ Failed to decode image")
+        raise RequestError('Invalid image format')
+    
+    print(f"   Image decoded: {img.shape[1]}x{img.shape[0]}")
+    
+    if cache_keys and RESULT_CACHE_PHASH:
+        cache_keys.append(('phash', perceptual_hash(img)) + cache_params)
+        cached = result_cache.get(cache_keys[1], kind='perceptual')
+        if cached is not None:
+            print("♻️  Result cache hit (same frame content)")
+            return cached_detection(cached, intersection_id, camera_id)
+    if cache_keys:
+        result_cache.miss()
+    
+    # STEP 1: Crop to the camera's region of interest and preprocess for better detection
+    profile = resolve_preprocess_profile(profile, camera_id)
+    if profile not in PREPROCESS_PROFILES:
+        raise RequestError(f"Unknown preprocessing profile '{profile}'")
+    profile = cap_profile(profile, level['max_profile'])  # Cheaper profile under latency pressure
+    region = roi_store.region(camera_id, img.shape)
+    img_roi = crop_to_region(img, region) if region is not None else img
+    print(f"🔧 Preprocessing image (profile: {profile})...")
+    img_processed, preprocess_info = preprocess_image(img_roi, profile)
+    scale = preprocess_info['scale']
+    
+    # STEP 2: Run inference with OPTIMIZED parameters for toy cars
+    # (batched together with concurrent requests)
+    print("🤖 Running YOLO inference with optimized parameters...")
+    result, batch_info, version = infer_frame(
+        img_processed, 
+        conf=0.3,              # Balanced confidence threshold (30%)
+        iou=0.4,               # Lower IoU threshold for better separation
+        max_det=MAX_DETECTIONS,  # Limit max detections to reduce false positives
+        agnostic_nms=True,     # Class-agnostic Non-Maximum Suppression
+        augment=level['augment'],  # Test-time augmentation for better accuracy (dropped under load)
+        half=False,            # Use FP32 for better precision
+        imgsz=level['input_size']  # Smaller input under load (None = AI_INPUT_SIZE)
+    )
+    STAGE_SECONDS.observe(batch_info['queue_wait_ms'] / 1000, 'queue_wait')
+    print(f"   Batch size: {batch_info['batch_size']} (waited {batch_info['queue_wait_ms']} ms)")
+    
+    # Process results (vectorized over all boxes)
+    frame = postprocess_detections(result, img.shape, scale, region)
+    vehicle_counts = postprocessor.vehicle_counts(frame)
+    orientation_counts = postprocessor.orientation_counts(frame)  # NEW: estimated orientation
+    
+    # Calculate statistics
+    total_vehicles = sum(vehicle_counts.values())
+    record_result(resolve_intersection(intersection_id, camera_id), camera_id, vehicle_counts)
+    
+    print(f"✅ Detection complete: {total_vehicles} vehicles found")
+    print(f"   Vehicle counts: {vehicle_counts}")
+    print(f"   Orientation counts: {orientation_counts}")
+    print(f"   Detections: {len(frame.scores)} bounding boxes")
+    
+    response = {
+        'success': True,
+        'timestamp': datetime.now().isoformat(),
+        'total_vehicles': total_vehicles,
+        'vehicle_counts': vehicle_counts,
+        'orientation_counts': orientation_counts,  # NEW: orientation statistics
+        'image_size': {
+            'width': img.shape[1],
+            'height': img.shape[0]
+        },
+        'preprocessing_applied': profile != 'none',  # NEW: indicate preprocessing was used
+        'preprocessing': preprocess_info,  # Profile, scale and per-stage cost
+        'roi': roi_info(region),  # Crop rectangle the model saw, if the camera has an ROI
+        'detection_params': {  # NEW: show detection parameters
+            'confidence_threshold': 0.3,
+            'iou_threshold': 0.4,
+            'augment': level['augment'] and version.supports_augment,  # Exported backends cannot run TTA
+            'input_size': level['input_size'] or MODEL_INPUT_SIZE
+        },
+        'inference': batch_info,  # Achieved batch size and queue wait
+        'quality': {'level': level['level'], 'name': level['name']},  # Adaptive quality level used
+        'model': {'version': version.id, 'name': version.name}  # Model version that ran the detection
+    }
+    
+    # Serialize detections straight from the column arrays in the negotiated format
+    start = time.perf_counter()
+    body, mimetype = serializer.serialize(response_format, response, frame, detailed=True)
+    serialization_ms = (time.perf_counter() - start) * 1000
+    STAGE_SECONDS.observe(serialization_ms / 1000, 'serialization')
+    
+    request_ms = (time.perf_counter() - request_start) * 1000
+    quality_controller.observe(request_ms, {
+        'preprocess': preprocess_info['total_ms'],
+        'queue_wait': batch_info['queue_wait_ms'],
+        'inference': batch_info['inference_ms'],
+        'serialization': serialization_ms
     })
+    models.startup.record_request(request_ms)
+    
+    headers = {'X-Serialization-Ms': f"{serialization_ms:.3f}", 'X-Quality-Level': str(level['level']),
+               'Vary': 'Accept'}
+    if version.id == active_id and models.active is version:  # Not if a swap replaced the model meanwhile
+        for key in cache_keys:
+            result_cache.put(key, (body, mimetype, headers, vehicle_counts), len(body))
+    return body, mimetype, dict(headers, **{'X-Cache': 'MISS'}) if cache_keys else headers
+
+def postprocess_detections(result, image_shape, scale, region=None):
+    """
+    Post-process one image's detections into full-frame coordinates
+    With an ROI, boxes are shifted back from the crop and detections centered outside the polygon are dropped
+    """
+    with STAGE_SECONDS.time('postprocess'):
+        if region is None:
+            return postprocessor.process(result, image_shape, scale)
+        frame = postprocessor.process(result, image_shape, scale, offset=(region.x0, region.y0))
+        return postprocessor.select(frame, inside_region(region, frame.center_x, frame.center_y))
+
+def roi_info(region):
+    if region is None:
+        return None
+    return {'crop': [region.x0, region.y0, region.x1, region.y1]}
+
+def process_stream_frame(camera_id, seq, frame, timestamp):
+    """
+    Run detection (or track propagation) on one camera frame for the stream workers
+    Returns: StreamEvent, serialized at most once per format and shared by all subscribers
+    """
+    if not models.ready:
+        return None  # No events until the model is loaded
+    
+    # Skip preprocessing and inference if the scene has not changed since the last inferred frame
+    region = roi_store.region(camera_id, frame.shape)
+    frame_roi = crop_to_region(frame, region) if region is not None else frame
+    
+    gate = motion_gates.gate(camera_id)
+    run_inference, motion_score = gate.check(frame_roi)
+    if not run_inference:
+        frame_detections, data = gate.last_result
+        data = dict(data, timestamp=datetime.now().isoformat(), frame_seq=seq,
+                    motion_score=round(motion_score, 4), reused_result=True)
+        record_result(resolve_intersection(camera_id=camera_id), camera_id, data['vehicle_counts'], {}, timestamp)
+        return StreamEvent(serializer, data, frame_detections)
+    
+    level = quality_controller.current()
+    profile = cap_profile(resolve_preprocess_profile(camera_id=camera_id), level['max_profile'])
+    tracker = trackers.tracker(camera_id)
+    detector_run = tracker.needs_detection()
+    if detector_run:
+        # Preprocess frame with the camera's profile
+        start = time.perf_counter()
+        frame_processed, preprocess_info = preprocess_image(frame_roi, profile)
+        scale = preprocess_info['scale']
+        
+        # Run inference with optimized parameters
+        result, batch_info, version = infer_frame(
+            frame_processed,
+            conf=0.3,
+            iou=0.4,
+            agnostic_nms=True,
+            augment=level['augment'],
+            imgsz=level['input_size']
+        )
+        STAGE_SECONDS.observe(batch_info['queue_wait_ms'] / 1000, 'queue_wait')
+        
+        frame_detections = postprocess_detections(result, frame.shape, scale, region)
+        quality_controller.observe((time.perf_counter() - start) * 1000, {
+            'preprocess': preprocess_info['total_ms'],
+            'queue_wait': batch_info['queue_wait_ms'],
+            'inference': batch_info['inference_ms']
+        })
+        track_ids = tracker.update(frame_detections.boxes, frame_detections.scores,
+                                   frame_detections.type_ids, timestamp)
+        arrivals = [postprocessor.vehicle_types[i] for i in tracker.last_arrivals]
+    else:
+        # Between detector runs, publish the tracks' predicted positions
+        boxes, scores, type_ids, track_ids = tracker.propagate(timestamp)
+        frame_detections = postprocessor.build(boxes, scores, type_ids, frame.shape)
+        arrivals = []
+    
+    # Process and send results
+    vehicle_counts = postprocessor.vehicle_counts(frame_detections)
+    record_result(resolve_intersection(camera_id=camera_id), camera_id, vehicle_counts,
+                  {t: arrivals.count(t) for t in set(arrivals)}, timestamp)
+    
+    data = {
+        'timestamp': datetime.now().isoformat(),
+        'camera_id': camera_id,
+        'frame_seq': seq,
+        'preprocessing_profile': profile,
+        'total_vehicles': sum(vehicle_counts.values()),
+        'vehicle_counts': vehicle_counts,
+        'motion_score': round(motion_score, 4),
+        'reused_result': False,
+        'detector_run': detector_run,
+        'quality_level': level['level'],
+        'model_version': models.active.id,
+        'tracks': tracker.track_info(track_ids, timestamp)  # Aligned with the detections
+    }
+    gate.accept((frame_detections, data))
+    
+    return StreamEvent(serializer, data, frame_detections)
+
+def get_camera_frame(camera_id, last_seq, timeout):
+    """
+    Frame source for the stream workers
+    Returns: (seq, frame, capture timestamp) if a frame newer than last_seq arrives within timeout, else None
+    """
+    entry = camera_streams.wait_for_newer(camera_id, last_seq, timeout=timeout)
+    if entry is None:
+        return None
+    return entry.seq, entry.frame, entry.timestamp
+
+# One shared inference worker per watched camera, fanned out to all SSE clients
+stream_hub = StreamHub(get_camera_frame, process_stream_frame, max_fps=STREAM_MAX_FPS)
+
+def ingest_camera_frame(camera_id, body, mimetype, seq=None, timestamp=None, width=None, height=None):
+    """
+    Decode a pushed camera frame and store it in the camera's ring buffer
+    Metadata values may be strings (from headers / query args)
+    Returns: Whether the frame was accepted and the buffer statistics
+    """
+    if len(body) == 0:
+        raise RequestError('Empty frame body')
+    
+    try:
+        seq = int(seq) if seq is not None else None
+        timestamp = float(timestamp) if timestamp is not None else None
+        width = int(width) if width is not None else None
+        height = int(height) if height is not None else None
+    except ValueError as e:
+        raise RequestError(f'Invalid frame metadata: {str(e)}')
+    
+    buf = np.frombuffer(body, np.uint8)
+    if mimetype == 'application/octet-stream':
+        if width is None or height is None:
+            raise RequestError('Raw BGR frames need X-Frame-Width and X-Frame-Height')
+        if buf.size != width * height * 3:
+            raise RequestError(f'Expected {width * height * 3} bytes for {width}x{height} BGR, got {buf.size}')
+        frame = buf.reshape(height, width, 3)  # View over the request body, no copy
+    else:
+        with STAGE_SECONDS.time('decode'):
+            frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise RequestError('Invalid image format')
+    
+    entry = camera_streams.put(camera_id, frame, seq=seq, timestamp=timestamp)
+    
+    return {
+        'success': True,
+        'camera_id': camera_id,
+        'accepted': entry is not None,
+        'frame_seq': entry.seq if entry is not None else seq,
+        'buffer': camera_streams.buffer(camera_id).get_stats()
+    }
+
+def set_camera_preprocessing(camera_id, profile):
+    """Set (or reset with None) the preprocessing profile for a camera"""
+    if profile is None:
+        camera_preprocess_profiles.pop(camera_id, None)
+    elif profile not in PREPROCESS_PROFILES:
+        raise RequestError(f"Unknown preprocessing profile '{profile}'")
+    else:
+        camera_preprocess_profiles[camera_id] = profile
+    result_cache.clear()  # Cached /detect results may have used the old profile
+
+def camera_preprocessing_info(camera_id):
+    return {
+        'camera_id': camera_id,
+        'profile': resolve_preprocess_profile(camera_id=camera_id),
+        'default_profile': DEFAULT_PREPROCESS_PROFILE,
+        'available_profiles': list(PREPROCESS_PROFILES)
+    }
+
+def set_camera_roi(camera_id, polygon):
+    """Set (or clear with None) the ROI polygon for a camera"""
+    try:
+        roi_store.set(camera_id, polygon)
+    except ValueError as e:
+        raise RequestError(str(e))
+    result_cache.clear()  # Cached /detect results may have used the old ROI
+
+def camera_roi_info(camera_id):
+    return {'camera_id': camera_id, 'polygon': roi_store.get(camera_id)}
+
+def set_camera_tracking(camera_id, settings):
+    """Update the tracker settings (detect_every, meters_per_pixel, ...) for a camera"""
+    try:
+        trackers.configure(camera_id, **settings)
+    except (TypeError, ValueError) as e:
+        raise RequestError(str(e))
+
+def camera_tracking_info(camera_id):
+    return {'camera_id': camera_id, **trackers.tracker(camera_id).summary()}
+
+def set_camera_motion(camera_id, settings):
+    """Update the motion gate settings for a camera"""
+    try:
+        motion_gates.configure(camera_id, **settings)
+    except (TypeError, ValueError) as e:
+        raise RequestError(str(e))
+
+def camera_motion_info(camera_id):
+    return {'camera_id': camera_id, **motion_gates.gate(camera_id).get_stats()}
+
+def in_flight_requests():
+    started = REQUESTS_STARTED.collect()
+    finished = REQUESTS_FINISHED.collect()
+    return {labels: count - finished.get(labels, 0) for labels, count in started.items()}
+
+metrics.gauge('ai_requests_in_flight', 'Requests currently being processed', in_flight_requests, ('endpoint',))
+metrics.gauge('ai_batch_queue_depth', 'Frames waiting in the micro-batching queue',
+              lambda: {(): batcher.get_stats()['queue_depth']})
+metrics.gauge('ai_camera_fps', 'Stream frames processed per second',
+              lambda: {(camera_id,): s['fps'] for camera_id, s in stream_hub.get_stats().items()}, ('camera_id',))
+metrics.gauge('ai_camera_stream_subscribers', 'SSE clients per camera',
+              lambda: {(camera_id,): s['subscribers'] for camera_id, s in stream_hub.get_stats().items()}, ('camera_id',))
+metrics.gauge('ai_intersection_fps', 'Detection results per second per intersection (last 10 s)',
+              lambda: {(i,): aggregator.summary(i)['current']['fps'] for i in aggregator.intersections()},
+              ('intersection_id',))
+
+def check_admin_token(token):
+    """403 RequestError unless AI_ADMIN_TOKEN is configured and the X-Admin-Token matches it"""
+    if not ADMIN_TOKEN:
+        raise RequestError('Model deployment is disabled (set AI_ADMIN_TOKEN to enable it)', status=403)
+    if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise RequestError('Invalid or missing X-Admin-Token', status=403)
+
+def models_info():
+    return {'timestamp': datetime.now().isoformat(), **models.get_stats()}
+
+def deploy_model(settings, token=None):
+    """
+    Start deploying new weights (load, warm up, validate, swap) in the background
+    Returns: the new version's info; progress is visible under GET /models
+    """
+    check_admin_token(token)
+    weights = settings.get('weights')
+    if not weights:
+        raise RequestError('Missing "weights" (path to the model file)')
+    if not reference_paths():
+        raise RequestError(f"No reference images in {MODEL_REFERENCE_DIR} to validate the model on "
+                           "(set AI_MODEL_REFERENCE_DIR)", status=409)
+    try:
+        version = models.deploy(weights, settings.get('backend') or INFERENCE_BACKEND)
+    except ValueError as e:
+        raise RequestError(str(e))
+    except RuntimeError as e:
+        raise RequestError(str(e), status=409)
+    return version.info()
+
+def rollback_model(token=None):
+    """Swap the previous model version back in"""
+    check_admin_token(token)
+    try:
+        return models.rollback().info()
+    except RuntimeError as e:
+        raise RequestError(str(e), status=409)
+
+def metrics_text():
+    """Prometheus text exposition for /metrics"""
+    return metrics.render()
+
+def server_stats(section):
+    """Statistics for the /stats/<section> endpoints"""
+    sources = {
+        'batching': lambda: {'batching': batcher.get_stats()},
+        'streams': lambda: {'streams': stream_hub.get_stats()},
+        'frames': lambda: {'cameras': camera_streams.get_stats()},
+        'preprocessing': lambda: {'default_profile': DEFAULT_PREPROCESS_PROFILE,
+                                  'profiles': preprocessor.get_stats()},
+        'motion': lambda: {'cameras': motion_gates.get_stats()},
+        'tracking': lambda: {'cameras': trackers.get_stats()},
+        'quality': lambda: {'quality': quality_controller.get_stats()},
+        'cache': lambda: {'cache': result_cache.get_stats()},
+        'startup': lambda: {'startup': models.startup.get_stats()},
+        'history': lambda: {'history': history.get_stats() if history is not None else None},
+        'workers': lambda: (models.active.model.get_stats()
+                            if models.active and isinstance(models.active.model, WorkerPool)
+                            else {'backend': INFERENCE_BACKEND, 'workers': []}),
+    }
+    if section not in sources:
+        raise RequestError(f"Unknown stats section '{section}'", status=404)
+    return {'timestamp': datetime.now().isoformat(), **sources[section]()}
+
+def analytics_report(intersection_id):
+    """
+    Traffic analytics for an intersection
+    Returns: Aggregated statistics from the rolling per-intersection buckets
+    """
+    summary = aggregator.summary(intersection_id) or {
+        'current': {'total_vehicles': 0, 'vehicles_by_type': {t: 0 for t in postprocessor.vehicle_types},
+                    'last_update': None, 'fps': 0},
+        'windows': {},
+        'vehicles_per_hour': None,
+        'rate_window_seconds': 0
+    }
+    current = summary['current']
+    last_minute = summary['windows'].get('last_minute', {})
+    
+    # Speeds come from the stream trackers of the intersection's cameras
+    # (km/h needs a camera calibration, px/s always available)
+    cameras = [c for c in trackers.camera_ids() if resolve_intersection(camera_id=c) == intersection_id]
+    average_speed, average_speed_px_s = trackers.average_speed(cameras)
+    
+    return {
+        'intersection_id': intersection_id,
+        'timestamp': datetime.now().isoformat(),
+        'current_data': {
+            **current,
+            'last_update': (datetime.fromtimestamp(current['last_update']).isoformat()
+                            if current['last_update'] else None)
+        },
+        'analytics': {
+            'vehicles_per_hour': summary['vehicles_per_hour'],  # Unique tracked vehicles, None without streams
+            'vehicles_per_hour_window_seconds': summary['rate_window_seconds'],  # Tracked time the rate covers
+            'congestion_level': calculate_congestion_level(last_minute.get('average_total_vehicles',
+                                                                           current['total_vehicles'])),
+            'average_speed': average_speed,  # km/h, None until a camera is calibrated
+            'average_speed_px_s': average_speed_px_s,
+            'peak_hours': history.peak_hours(intersection_id) if history is not None else [],  # Busiest hours, last 7 days
+            'windows': summary['windows']  # Last minute / hour / 24 hours
+        }
+    }
+
+def history_report(intersection_id, start=None, end=None, resolution='auto'):
+    """
+    Detection history for a time range (default: the last 24 hours)
+    start/end: ISO datetimes or epoch seconds; resolution: auto, minute, hour or raw
+    """
+    if history is None:
+        raise RequestError('History is disabled (AI_HISTORY=0)', status=404)
+    try:
+        end = parse_time(end, datetime.now())
+        start = parse_time(start, end - timedelta(hours=24))
+        resolution, df = history.query(intersection_id, start, end, resolution or 'auto')
+    except ValueError as e:
+        raise RequestError(str(e))
+    
+    time_column = 'timestamp' if resolution == 'raw' else resolution
+    rows = df.with_columns(df[time_column].dt.strftime('%Y-%m-%dT%H:%M:%S')).to_dicts() if df.height else []
+    return {
+        'intersection_id': intersection_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+        'rows': rows
+    }
+
+def peak_hours_report(intersection_id, days=7, top=3):
+    if history is None:
+        raise RequestError('History is disabled (AI_HISTORY=0)', status=404)
+    try:
+        days, top = int(days), int(top)
+    except ValueError as e:
+        raise RequestError(f'Invalid query: {str(e)}')
+    return {
+        'intersection_id': intersection_id,
+        'days': days,
+        'peak_hours': history.peak_hours(intersection_id, days=days, top=top)
+    }
+
+def calculate_congestion_level(vehicle_count):
+    """Calculate congestion level based on vehicle count"""
+    if vehicle_count < 10:
+        return 'Low'
+    elif vehicle_count < 30:
+        return 'Medium'
+    else:
+        return 'High'
+
+# FLASK ROUTES
+
+@app.errorhandler(RequestError)
+def handle_request_error(e):
+    return jsonify(e.body), e.status
+
+@app.route('/', methods=['GET'])
+def home():
+    """Root endpoint with API information"""
+    return jsonify(api_info())
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'model': 'YOLOv11n',
-        'timestamp': datetime.now().isoformat()
-    })
+    body, status = health_info()
+    return jsonify(body), status
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe: 200 as long as the process serves requests"""
+    return jsonify(liveness_info())
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    body, status = readiness_info()
+    return jsonify(body), status
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics: per-stage latency histograms, queue depth, in-flight requests, camera FPS"""
+    return Response(metrics_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/stats/<section>', methods=['GET'])
+def stats(section):
+    """Server statistics: batching, streams, frames, preprocessing, workers, motion, tracking, history, quality, cache, startup"""
+    return jsonify(server_stats(section))
 
 @app.route('/detect', methods=['POST'])
 def detect_vehicles():
     """
     Detect vehicles in a single image
     Expects: multipart/form-data with 'image' file
-    Returns: Detection results with bounding boxes
+             optional 'profile' (none/fast/quality), 'camera_id' and 'intersection_id' fields or query args
+    Returns: Detection results with bounding boxes, as verbose JSON (default),
+             columnar JSON, MessagePack or packed binary (?format= or Accept header)
     """
+    with track_request('detect'):
+        return _detect_vehicles()
+
+def _detect_vehicles():
     try:
         print("📸 Received detection request")
+        response_format = select_format(request.args.get('format'), request.headers.get('Accept'))
         print(f"   Request files: {list(request.files.keys())}")
         print(f"   Content-Type: {request.content_type}")
         
         # Get image from request
-        if 'image' not in request.files:
-            print("❌ No 'image' field in request.files")
-            return jsonify({'error': 'No image provided'}), 400
-        
-        file = request.files['image']
+        with STAGE_SECONDS.time('upload_read'):
+            if 'image' not in request.files:
+                print("❌ No 'image' field in request.files")
+                return jsonify({'error': 'No image provided'}), 400
+            
+            file = request.files['image']
+            img_bytes = file.read()
         print(f"   Filename: {file.filename}")
         
-        # Read image
-        img_bytes = file.read()
-        print(f"   Image size: {len(img_bytes)} bytes")
-        
-        if len(img_bytes) == 0:
-            print("❌ Empty image data")
-            return jsonify({'error': 'Empty image file'}), 400
-        
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            print("❌ Failed to decode image")
-            return jsonify({'error': 'Invalid image format'}), 400
-        
-        print(f"   Image decoded: {img.shape[1]}x{img.shape[0]}")
-        
-        # STEP 1: Preprocess image for better detection
-        print("🔧 Preprocessing image...")
-        img_processed = preprocess_image(img)
-        
-        # STEP 2: Run inference with OPTIMIZED parameters for toy cars
-        print("🤖 Running YOLO inference with optimized parameters...")
-        results = model(
-            img_processed, 
-            conf=0.3,              # Balanced confidence threshold (30%)
-            iou=0.4,               # Lower IoU threshold for better separation
-            max_det=20,            # Limit max detections to reduce false positives
-            agnostic_nms=True,     # Class-agnostic Non-Maximum Suppression
-            augment=True,          # Test-time augmentation for better accuracy
-            half=False,            # Use FP32 for better precision
-            verbose=False
+        body, mimetype, headers = run_detection(
+            img_bytes,
+            profile=request.values.get('profile'),
+            camera_id=request.values.get('camera_id'),
+            response_format=response_format,
+            intersection_id=request.values.get('intersection_id'),
+            use_cache=not bypasses_cache(request.headers.get('Cache-Control'))
         )
         
-        # Process results
-        detections = []
-        vehicle_counts = {
-            'car': 0,
-            'truck': 0,
-            'bus': 0,
-            'motorcycle': 0,
-            'bicycle': 0
-        }
-        
-        orientation_counts = {
-            'front': 0,
-            'back': 0,
-            'left': 0,
-            'right': 0,
-            'unknown': 0
-        }
-        
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls_id = int(box.cls[0])
-                
-                # Check if it's a vehicle
-                if cls_id in VEHICLE_CLASSES:
-                    vehicle_type = VEHICLE_CLASSES[cls_id]
-                    vehicle_counts[vehicle_type] += 1
-                    
-                    # Get bounding box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    confidence = float(box.conf[0])
-                    
-                    # Estimate orientation based on bbox geometry
-                    orientation = estimate_orientation([x1, y1, x2, y2], img.shape)
-                    orientation_counts[orientation] += 1
-                    
-                    # Calculate additional bbox info
-                    width = x2 - x1
-                    height = y2 - y1
-                    center_x = (x1 + x2) / 2
-                    center_y = (y1 + y2) / 2
-                    area = width * height
-                    
-                    detections.append({
-                        'class': vehicle_type,
-                        'confidence': confidence,
-                        'orientation': orientation,  # NEW: estimated orientation
-                        'bbox': {
-                            'x1': x1,
-                            'y1': y1,
-                            'x2': x2,
-                            'y2': y2,
-                            'width': width,
-                            'height': height,
-                            'center_x': center_x,
-                            'center_y': center_y,
-                            'area': area,
-                            'aspect_ratio': width / height if height > 0 else 1.0
-                        }
-                    })
-        
-        # Calculate statistics
-        total_vehicles = sum(vehicle_counts.values())
-        
-        print(f"✅ Detection complete: {total_vehicles} vehicles found")
-        print(f"   Vehicle counts: {vehicle_counts}")
-        print(f"   Orientation counts: {orientation_counts}")
-        print(f"   Detections: {len(detections)} bounding boxes")
-        
-        response = {
-            'success': True,
-            'timestamp': datetime.now().isoformat(),
-            'total_vehicles': total_vehicles,
-            'vehicle_counts': vehicle_counts,
-            'orientation_counts': orientation_counts,  # NEW: orientation statistics
-            'detections': detections,
-            'image_size': {
-                'width': img.shape[1],
-                'height': img.shape[0]
-            },
-            'preprocessing_applied': True,  # NEW: indicate preprocessing was used
-            'detection_params': {  # NEW: show detection parameters
-                'confidence_threshold': 0.3,
-                'iou_threshold': 0.4,
-                'augment': True
-            }
-        }
-        
-        return jsonify(response)
+        http_response = Response(body, mimetype=mimetype)
+        http_response.headers.update(headers)
+        return http_response
     
+    except RequestError:
+        raise
     except Exception as e:
         print(f"❌ Detection error: {str(e)}")
         import traceback
@@ -276,102 +1048,157 @@ def detect_vehicles():
 def detect_stream(camera_id):
     """
     Real-time detection on video stream
+    Optional: ?format=json|columnar|msgpack|binary (binary formats are base64 per event)
     Returns: Server-Sent Events (SSE) with detection results
     """
+    response_format = select_format(request.args.get('format'))
+    subscription = stream_hub.subscribe(camera_id)
+    
     def generate():
-        while True:
-            # In production, get frame from actual camera
-            # For now, we'll wait for frames from the bridge
-            if camera_id in camera_streams:
-                frame = camera_streams[camera_id]
-                
-                # Preprocess frame
-                frame_processed = preprocess_image(frame)
-                
-                # Run inference with optimized parameters
-                results = model(
-                    frame_processed,
-                    conf=0.3,
-                    iou=0.4,
-                    agnostic_nms=True,
-                    augment=True,
-                    verbose=False
-                )
-                
-                # Process and send results
-                detections = []
-                vehicle_counts = {
-                    'car': 0, 'truck': 0, 'bus': 0, 
-                    'motorcycle': 0, 'bicycle': 0
-                }
-                
-                for result in results:
-                    boxes = result.boxes
-                    for box in boxes:
-                        cls_id = int(box.cls[0])
-                        if cls_id in VEHICLE_CLASSES:
-                            vehicle_type = VEHICLE_CLASSES[cls_id]
-                            vehicle_counts[vehicle_type] += 1
-                            
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            confidence = float(box.conf[0])
-                            
-                            detections.append({
-                                'class': vehicle_type,
-                                'confidence': confidence,
-                                'bbox': {
-                                    'x1': x1, 'y1': y1,
-                                    'x2': x2, 'y2': y2
-                                }
-                            })
-                
-                data = {
-                    'timestamp': datetime.now().isoformat(),
-                    'camera_id': camera_id,
-                    'total_vehicles': sum(vehicle_counts.values()),
-                    'vehicle_counts': vehicle_counts,
-                    'detections': detections
-                }
-                
-                yield f"data: {jsonify(data).get_data(as_text=True)}\n\n"
-            
-            time.sleep(0.1)  # 10 FPS
+        try:
+            while True:
+                event = subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                if event is None:
+                    # Keep the connection alive (and detect disconnected clients)
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event.render(response_format)
+        finally:
+            stream_hub.unsubscribe(subscription)
     
     return Response(generate(), mimetype='text/event-stream')
 
+@app.route('/frames/<camera_id>', methods=['POST'])
+def ingest_frame(camera_id):
+    """
+    Push a camera frame into the camera's ring buffer
+    Expects: raw request body, either
+      - image/jpeg (or any format cv2.imdecode understands), or
+      - application/octet-stream raw BGR pixels with X-Frame-Width / X-Frame-Height headers
+    Optional metadata (headers or query args): X-Frame-Seq / seq, X-Frame-Timestamp / timestamp (epoch seconds)
+    Returns: Whether the frame was accepted and the buffer statistics
+    """
+    return jsonify(ingest_camera_frame(
+        camera_id,
+        request.get_data(cache=False),
+        request.mimetype,
+        seq=request.headers.get('X-Frame-Seq', request.args.get('seq')),
+        timestamp=request.headers.get('X-Frame-Timestamp', request.args.get('timestamp')),
+        width=request.headers.get('X-Frame-Width', request.args.get('width')),
+        height=request.headers.get('X-Frame-Height', request.args.get('height'))
+    ))
+
+@app.route('/cameras/<camera_id>/preprocessing', methods=['GET', 'PUT'])
+def camera_preprocessing(camera_id):
+    """
+    Get or set the preprocessing profile used for a camera
+    PUT expects: JSON {"profile": "none" | "fast" | "quality"} (null resets to the server default)
+    """
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        set_camera_preprocessing(camera_id, data.get('profile'))
+    return jsonify(camera_preprocessing_info(camera_id))
+
+@app.route('/cameras/<camera_id>/roi', methods=['GET', 'PUT'])
+def camera_roi(camera_id):
+    """
+    Get or set the region of interest for a camera
+    PUT expects: JSON {"polygon": [[x, y], ...]} in normalized 0-1 coordinates (null removes the ROI)
+    """
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        set_camera_roi(camera_id, data.get('polygon'))
+    return jsonify(camera_roi_info(camera_id))
+
+@app.route('/cameras/<camera_id>/tracking', methods=['GET', 'PUT'])
+def camera_tracking(camera_id):
+    """
+    Get or set tracking for a camera's stream, with its track statistics
+    PUT expects: JSON with any of detect_every, meters_per_pixel, high_threshold, match_iou,
+                 low_match_iou, track_buffer_seconds
+    """
+    if request.method == 'PUT':
+        set_camera_tracking(camera_id, request.get_json(silent=True) or {})
+    return jsonify(camera_tracking_info(camera_id))
+
+@app.route('/cameras/<camera_id>/motion', methods=['GET', 'PUT'])
+def camera_motion(camera_id):
+    """
+    Get or set the motion gate for a camera's stream, with its skip ratio
+    PUT expects: JSON with any of enabled, motion_threshold, pixel_threshold, max_staleness_seconds
+    """
+    if request.method == 'PUT':
+        set_camera_motion(camera_id, request.get_json(silent=True) or {})
+    return jsonify(camera_motion_info(camera_id))
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Model versions: active, standby (rollback target), deploying and recently retired"""
+    return jsonify(models_info())
+
+@app.route('/models/deploy', methods=['POST'])
+def deploy():
+    """
+    Hot-swap to new model weights without a restart
+    POST expects: JSON {"weights": "path/to/model.pt", "backend": "torch" | "onnx" | "openvino" (optional)}
+    Returns 202; the swap happens once the new version is loaded, warmed up and validated
+    """
+    version = deploy_model(request.get_json(silent=True) or {}, request.headers.get('X-Admin-Token'))
+    return jsonify(version), 202
+
+@app.route('/models/rollback', methods=['POST'])
+def rollback():
+    """Swap the previous model version back in immediately"""
+    return jsonify(rollback_model(request.headers.get('X-Admin-Token')))
+
 @app.route('/analytics/<intersection_id>', methods=['GET'])
 def get_analytics(intersection_id):
     """
     Get traffic analytics for an intersection
     Returns: Aggregated statistics
     """
-    # In production, query database for historical data
-    # For now, return current detection data
-    
-    return jsonify({
-        'intersection_id': intersection_id,
-        'timestamp': datetime.now().isoformat(),
-        'current_data': detection_data,
-        'analytics': {
-            'vehicles_per_hour': detection_data['total_vehicles'] * 60,  # Approximate
-            'congestion_level': calculate_congestion_level(detection_data['total_vehicles']),
-            'average_speed': 25,  # Placeholder - requires tracking
-            'peak_hours': ['7:00-9:00', '16:00-18:00']
-        }
-    })
+    return jsonify(analytics_report(intersection_id))
 
-def calculate_congestion_level(vehicle_count):
-    """Calculate congestion level based on vehicle count"""
-    if vehicle_count < 10:
-        return 'Low'
-    elif vehicle_count < 30:
-        return 'Medium'
-    else:
-        return 'High'
+@app.route('/history/<intersection_id>', methods=['GET'])
+def get_history(intersection_id):
+    """
+    Detection history for a time range
+    Query: start, end (ISO datetime or epoch seconds; default last 24 h),
+           resolution (auto | minute | hour | raw)
+    """
+    return jsonify(history_report(intersection_id, request.args.get('start'), request.args.get('end'),
+                                  request.args.get('resolution', 'auto')))
+
+@app.route('/history/<intersection_id>/peak-hours', methods=['GET'])
+def get_peak_hours(intersection_id):
+    """Busiest hours of the day over the last ?days= days (default 7)"""
+    return jsonify(peak_hours_report(intersection_id, request.args.get('days', 7), request.args.get('top', 3)))
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='YOLOv11 AI detection server')
+    parser.add_argument('--asgi', action='store_true',
+                       help='Run the async (FastAPI/uvicorn) server instead of the Flask dev server')
+    parser.add_argument('--host', type=str, default='0.0.0.0',
+                       help='Bind address')
+    parser.add_argument('--port', type=int, default=5000,
+                       help='Port')
+    args = parser.parse_args()
+    
     print("🤖 YOLOv11 AI Server Starting...")
-    print("📊 Model: YOLOv11n")
-    print("🌐 Server: http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
-
+    print(f"📊 Model: {MODEL_NAME} ({INFERENCE_BACKEND} backend, loading in the background)")
+    if INFERENCE_WORKERS > 0:
+        print(f"🧵 Worker pool: {INFERENCE_WORKERS} processes")
+    print(f"🌐 Server: http://localhost:{args.port} ({'ASGI' if args.asgi else 'Flask'})")
+    if args.asgi:
+        import sys
+        import uvicorn
+        # Let asgi_app reuse this module (model, batcher, stream workers) instead of importing it again
+        sys.modules['app'] = sys.modules[__name__]
+        from asgi_app import app as asgi_application
+        uvicorn.run(asgi_application, host=args.host, port=args.port)
+    else:
+        # No reloader: it re-runs this module in a child process while the parent keeps its own copy,
+        # which would load a second model/worker pool and run two history writers on the same directory
+        app.run(host=args.host, port=args.port, debug=True, threaded=True, use_reloader=False)
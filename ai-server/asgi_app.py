@@ -0,0 +1,249 @@
+"""
+Async (ASGI) Server Mode
+Same routes as the Flask server in app.py with async I/O and SSE streams;
+CPU work (decode, preprocessing, inference) runs on a bounded executor
+
+Run: python app.py --asgi
+ or: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import app as server
+from stream_hub import AsyncSubscription
+
+# Threads for CPU work (decode + preprocessing; inference itself is serialized by the batcher)
+ASGI_CPU_WORKERS = int(os.environ.get('AI_ASGI_CPU_WORKERS', os.cpu_count() or 4))
+# Max CPU jobs admitted at once; further requests wait on the event loop without holding a thread
+ASGI_MAX_PENDING = int(os.environ.get('AI_ASGI_MAX_PENDING', 64))
+
+
+def create_asgi_app():
+    """Build the FastAPI application sharing the pipeline, model and stream workers of app.py"""
+    api = FastAPI(title='YOLOv11 AI Detection Server', version='1.0.0')
+    api.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+    executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix='asgi-cpu')
+    admission = asyncio.Semaphore(ASGI_MAX_PENDING)
+
+    async def run_cpu(fn, *args, **kwargs):
+        async with admission:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    @api.exception_handler(server.RequestError)
+    async def handle_request_error(request, exc):
+        return JSONResponse(exc.body, status_code=exc.status)
+
+    @api.on_event('shutdown')
+    def shutdown_executor():
+        executor.shutdown(wait=False)
+
+    @api.get('/')
+    async def home():
+        """Root endpoint with API information"""
+        return server.api_info()
+
+    @api.get('/health')
+    async def health_check():
+        """Health check endpoint"""
+        body, status = server.health_info()
+        return JSONResponse(body, status_code=status)
+
+    @api.get('/health/live')
+    async def liveness_check():
+        """Liveness probe: 200 as long as the process serves requests"""
+        return server.liveness_info()
+
+    @api.get('/health/ready')
+    async def readiness_check():
+        """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+        body, status = server.readiness_info()
+        return JSONResponse(body, status_code=status)
+
+    @api.get('/metrics')
+    async def prometheus_metrics():
+        """Prometheus metrics: per-stage latency histograms, queue depth, in-flight requests, camera FPS"""
+        return Response(server.metrics_text(), media_type=server.PROMETHEUS_CONTENT_TYPE)
+
+    @api.get('/stats/{section}')
+    async def stats(section: str):
+        """Server statistics: batching, streams, frames, preprocessing, workers, motion, tracking, history, quality, cache, startup"""
+        return server.server_stats(section)
+
+    @api.post('/detect')
+    async def detect_vehicles(request: Request):
+        """
+        Detect vehicles in a single image
+        Expects: multipart/form-data with 'image' file (same contract as the Flask server)
+        """
+        with server.track_request('detect'):
+            return await _detect_vehicles(request)
+
+    async def _detect_vehicles(request):
+        print("📸 Received detection request")
+        response_format = server.select_format(request.query_params.get('format'), request.headers.get('accept'))
+
+        with server.STAGE_SECONDS.time('upload_read'):
+            form = await request.form()
+            upload = form.get('image')
+            if upload is None or isinstance(upload, str):
+                print("❌ No 'image' field in request form")
+                return JSONResponse({'error': 'No image provided'}, status_code=400)
+            img_bytes = await upload.read()
+        print(f"   Filename: {upload.filename}")
+
+        try:
+            body, mimetype, headers = await run_cpu(
+                server.run_detection,
+                img_bytes,
+                profile=form.get('profile') or request.query_params.get('profile'),
+                camera_id=form.get('camera_id') or request.query_params.get('camera_id'),
+                response_format=response_format,
+                intersection_id=form.get('intersection_id') or request.query_params.get('intersection_id'),
+                use_cache=not server.bypasses_cache(request.headers.get('cache-control'))
+            )
+        except server.RequestError:
+            raise
+        except Exception as e:
+            print(f"❌ Detection error: {str(e)}")
+            return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+        return Response(body, media_type=mimetype, headers=headers)
+
+    @api.get('/detect/stream/{camera_id}')
+    async def detect_stream(camera_id: str, format: str = None):
+        """
+        Real-time detection on video stream (Server-Sent Events)
+        Each client is a suspended coroutine; the camera's shared worker does the inference
+        """
+        response_format = server.select_format(format)
+        subscription = AsyncSubscription(camera_id, asyncio.get_running_loop())
+        server.stream_hub.subscribe(camera_id, subscription)
+
+        async def generate():
+            try:
+                while True:
+                    event = await subscription.get(timeout=server.STREAM_KEEPALIVE_SECONDS)
+                    if event is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    yield event.render(response_format)
+            finally:
+                server.stream_hub.unsubscribe(subscription)
+
+        return StreamingResponse(generate(), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache'})
+
+    @api.post('/frames/{camera_id}')
+    async def ingest_frame(camera_id: str, request: Request):
+        """Push a camera frame into the camera's ring buffer (same contract as the Flask server)"""
+        body = await request.body()
+        headers, args = request.headers, request.query_params
+        return await run_cpu(
+            server.ingest_camera_frame,
+            camera_id,
+            body,
+            headers.get('content-type', '').split(';')[0].strip(),
+            seq=headers.get('x-frame-seq', args.get('seq')),
+            timestamp=headers.get('x-frame-timestamp', args.get('timestamp')),
+            width=headers.get('x-frame-width', args.get('width')),
+            height=headers.get('x-frame-height', args.get('height'))
+        )
+
+    @api.get('/cameras/{camera_id}/preprocessing')
+    async def get_camera_preprocessing(camera_id: str):
+        return server.camera_preprocessing_info(camera_id)
+
+    @api.put('/cameras/{camera_id}/preprocessing')
+    async def put_camera_preprocessing(camera_id: str, request: Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        server.set_camera_preprocessing(camera_id, (data or {}).get('profile'))
+        return server.camera_preprocessing_info(camera_id)
+
+    @api.get('/cameras/{camera_id}/roi')
+    async def get_camera_roi(camera_id: str):
+        return server.camera_roi_info(camera_id)
+
+    @api.put('/cameras/{camera_id}/roi')
+    async def put_camera_roi(camera_id: str, request: Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        server.set_camera_roi(camera_id, (data or {}).get('polygon'))
+        return server.camera_roi_info(camera_id)
+
+    @api.get('/cameras/{camera_id}/tracking')
+    async def get_camera_tracking(camera_id: str):
+        return server.camera_tracking_info(camera_id)
+
+    @api.put('/cameras/{camera_id}/tracking')
+    async def put_camera_tracking(camera_id: str, request: Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        server.set_camera_tracking(camera_id, data or {})
+        return server.camera_tracking_info(camera_id)
+
+    @api.get('/cameras/{camera_id}/motion')
+    async def get_camera_motion(camera_id: str):
+        return server.camera_motion_info(camera_id)
+
+    @api.put('/cameras/{camera_id}/motion')
+    async def put_camera_motion(camera_id: str, request: Request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        server.set_camera_motion(camera_id, data or {})
+        return server.camera_motion_info(camera_id)
+
+    @api.get('/models')
+    async def list_models():
+        """Model versions: active, standby (rollback target), deploying and recently retired"""
+        return server.models_info()
+
+    @api.post('/models/deploy')
+    async def deploy(request: Request):
+        """Hot-swap to new model weights; 202, the swap happens once the version is validated"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        version = server.deploy_model(data or {}, request.headers.get('x-admin-token'))
+        return JSONResponse(version, status_code=202)
+
+    @api.post('/models/rollback')
+    async def rollback(request: Request):
+        """Swap the previous model version back in immediately"""
+        return server.rollback_model(request.headers.get('x-admin-token'))
+
+    @api.get('/analytics/{intersection_id}')
+    async def get_analytics(intersection_id: str):
+        """Get traffic analytics for an intersection (peak hours may read history files)"""
+        return await run_cpu(server.analytics_report, intersection_id)
+
+    @api.get('/history/{intersection_id}')
+    async def get_history(intersection_id: str, start: str = None, end: str = None, resolution: str = 'auto'):
+        """Detection history for a time range (reads Parquet partitions on the executor)"""
+        return await run_cpu(server.history_report, intersection_id, start, end, resolution)
+
+    @api.get('/history/{intersection_id}/peak-hours')
+    async def get_peak_hours(intersection_id: str, days: str = '7', top: str = '3'):
+        """Busiest hours of the day over the last ?days= days"""
+        return await run_cpu(server.peak_hours_report, intersection_id, days, top)
+
+    return api
+
+
+app = create_asgi_app()
@@ -0,0 +1,290 @@
+"""
+Pluggable Inference Backends for YOLOv11
+PyTorch (Ultralytics), ONNX Runtime and OpenVINO behind one predict() interface
+"""
+
+import ast
+from collections import namedtuple
+from pathlib import Path
+import cv2
+import numpy as np
+
+# Per-image detections in original image coordinates
+#   boxes: float32 (N, 4) xyxy, scores: float32 (N,), class_ids: int64 (N,)
+Detections = namedtuple('Detections', ['boxes', 'scores', 'class_ids'])
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def empty_detections():
+    return Detections(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+
+def letterbox(img, size):
+    """
+    Resize keeping aspect ratio and pad to size x size (same as Ultralytics LetterBox)
+
+    Returns: (padded image, scale ratio, (left pad, top pad))
+    """
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = round(w * r), round(h * r)
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_w = (size - new_w) / 2
+    pad_h = (size - new_h) / 2
+    top, bottom = round(pad_h - 0.1), round(pad_h + 0.1)
+    left, right = round(pad_w - 0.1), round(pad_w + 0.1)
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, r, (left, top)
+
+
+def to_blob(images):
+    """Letterboxed BGR images -> RGB float32 NCHW in [0, 1]"""
+    return cv2.dnn.blobFromImages(images, 1 / 255.0, swapRB=True)
+
+
+class TorchBackend:
+    """Ultralytics YOLO running through PyTorch eager mode"""
+
+    name = 'torch'
+    supports_augment = True
+
+    def __init__(self, weights, imgsz=640, threads=None):
+        import torch
+        from ultralytics import YOLO
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.weights = str(weights)
+        self.imgsz = imgsz
+        self.threads = threads or torch.get_num_threads()
+        self.model = YOLO(self.weights)
+        self.names = dict(self.model.names)
+
+    def predict(self, images, conf=0.25, iou=0.7, max_det=300, agnostic_nms=False, augment=False, half=False,
+                imgsz=None):
+        results = self.model(
+            images,
+            imgsz=imgsz or self.imgsz,
+            conf=conf,
+            iou=iou,
+            max_det=max_det,
+            agnostic_nms=agnostic_nms,
+            augment=augment,
+            half=half,
+            verbose=False
+        )
+        return [
+            Detections(
+                r.boxes.xyxy.cpu().numpy().astype(np.float32),
+                r.boxes.conf.cpu().numpy().astype(np.float32),
+                r.boxes.cls.cpu().numpy().astype(np.int64)
+            )
+            for r in results
+        ]
+
+
+class _ExportedBackend:
+    """
+    Shared pre/post-processing for exported YOLO graphs
+
+    Input: letterboxed RGB float32 NCHW in [0, 1]
+    Output: (batch, 4 + num_classes, anchors) with xywh boxes and class scores
+    Test-time augmentation is not available for exported graphs, so augment is ignored.
+    A smaller imgsz per call needs a model exported with dynamic=True.
+    """
+
+    supports_augment = False
+
+    def __init__(self, imgsz):
+        self.imgsz = imgsz
+        self.static_batch = None  # Set when the graph only accepts a fixed batch size
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+    def predict(self, images, conf=0.25, iou=0.7, max_det=300, agnostic_nms=False, augment=False, half=False,
+                imgsz=None):
+        letterboxed = [letterbox(img, imgsz or self.imgsz) for img in images]
+        blob = to_blob([lb[0] for lb in letterboxed])
+
+        if self.static_batch == 1 and len(images) > 1:
+            preds = np.concatenate([self._run(blob[i:i + 1]) for i in range(len(images))])
+        else:
+            preds = self._run(blob)
+
+        return [
+            self._postprocess(pred, img.shape, r, pad, conf, iou, max_det, agnostic_nms)
+            for pred, img, (_, r, pad) in zip(preds, images, letterboxed)
+        ]
+
+    def _postprocess(self, pred, shape, r, pad, conf, iou, max_det, agnostic_nms):
+        pred = pred.T  # (anchors, 4 + num_classes)
+        class_scores = pred[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+
+        keep = scores > conf
+        if not keep.any():
+            return empty_detections()
+        xywh, scores, class_ids = pred[keep, :4], scores[keep], class_ids[keep]
+
+        # Class-aware NMS by offsetting boxes of different classes apart
+        offsets = 0 if agnostic_nms else class_ids[:, None] * 7680.0
+        nms_boxes = np.column_stack([xywh[:, 0] - xywh[:, 2] / 2, xywh[:, 1] - xywh[:, 3] / 2,
+                                     xywh[:, 2], xywh[:, 3]])
+        nms_boxes[:, :2] += offsets
+        idx = cv2.dnn.NMSBoxes(nms_boxes.tolist(), scores.tolist(), conf, iou, top_k=max_det)
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)[:max_det]
+
+        xywh, scores, class_ids = xywh[idx], scores[idx], class_ids[idx]
+        boxes = np.column_stack([xywh[:, 0] - xywh[:, 2] / 2, xywh[:, 1] - xywh[:, 3] / 2,
+                                 xywh[:, 0] + xywh[:, 2] / 2, xywh[:, 1] + xywh[:, 3] / 2])
+
+        # Undo letterbox: remove padding, rescale, clip to the original image
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / r).clip(0, shape[1])
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / r).clip(0, shape[0])
+
+        return Detections(boxes.astype(np.float32), scores.astype(np.float32), class_ids.astype(np.int64))
+
+
+class OnnxBackend(_ExportedBackend):
+    """Exported ONNX model running on ONNX Runtime (CPU)"""
+
+    name = 'onnx'
+
+    def __init__(self, weights, imgsz=640, threads=None):
+        import onnxruntime as ort
+
+        super().__init__(imgsz)
+        self.weights = str(weights)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.threads = threads
+        self.session = ort.InferenceSession(self.weights, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.static_batch = batch_dim if isinstance(batch_dim, int) else None
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOBackend(_ExportedBackend):
+    """Exported OpenVINO IR model (directory from YOLO.export(format='openvino') or .xml file)"""
+
+    name = 'openvino'
+
+    def __init__(self, weights, imgsz=640, threads=None):
+        import openvino as ov
+        import yaml
+
+        super().__init__(imgsz)
+        path = Path(weights)
+        xml = path if path.suffix == '.xml' else next(path.glob('*.xml'))
+        self.weights = str(xml)
+
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            config['INFERENCE_NUM_THREADS'] = threads
+        self.threads = threads
+
+        core = ov.Core()
+        ov_model = core.read_model(xml)
+        batch_dim = ov_model.input(0).get_partial_shape()[0]
+        self.static_batch = batch_dim.get_length() if batch_dim.is_static else None
+        self.compiled = core.compile_model(ov_model, 'CPU', config)
+        self.output = self.compiled.output(0)
+
+        metadata = xml.parent / 'metadata.yaml'
+        self.names = {}
+        if metadata.exists():
+            with open(metadata) as f:
+                self.names = (yaml.safe_load(f) or {}).get('names', {})
+
+    def _run(self, blob):
+        return self.compiled([blob])[self.output]
+
+
+def load_backend(backend, weights, imgsz=640, threads=None):
+    """
+    Load an inference backend
+
+    Args:
+        backend: 'torch', 'onnx' or 'openvino'
+        weights: .pt file (torch), .onnx file (onnx) or OpenVINO export directory / .xml (openvino)
+        imgsz: Model input size
+        threads: CPU threads for inference (None = library default)
+    """
+    if backend == 'torch':
+        return TorchBackend(weights, imgsz=imgsz, threads=threads)
+    if backend == 'onnx':
+        return OnnxBackend(weights, imgsz=imgsz, threads=threads)
+    if backend == 'openvino':
+        return OpenVINOBackend(weights, imgsz=imgsz, threads=threads)
+    raise ValueError(f"Unknown backend '{backend}' (available: {', '.join(BACKENDS)})")
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare_backends(reference, candidate, images, min_iou=0.9, conf_tolerance=0.05, **params):
+    """
+    Check that a candidate backend reproduces the reference backend's detections
+
+    Each reference box must be matched by a candidate box of the same class with
+    IoU >= min_iou and confidence within conf_tolerance.
+
+    Returns: dict with match rate, worst confidence difference, mean matched IoU and 'passed'
+    """
+    total = matched = extra = 0
+    conf_diffs = []
+    ious = []
+
+    for img in images:
+        ref = reference.predict([img], **params)[0]
+        cand = candidate.predict([img], **params)[0]
+        total += len(ref.scores)
+        extra += max(0, len(cand.scores) - len(ref.scores))
+        if len(ref.scores) == 0 or len(cand.scores) == 0:
+            continue
+
+        iou = box_iou(ref.boxes, cand.boxes)
+        iou[ref.class_ids[:, None] != cand.class_ids[None, :]] = 0
+        for i in range(len(ref.scores)):
+            j = int(iou[i].argmax())
+            if iou[i, j] >= min_iou:
+                diff = abs(float(ref.scores[i]) - float(cand.scores[j]))
+                conf_diffs.append(diff)
+                ious.append(float(iou[i, j]))
+                if diff <= conf_tolerance:
+                    matched += 1
+                iou[:, j] = 0  # Each candidate box matches at most once
+
+    match_rate = matched / total if total else 1.0
+    return {
+        'images': len(images),
+        'reference_detections': total,
+        'matched_detections': matched,
+        'extra_candidate_detections': extra,
+        'match_rate': round(match_rate, 4),
+        'max_confidence_diff': round(max(conf_diffs), 4) if conf_diffs else 0.0,
+        'mean_matched_iou': round(float(np.mean(ious)), 4) if ious else None,
+        'passed': match_rate >= 0.95
+    }
+
@@ -0,0 +1,153 @@
+"""
+Dynamic Micro-Batching for YOLO Inference
+Collects frames from concurrent requests for a short window and runs them
+through the model in a single batched forward pass
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+
+class InferenceBatcher:
+    """
+    Queue in front of the model that groups concurrent requests into batches
+
+    All inference goes through background dispatcher threads (one by default), so
+    request threads never contend on the shared model object. A batch is dispatched as soon as it is
+    full (max_batch_size) or the oldest queued frame has waited max_wait_ms.
+    Only frames with identical inference parameters are batched together.
+    """
+
+    def __init__(self, infer_fn, max_batch_size=8, max_wait_ms=10.0, concurrency=1):
+        """
+        Args:
+            infer_fn: Callable taking (images, **params) and returning one result per image
+            max_batch_size: Maximum number of frames per forward pass
+            max_wait_ms: Maximum time the oldest frame waits for the batch to fill
+            concurrency: Number of batches in flight at once (>1 only if infer_fn is
+                         safe to call concurrently, e.g. a multi-process WorkerPool)
+        """
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.concurrency = max(1, int(concurrency))
+
+        self._pending = []
+        self._cond = threading.Condition()
+
+        # Statistics
+        self._batches_run = 0
+        self._images_processed = 0
+        self._batch_size_histogram = {}
+        self._last_batch_size = 0
+        self._total_wait_ms = 0.0
+        self._total_infer_ms = 0.0
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f'inference-batcher-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, image, **params):
+        """
+        Queue a single frame for inference
+
+        Returns: Future resolving to (result, batch_info)
+        """
+        future = Future()
+        key = tuple(sorted(params.items()))
+        with self._cond:
+            self._pending.append((key, image, params, time.perf_counter(), future))
+            self._cond.notify()
+        return future
+
+    def infer(self, image, timeout=None, **params):
+        """
+        Run inference on a single frame, blocking until its batch completes
+
+        Returns: (result, batch_info) where batch_info describes the batch it ran in
+        """
+        return self.submit(image, **params).result(timeout=timeout)
+
+    def _collect_batch(self):
+        """Wait for a batch to fill up or for the oldest frame's deadline to pass"""
+        with self._cond:
+            while True:
+                while not self._pending:
+                    self._cond.wait()
+
+                key = self._pending[0][0]
+                deadline = self._pending[0][3] + self.max_wait_ms / 1000.0
+
+                while True:
+                    matching = sum(1 for item in self._pending if item[0] == key)
+                    remaining = deadline - time.perf_counter()
+                    if matching >= self.max_batch_size or remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+
+                batch = []
+                rest = []
+                for item in self._pending:
+                    if item[0] == key and len(batch) < self.max_batch_size:
+                        batch.append(item)
+                    else:
+                        rest.append(item)
+                self._pending = rest
+                # Another dispatcher may have taken these frames while we waited
+                if batch:
+                    return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            images = [item[1] for item in batch]
+            params = batch[0][2]
+
+            start = time.perf_counter()
+            try:
+                results = self.infer_fn(images, **params)
+            except Exception as e:
+                for item in batch:
+                    item[4].set_exception(e)
+                continue
+            infer_ms = (time.perf_counter() - start) * 1000
+
+            batch_size = len(batch)
+            with self._cond:
+                self._batches_run += 1
+                self._images_processed += batch_size
+                self._batch_size_histogram[batch_size] = self._batch_size_histogram.get(batch_size, 0) + 1
+                self._last_batch_size = batch_size
+                self._total_infer_ms += infer_ms
+                for item in batch:
+                    self._total_wait_ms += (start - item[3]) * 1000
+
+            for item, result in zip(batch, results):
+                item[4].set_result((result, {
+                    'batch_size': batch_size,
+                    'queue_wait_ms': round((start - item[3]) * 1000, 2),
+                    'inference_ms': round(infer_ms, 2)
+                }))
+
+    def get_stats(self):
+        """Achieved batch sizes and queue statistics"""
+        with self._cond:
+            batches = self._batches_run
+            images = self._images_processed
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'concurrency': self.concurrency,
+                'queue_depth': len(self._pending),
+                'batches_run': batches,
+                'images_processed': images,
+                'average_batch_size': round(images / batches, 2) if batches else 0,
+                'last_batch_size': self._last_batch_size,
+                'batch_size_histogram': dict(sorted(self._batch_size_histogram.items())),
+                'average_queue_wait_ms': round(self._total_wait_ms / images, 2) if images else 0,
+                'average_batch_inference_ms': round(self._total_infer_ms / batches, 2) if batches else 0
+            }
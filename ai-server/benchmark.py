@@ -0,0 +1,483 @@
+"""
+Detection Pipeline Benchmark
+Measures decode, preprocessing, inference (with and without test-time augmentation),
+post-processing, the whole in-process pipeline and the HTTP /detect path on a fixed
+corpus of frames, writes throughput and latency percentiles to JSON and compares
+them against a stored baseline
+
+Run: python benchmark.py                                  (all in-process stages)
+     python benchmark.py --url http://localhost:5000     (also benchmark /detect)
+     python benchmark.py --save-baseline                  (accept the results as the new baseline)
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import cv2
+import numpy as np
+from backends import Detections, load_backend
+from preprocessing import Preprocessor, PROFILES as PREPROCESS_PROFILES
+from postprocess import DetectionPostprocessor
+from serializers import DetectionSerializer
+
+# Corpus: every resolution is generated at every object density
+RESOLUTIONS = {'480p': (640, 480), '720p': (1280, 720), '1080p': (1920, 1080)}
+DENSITIES = {'sparse': 2, 'medium': 10, 'dense': 30}
+CORPUS_SEED = 1234
+
+STAGES = ('decode', 'preprocess', 'inference', 'postprocess', 'pipeline', 'http')
+
+# COCO vehicle classes and detection parameters used by /detect (see app.py)
+VEHICLE_CLASSES = {2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck', 1: 'bicycle'}
+DETECT_PARAMS = dict(conf=0.3, iou=0.4, max_det=20, agnostic_nms=True, half=False)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def synthetic_frame(rng, width, height, objects):
+    """
+    Road-like frame with `objects` vehicle-sized boxes
+
+    Returns: (BGR image, ground-truth boxes (N, 4) xyxy, COCO class ids (N,))
+    """
+    asphalt = rng.integers(70, 110, size=3).astype(np.float32)
+    texture = cv2.resize(rng.normal(0, 8, size=(height // 4, width // 4)).astype(np.float32), (width, height))
+    img = np.ascontiguousarray(np.clip(asphalt + texture[:, :, None], 0, 255).astype(np.uint8))
+    cv2.line(img, (0, height // 2), (width, height // 2), (230, 230, 230), max(2, height // 120))
+
+    class_ids = rng.choice(list(VEHICLE_CLASSES), size=objects)
+    boxes = []
+    for _ in range(objects):
+        w = int(rng.uniform(0.05, 0.15) * width)
+        h = int(w * rng.uniform(0.5, 1.0))
+        x0 = int(rng.integers(0, width - w))
+        y0 = int(rng.integers(0, height - h))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.rectangle(img, (x0, y0), (x0 + w, y0 + h), color, -1)
+        cv2.rectangle(img, (x0 + w // 5, y0 + h // 5), (x0 + 4 * w // 5, y0 + h // 2), (40, 40, 40), -1)
+        boxes.append((x0, y0, x0 + w, y0 + h))
+    return img, np.array(boxes, np.float32).reshape(-1, 4), class_ids.astype(np.int64)
+
+
+def build_corpus(frames_per_case, image_dir=None):
+    """
+    Fixed benchmark corpus: case name -> list of {'image', 'jpeg', 'boxes', 'class_ids'}
+
+    Synthetic frames are seeded, so every run (and the baseline) sees identical pixels.
+    With image_dir, real images are used instead, grouped by resolution.
+    """
+    corpus = {}
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        for path in paths:
+            img = cv2.imread(str(path))
+            if img is None:
+                continue
+            case = f"images/{img.shape[1]}x{img.shape[0]}"
+            corpus.setdefault(case, []).append({'image': img, 'boxes': None, 'class_ids': None})
+        for case in corpus:
+            corpus[case] = corpus[case][:frames_per_case]
+    else:
+        rng = np.random.default_rng(CORPUS_SEED)
+        for res_name, (width, height) in RESOLUTIONS.items():
+            for density_name, objects in DENSITIES.items():
+                frames = []
+                for _ in range(frames_per_case):
+                    img, boxes, class_ids = synthetic_frame(rng, width, height, objects)
+                    frames.append({'image': img, 'boxes': boxes, 'class_ids': class_ids})
+                corpus[f"{res_name}/{density_name}"] = frames
+
+    for frames in corpus.values():
+        for frame in frames:
+            frame['jpeg'] = cv2.imencode('.jpg', frame['image'], [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+    return corpus
+
+
+def summarize(latencies_ms, wall_seconds=None):
+    """Latency percentiles; throughput is per wall-clock second when given, else 1 / mean latency"""
+    latencies = np.asarray(latencies_ms, np.float64)
+    mean = float(latencies.mean())
+    throughput = len(latencies) / wall_seconds if wall_seconds else (1000.0 / mean if mean else 0.0)
+    return {
+        'samples': len(latencies),
+        'mean_ms': round(mean, 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'throughput_per_s': round(throughput, 2)
+    }
+
+
+def time_calls(fn, items, repeat, warmup):
+    """Call fn(item) `repeat` times per item after `warmup` untimed calls; latencies in ms"""
+    for item in items[:warmup]:
+        fn(item)
+    latencies = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def ground_truth_detections(frame):
+    """Detections shaped like model output (drawn boxes, random confidences) for post-processing"""
+    rng = np.random.default_rng(len(frame['boxes']))
+    return Detections(frame['boxes'], rng.uniform(0.3, 0.95, len(frame['boxes'])).astype(np.float32),
+                      frame['class_ids'])
+
+
+def benchmark_http(url, corpus, concurrency, repeat, profile=None, timeout=60):
+    """
+    POST every corpus frame to /detect from `concurrency` client threads
+
+    Requests send `Cache-Control: no-cache` so repeated frames are not answered from the
+    server's result cache; responses that still report `X-Cache: HIT` are counted separately
+    and left out of the latencies.
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    endpoint = url.rstrip('/') + '/detect'
+    data = {'profile': profile} if profile else None
+    headers = {'Cache-Control': 'no-cache'}
+
+    def post(jpeg):
+        start = time.perf_counter()
+        response = session.post(endpoint, files={'image': ('frame.jpg', jpeg, 'image/jpeg')},
+                                data=data, headers=headers, timeout=timeout)
+        return (time.perf_counter() - start) * 1000, response.status_code, response.headers.get('X-Cache')
+
+    results = {}
+    for case, frames in corpus.items():
+        jobs = [frame['jpeg'] for frame in frames] * repeat
+        post(jobs[0])  # Warm-up (connection, server-side buffers)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(post, jobs))
+        wall = time.perf_counter() - start
+        latencies = [ms for ms, status, cache in outcomes if status == 200 and cache != 'HIT']
+        cache_hits = sum(1 for _, status, cache in outcomes if status == 200 and cache == 'HIT')
+        errors = sum(1 for _, status, _ in outcomes if status != 200)
+        if latencies:
+            results[case] = dict(summarize(latencies, wall), errors=errors, cache_hits=cache_hits)
+        else:
+            results[case] = {'samples': 0, 'errors': errors, 'cache_hits': cache_hits}
+        print(f"   {case:20s} c={concurrency:<3d} {_format_result(results[case])}")
+    return results
+
+
+def _format_result(result):
+    if not result.get('samples'):
+        return f"no successful samples ({result.get('errors', 0)} errors)"
+    line = (f"p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms   "
+            f"p99 {result['p99_ms']:9.2f} ms   {result['throughput_per_s']:9.1f}/s")
+    if result.get('errors'):
+        line += f"   ({result['errors']} errors)"
+    if result.get('cache_hits'):
+        line += f"   ({result['cache_hits']} cache hits excluded)"
+    return line
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Regressions versus a baseline report
+
+    A benchmark regresses when its p50 or p95 latency grows, or its throughput drops,
+    by more than `tolerance` (fraction). Benchmarks missing on either side are ignored.
+
+    Returns: list of {'benchmark', 'metric', 'baseline', 'current', 'change'}
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not current.get('samples') or not previous.get('samples'):
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append({'benchmark': name, 'metric': metric, 'baseline': previous[metric],
+                                    'current': current[metric],
+                                    'change': round(current[metric] / previous[metric] - 1, 3)})
+        if previous['throughput_per_s'] and \
+                current['throughput_per_s'] < previous['throughput_per_s'] * (1 - tolerance):
+            regressions.append({'benchmark': name, 'metric': 'throughput_per_s',
+                                'baseline': previous['throughput_per_s'], 'current': current['throughput_per_s'],
+                                'change': round(current['throughput_per_s'] / previous['throughput_per_s'] - 1, 3)})
+        if current.get('errors', 0) > previous.get('errors', 0):
+            regressions.append({'benchmark': name, 'metric': 'errors', 'baseline': previous.get('errors', 0),
+                                'current': current['errors'], 'change': None})
+    return regressions
+
+
+def run_benchmark(backend='torch',
+                  weights='yolo11n.pt',
+                  img_size=640,
+                  threads=None,
+                  stages=STAGES,
+                  frames_per_case=3,
+                  repeat=3,
+                  warmup=2,
+                  image_dir=None,
+                  profiles=('none', 'fast', 'quality'),
+                  url=None,
+                  concurrency=(1, 4, 8),
+                  http_profile=None,
+                  output=None,
+                  baseline_path=DEFAULT_BASELINE,
+                  tolerance=0.15,
+                  save_baseline=False):
+    """
+    Benchmark the detection pipeline
+
+    Args:
+        backend, weights, img_size, threads: Model to load (same meaning as AI_BACKEND,
+            AI_MODEL_PATH, AI_INPUT_SIZE, AI_INFERENCE_THREADS for the server)
+        stages: Subset of STAGES to run ('http' needs url)
+        frames_per_case: Frames per resolution/density case
+        repeat: Timed passes over every case
+        warmup: Untimed calls before each benchmark
+        image_dir: Use real images instead of the synthetic corpus
+        profiles: Preprocessing profiles to benchmark
+        url: Base URL of a running server for the HTTP benchmark
+        concurrency: Client concurrency levels for the HTTP benchmark
+        http_profile: Preprocessing profile requested from /detect (default: server default)
+        output: Report path (default runs/benchmark/<timestamp>/benchmark.json)
+        baseline_path: Baseline report to compare against (skipped if missing)
+        tolerance: Allowed relative slowdown before a benchmark counts as a regression
+        save_baseline: Write this report to baseline_path
+
+    Returns: report dict
+    """
+
+    print("\n" + "="*80)
+    print("⏱️  DETECTION PIPELINE BENCHMARK")
+    print("="*80)
+
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {unknown} (available: {', '.join(STAGES)})")
+    unknown = [p for p in profiles if p not in PREPROCESS_PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown preprocessing profile(s) {unknown} (available: {', '.join(PREPROCESS_PROFILES)})")
+
+    corpus = build_corpus(frames_per_case, image_dir)
+    if not corpus:
+        print(f"❌ No images found in {image_dir}")
+        return None
+
+    print("\n📊 Configuration:")
+    print(f"   Corpus: {'synthetic (seed ' + str(CORPUS_SEED) + ')' if not image_dir else image_dir}, "
+          f"{len(corpus)} cases x {frames_per_case} frames")
+    print(f"   Stages: {', '.join(stages)}")
+    print(f"   Repeat: {repeat}  Warm-up: {warmup}")
+
+    results = {}
+    postprocessor = DetectionPostprocessor(VEHICLE_CLASSES)
+    serializer = DetectionSerializer(postprocessor)
+    preprocessor = Preprocessor(target_size=img_size)
+    model = None
+    if {'inference', 'pipeline'} & set(stages):
+        print(f"\n📥 Loading model: {weights} ({backend})")
+        model = load_backend(backend, weights, imgsz=img_size, threads=threads)
+
+    def record(name, latencies):
+        results[name] = summarize(latencies)
+        print(f"   {name:40s} {_format_result(results[name])}")
+
+    if 'decode' in stages:
+        print("\n🖼️  Decode (cv2.imdecode)")
+        for case, frames in corpus.items():
+            record(f"decode/{case}", time_calls(
+                lambda f: cv2.imdecode(np.frombuffer(f['jpeg'], np.uint8), cv2.IMREAD_COLOR),
+                frames, repeat, warmup))
+
+    if 'preprocess' in stages:
+        print("\n🔧 Preprocessing")
+        for profile in profiles:
+            for case, frames in corpus.items():
+                record(f"preprocess/{profile}/{case}", time_calls(
+                    lambda f: preprocessor.run(f['image'], profile), frames, repeat, warmup))
+
+    if 'inference' in stages:
+        print("\n🤖 Inference")
+        augment_modes = (False, True) if model.supports_augment else (False,)
+        if not model.supports_augment:
+            print(f"   ⚠️  {backend} backend cannot run test-time augmentation; augment=True skipped")
+        for augment in augment_modes:
+            label = 'augment' if augment else 'plain'
+            for case, frames in corpus.items():
+                record(f"inference/{label}/{case}", time_calls(
+                    lambda f: model.predict([f['image']], augment=augment, **DETECT_PARAMS),
+                    frames, repeat, warmup))
+
+    if 'postprocess' in stages:
+        print("\n📐 Post-processing (ground-truth boxes as detections)")
+        for case, frames in corpus.items():
+            if frames[0]['boxes'] is None:
+                continue  # Real images have no known boxes
+            inputs = [(ground_truth_detections(f), f['image'].shape) for f in frames]
+
+            def postprocess(item):
+                frame = postprocessor.process(item[0], item[1])
+                postprocessor.vehicle_counts(frame)
+                postprocessor.orientation_counts(frame)
+                serializer.serialize('json', {}, frame, detailed=True)
+
+            record(f"postprocess/{case}", time_calls(postprocess, inputs, repeat, warmup))
+
+    if 'pipeline' in stages:
+        print("\n🔗 Pipeline in-process (decode -> preprocess -> inference -> post-processing -> JSON)")
+        pipeline_profile = 'fast' if 'fast' in profiles else profiles[0]
+
+        def pipeline(f):
+            img = cv2.imdecode(np.frombuffer(f['jpeg'], np.uint8), cv2.IMREAD_COLOR)
+            processed, info = preprocessor.run(img, pipeline_profile)
+            result = model.predict([processed], augment=model.supports_augment, **DETECT_PARAMS)[0]
+            frame = postprocessor.process(result, img.shape, info['scale'])
+            serializer.serialize('json', {'vehicle_counts': postprocessor.vehicle_counts(frame)}, frame)
+
+        for case, frames in corpus.items():
+            record(f"pipeline/{pipeline_profile}/{case}", time_calls(pipeline, frames, repeat, warmup))
+
+    if 'http' in stages:
+        if not url:
+            print("\n⚠️  HTTP benchmark skipped (no --url)")
+        else:
+            print(f"\n🌐 HTTP POST {url.rstrip('/')}/detect")
+            for level in concurrency:
+                for case, result in benchmark_http(url, corpus, level, repeat, http_profile).items():
+                    results[f"http/c{level}/{case}"] = result
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__
+        },
+        'config': {
+            'backend': backend if model else None,
+            'weights': weights if model else None,
+            'img_size': img_size,
+            'threads': threads,
+            'corpus': image_dir or f'synthetic:{CORPUS_SEED}',
+            'frames_per_case': frames_per_case,
+            'repeat': repeat,
+            'warmup': warmup,
+            'url': url,
+            'concurrency': list(concurrency)
+        },
+        'results': results,
+        'baseline': None,
+        'regressions': []
+    }
+
+    # Compare against the stored baseline
+    if baseline_path and os.path.exists(baseline_path) and not save_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, tolerance)
+        report['baseline'] = {'path': baseline_path, 'timestamp': baseline.get('timestamp'), 'tolerance': tolerance}
+        report['regressions'] = regressions
+
+        print("\n" + "="*80)
+        print(f"BASELINE COMPARISON ({baseline_path}, tolerance {tolerance:.0%})")
+        print("="*80)
+        if baseline.get('environment') != report['environment']:
+            print("⚠️  Baseline was recorded on a different environment; differences may not be regressions")
+        if regressions:
+            for r in regressions:
+                change = f"{r['change']:+.1%}" if r['change'] is not None else ''
+                print(f"❌ {r['benchmark']:40s} {r['metric']:16s} {r['baseline']} -> {r['current']} {change}")
+        else:
+            print("✅ No regressions")
+
+    output = output or os.path.join('runs', 'benchmark', datetime.now().strftime('%Y%m%d_%H%M%S'), 'benchmark.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Report: {output}")
+
+    if save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved as baseline: {baseline_path}")
+    print("="*80 + "\n")
+
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the detection pipeline')
+    parser.add_argument('--backend', type=str, default=os.environ.get('AI_BACKEND', 'torch'),
+                       help='Inference backend (torch, onnx, openvino)')
+    parser.add_argument('--weights', type=str, default=os.environ.get('AI_MODEL_PATH', 'yolo11n.pt'),
+                       help='Model weights')
+    parser.add_argument('--imgsz', type=int, default=int(os.environ.get('AI_INPUT_SIZE', 640)),
+                       help='Model input size')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='CPU threads for inference')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES,
+                       help='Stages to benchmark')
+    parser.add_argument('--frames', type=int, default=3,
+                       help='Frames per resolution/density case')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timed passes over the corpus')
+    parser.add_argument('--warmup', type=int, default=2,
+                       help='Untimed calls before each benchmark')
+    parser.add_argument('--images', type=str, default=None,
+                       help='Benchmark real images from this directory instead of the synthetic corpus')
+    parser.add_argument('--profiles', nargs='+', default=['none', 'fast', 'quality'],
+                       help='Preprocessing profiles to benchmark')
+    parser.add_argument('--url', type=str, default=None,
+                       help='Running server for the HTTP /detect benchmark (e.g. http://localhost:5000)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8],
+                       help='HTTP client concurrency levels')
+    parser.add_argument('--http-profile', type=str, default=None,
+                       help='Preprocessing profile requested from /detect')
+    parser.add_argument('--output', type=str, default=None,
+                       help='Report path (default runs/benchmark/<timestamp>/benchmark.json)')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE,
+                       help='Baseline report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                       help='Allowed relative slowdown before a regression is reported')
+    parser.add_argument('--save-baseline', action='store_true',
+                       help='Store this run as the baseline')
+
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        backend=args.backend,
+        weights=args.weights,
+        img_size=args.imgsz,
+        threads=args.threads,
+        stages=args.stages,
+        frames_per_case=args.frames,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        image_dir=args.images,
+        profiles=args.profiles,
+        url=args.url,
+        concurrency=args.concurrency,
+        http_profile=args.http_profile,
+        output=args.output,
+        baseline_path=args.baseline,
+        tolerance=args.tolerance,
+        save_baseline=args.save_baseline
+    )
+    sys.exit(0 if report and not report['regressions'] else 1)
@@ -5,30 +5,99 @@ Captures images from camera to build training dataset
 
 import cv2
 import os
+import queue
+import threading
+import time
+from collections import deque
 from datetime import datetime
 import argparse
+from result_cache import perceptual_hash
 
-def collect_toy_car_images(output_dir='datasets/toy_cars/images', angle=None):
+VALID_ANGLES = ['front', 'back', 'left', 'right']
+
+
+class FrameWriter:
+    """
+    Writes captured frames on a background thread so saving never stalls the camera loop
+    The queue is bounded: when the disk cannot keep up, new frames are dropped (and counted)
+    """
+    
+    def __init__(self, max_queue=64, jpeg_quality=95):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._run, name='frame-writer', daemon=True)
+        self.thread.start()
+    
+    def submit(self, frame, path):
+        """Queue a frame for writing; False if the queue is full and the frame was dropped"""
+        try:
+            self.queue.put_nowait((frame, path))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            frame, path = item
+            if cv2.imwrite(path, frame, self.params):
+                self.written += 1
+            else:
+                self.failed += 1
+                print(f"❌ Failed to write {path}")
+    
+    def close(self):
+        """Write everything still queued, then stop"""
+        self.queue.put(None)
+        self.thread.join()
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two perceptual hashes"""
+    return bin(int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).count('1')
+
+
+def collect_toy_car_images(output_dir='datasets/toy_cars/images', angle=None, source=0, interval=None,
+                           headless=False, dedup_distance=5, max_images=None, max_queue=64):
     """
     Capture images of toy cars from different angles
     
+    Frames are saved by a background writer, so preview and camera reads never wait for the disk.
+    Automatic (burst/interval) captures that look like one of the recently saved frames are
+    skipped; SPACE always saves.
+    
     Args:
         output_dir: Directory to save captured images
         angle: Orientation label (front/back/left/right)
+        source: Camera index or path to a video file
+        interval: Capture automatically every `interval` seconds (0 = every frame, None = SPACE only);
+                  for video files this is video time, so runs are reproducible
+        headless: No preview window (captures with `interval`, every frame if not set)
+        dedup_distance: Skip automatic captures whose perceptual hash is fewer than this many bits
+                        away from one of the last saved frames (0 = keep duplicates)
+        max_images: Stop after saving this many images
+        max_queue: Frames waiting to be written before new captures are dropped
     """
     
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Open camera (0 = default camera, change if you have multiple cameras)
-    cap = cv2.VideoCapture(0)
+    # Open camera (0 = default camera, change if you have multiple cameras) or video file
+    is_file = not str(source).isdigit()
+    cap = cv2.VideoCapture(str(source) if is_file else int(source))
     
     if not cap.isOpened():
-        print("❌ Error: Could not open camera")
+        print(f"❌ Error: Could not open {'video file' if is_file else 'camera'} {source}")
         return
     
     # Get angle if not provided
-    if angle is None:
+    if angle is None and not headless:
         print("\n🎯 Available angles:")
         print("  1. front  - Car facing camera (front view)")
         print("  2. back   - Car facing away (rear view)")
@@ -37,81 +106,140 @@ def collect_toy_car_images(output_dir='datasets/toy_cars/images', angle=None):
         angle = input("\n📸 Enter angle (front/back/left/right): ").strip().lower()
     
     # Validate angle
-    valid_angles = ['front', 'back', 'left', 'right']
-    if angle not in valid_angles:
-        print(f"❌ Invalid angle. Must be one of: {', '.join(valid_angles)}")
+    if angle not in VALID_ANGLES:
+        print(f"❌ Invalid angle. Must be one of: {', '.join(VALID_ANGLES)}")
+        cap.release()
         return
     
+    if headless and interval is None:
+        interval = 0
+    
     # Create angle-specific subdirectory
     angle_dir = os.path.join(output_dir, angle)
     os.makedirs(angle_dir, exist_ok=True)
     
+    writer = FrameWriter(max_queue=max_queue)
+    recent_hashes = deque(maxlen=32)
     count = 0
-    print(f"\n✅ Camera opened successfully!")
+    duplicates = 0
+    auto_capture = interval is not None
+    next_capture_at = 0.0
+    started = time.monotonic()
+    
+    print(f"\n✅ {'Video file' if is_file else 'Camera'} opened successfully!")
     print(f"📁 Saving to: {angle_dir}")
     print(f"🎯 Capturing angle: {angle}")
-    print("\n" + "="*60)
-    print("CONTROLS:")
-    print("  SPACE - Capture image")
-    print("  Q     - Quit and exit")
-    print("  S     - Show statistics")
-    print("="*60 + "\n")
+    if auto_capture:
+        print(f"⏱️  Auto capture: {'every frame' if interval == 0 else f'every {interval}s'}")
+    if not headless:
+        print("\n" + "="*60)
+        print("CONTROLS:")
+        print("  SPACE - Capture image")
+        print("  B     - Start/stop burst (auto capture every --interval seconds, default 0.5)")
+        print("  Q     - Quit and exit")
+        print("  S     - Show statistics")
+        print("="*60 + "\n")
     
-    while True:
-        ret, frame = cap.read()
+    def capture(frame, manual=False):
+        """Hand a frame to the writer unless an automatic capture duplicates a recent one; True if queued"""
+        nonlocal count, duplicates
+        if dedup_distance > 0:
+            frame_hash = perceptual_hash(frame)
+            if not manual and any(hash_distance(frame_hash, h) < dedup_distance for h in recent_hashes):
+                duplicates += 1
+                return False
+        # Microseconds and the running count keep names unique within a burst
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        filename = f"{angle}_{count:04d}_{timestamp}.jpg"
         
-        if not ret:
-            print("❌ Error: Failed to read frame from camera")
-            break
-        
-        # Display frame with instructions overlay
-        display_frame = frame.copy()
-        
-        # Add text overlay
-        cv2.putText(display_frame, f"Angle: {angle.upper()}", (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(display_frame, f"Images captured: {count}", (10, 70),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(display_frame, "SPACE=Capture  Q=Quit", (10, display_frame.shape[0] - 20),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        # Add crosshair to center for alignment
-        h, w = display_frame.shape[:2]
-        cv2.line(display_frame, (w//2 - 30, h//2), (w//2 + 30, h//2), (0, 255, 255), 2)
-        cv2.line(display_frame, (w//2, h//2 - 30), (w//2, h//2 + 30), (0, 255, 255), 2)
-        
-        cv2.imshow('Toy Car Data Collection', display_frame)
-        
-        key = cv2.waitKey(1) & 0xFF
-        
-        if key == ord(' '):  # Space to capture
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{angle}_{count:04d}_{timestamp}.jpg"
-            filepath = os.path.join(angle_dir, filename)
-            
-            # Save original frame (without overlay)
-            cv2.imwrite(filepath, frame)
+        # Save original frame (without overlay)
+        if not writer.submit(frame, os.path.join(angle_dir, filename)):
+            if manual:
+                print("⚠️  Not captured: writer queue is full")
+            return False
+        if dedup_distance > 0:
+            recent_hashes.append(frame_hash)
+        count += 1
+        if not auto_capture:
             print(f"📸 Captured: {filename}")
-            count += 1
+        return True
+    
+    def print_statistics():
+        print(f"\n📊 Statistics:")
+        print(f"   Angle: {angle}")
+        print(f"   Images captured: {count} ({writer.written} written, {writer.queue.qsize()} queued)")
+        print(f"   Duplicates skipped: {duplicates}")
+        print(f"   Dropped (writer behind): {writer.dropped}")
+        print(f"   Save directory: {angle_dir}\n")
+    
+    try:
+        while max_images is None or count < max_images:
+            ret, frame = cap.read()
             
-        elif key == ord('s'):  # Show statistics
-            print(f"\n📊 Statistics:")
-            print(f"   Angle: {angle}")
-            print(f"   Images captured: {count}")
-            print(f"   Save directory: {angle_dir}\n")
+            if not ret:
+                if not is_file:
+                    print("❌ Error: Failed to read frame from camera")
+                break
             
-        elif key == ord('q'):  # Quit
-            break
-    
-    # Cleanup
-    cap.release()
-    cv2.destroyAllWindows()
+            # Video files are paced by their own timestamps, cameras by the wall clock
+            now = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 if is_file else time.monotonic() - started
+            if auto_capture and now >= next_capture_at:
+                capture(frame)
+                next_capture_at = now + (interval or 0)
+            
+            if headless:
+                continue
+            
+            # Display frame with instructions overlay
+            display_frame = frame.copy()
+            
+            # Add text overlay
+            cv2.putText(display_frame, f"Angle: {angle.upper()}", (10, 30),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.putText(display_frame, f"Images captured: {count}", (10, 70),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            if auto_capture:
+                cv2.putText(display_frame, "BURST", (10, 110),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            cv2.putText(display_frame, "SPACE=Capture  B=Burst  Q=Quit", (10, display_frame.shape[0] - 20),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            
+            # Add crosshair to center for alignment
+            h, w = display_frame.shape[:2]
+            cv2.line(display_frame, (w//2 - 30, h//2), (w//2 + 30, h//2), (0, 255, 255), 2)
+            cv2.line(display_frame, (w//2, h//2 - 30), (w//2, h//2 + 30), (0, 255, 255), 2)
+            
+            cv2.imshow('Toy Car Data Collection', display_frame)
+            
+            key = cv2.waitKey(1) & 0xFF
+            
+            if key == ord(' '):  # Space to capture
+                capture(frame, manual=True)
+                
+            elif key == ord('b'):  # Toggle burst mode
+                auto_capture = not auto_capture
+                interval = 0.5 if interval is None else interval
+                next_capture_at = now
+                print(f"{'🔴 Burst started' if auto_capture else '⏹️  Burst stopped'} ({count} images so far)")
+                
+            elif key == ord('s'):  # Show statistics
+                print_statistics()
+                
+            elif key == ord('q'):  # Quit
+                break
+    finally:
+        # Cleanup
+        cap.release()
+        if not headless:
+            cv2.destroyAllWindows()
+        writer.close()  # Finish writing queued frames
     
     print(f"\n✅ Collection complete!")
-    print(f"   Total images captured: {count}")
+    print(f"   Total images captured: {writer.written}")
+    print(f"   Duplicates skipped: {duplicates}, dropped: {writer.dropped}, write errors: {writer.failed}")
     print(f"   Saved to: {angle_dir}")
     print(f"\n💡 Recommendation: Capture at least 50-100 images per angle")
-    print(f"   Current progress: {count}/100 for '{angle}' angle")
+    print(f"   Current progress: {writer.written}/100 for '{angle}' angle")
 
 
 def show_dataset_summary(dataset_dir='datasets/toy_cars/images'):
@@ -126,14 +254,13 @@ def show_dataset_summary(dataset_dir='datasets/toy_cars/images'):
         print(f"❌ Dataset directory not found: {dataset_dir}")
         return
     
-    angles = ['front', 'back', 'left', 'right']
     total_images = 0
     
-    for angle in angles:
+    for angle in VALID_ANGLES:
         angle_dir = os.path.join(dataset_dir, angle)
         if os.path.exists(angle_dir):
-            image_files = [f for f in os.listdir(angle_dir) if f.endswith(('.jpg', '.jpeg', '.png'))]
-            count = len(image_files)
+            with os.scandir(angle_dir) as it:
+                count = sum(1 for e in it if e.name.endswith(('.jpg', '.jpeg', '.png')))
             total_images += count
             status = "✅" if count >= 50 else "⚠️"
             print(f"{status} {angle:8s}: {count:4d} images (Recommended: 50-100)")
@@ -148,8 +275,18 @@ def show_dataset_summary(dataset_dir='datasets/toy_cars/images'):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Collect toy car images for training')
-    parser.add_argument('--angle', type=str, choices=['front', 'back', 'left', 'right'],
+    parser.add_argument('--angle', type=str, choices=VALID_ANGLES,
                        help='Car orientation angle')
+    parser.add_argument('--source', type=str, default='0',
+                       help='Camera index or video file to capture from')
+    parser.add_argument('--interval', type=float, default=None,
+                       help='Auto capture every N seconds (0 = every frame); B toggles it in the preview')
+    parser.add_argument('--headless', action='store_true',
+                       help='No preview window (captures every --interval seconds, or every frame)')
+    parser.add_argument('--dedup-distance', type=int, default=5,
+                       help='Skip burst/interval frames within this many hash bits of a recent capture (0 = keep all)')
+    parser.add_argument('--max-images', type=int, default=None,
+                       help='Stop after saving this many images')
     parser.add_argument('--output', type=str, default='datasets/toy_cars/images',
                        help='Output directory for images')
     parser.add_argument('--summary', action='store_true',
@@ -162,5 +299,7 @@ if __name__ == "__main__":
     else:
         print("\n🚗 TOY CAR DATASET COLLECTION TOOL 📸")
         print("="*60)
-        collect_toy_car_images(args.output, args.angle)
+        collect_toy_car_images(args.output, args.angle, source=args.source, interval=args.interval,
+                               headless=args.headless, dedup_distance=args.dedup_distance,
+                               max_images=args.max_images)
         print("\n💡 Run with --summary to see collection progress")
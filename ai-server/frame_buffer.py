@@ -0,0 +1,174 @@
+"""
+Bounded Latest-Frame Ring Buffers for Camera Ingestion
+Each camera keeps only its newest few frames; stale frames are dropped
+instead of queued so inference always works on the most recent image
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+# seq: producer sequence number (rebased after a producer restart, see FrameRingBuffer.put),
+# timestamp: capture time (epoch seconds), received_at: server receive time (epoch seconds)
+FrameEntry = namedtuple('FrameEntry', ['seq', 'frame', 'timestamp', 'received_at'])
+
+# A sequence number this far behind the newest frame means the producer restarted
+RESET_SEQ_GAP = 100
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size ring of the most recent frames for one camera
+
+    Frames are stored read-only and handed to consumers by reference (no copy).
+    A frame that is overwritten before any consumer read it counts as dropped.
+    """
+
+    def __init__(self, capacity=3):
+        self.capacity = max(1, int(capacity))
+        self._slots = [None] * self.capacity
+        self._head = -1  # Index of the newest slot
+        self._cond = threading.Condition()
+
+        # Statistics
+        self.frames_received = 0
+        self.frames_dropped = 0      # Superseded before any consumer read them
+        self.frames_rejected = 0     # Out-of-order / duplicate sequence numbers
+        self.producer_resets = 0     # Producer restarts detected (sequence numbers started over)
+        self._seq_offset = 0         # Added to producer sequence numbers since the last restart
+        self._latest_read_seq = None
+        self._latest_read_age_ms = 0.0
+        self._unread = False
+
+    def put(self, frame, seq=None, timestamp=None):
+        """
+        Store a new frame, replacing the oldest slot
+
+        A sequence number behind the newest frame is a late frame (rejected) unless the
+        producer restarted: it jumped back by more than RESET_SEQ_GAP, or its capture
+        timestamp is newer than the newest frame's. After a restart, sequence numbers are
+        rebased to continue after the newest one, so consumers waiting for newer frames
+        keep working.
+
+        Returns: stored FrameEntry, or None if the frame is older than the newest one
+        """
+        now = time.time()
+        frame.flags.writeable = False  # Consumers share this array by reference
+
+        with self._cond:
+            latest = self._slots[self._head] if self._head >= 0 else None
+            if seq is None:
+                seq = latest.seq + 1 if latest is not None else 0
+            elif latest is not None and seq + self._seq_offset <= latest.seq:
+                restarted = (latest.seq - (seq + self._seq_offset) > RESET_SEQ_GAP or
+                             (timestamp is not None and timestamp > latest.timestamp))
+                if not restarted:
+                    self.frames_rejected += 1
+                    return None
+                self._seq_offset = latest.seq + 1 - seq
+                self.producer_resets += 1
+                seq += self._seq_offset
+            else:
+                seq += self._seq_offset
+
+            if self._unread:
+                self.frames_dropped += 1
+
+            entry = FrameEntry(seq, frame, timestamp if timestamp is not None else now, now)
+            self._head = (self._head + 1) % self.capacity
+            self._slots[self._head] = entry
+            self.frames_received += 1
+            self._unread = True
+            self._cond.notify_all()
+            return entry
+
+    def latest(self):
+        """Newest frame (by reference), or None if nothing has been received"""
+        with self._cond:
+            if self._head < 0:
+                return None
+            entry = self._slots[self._head]
+            self._mark_read(entry)
+            return entry
+
+    def wait_for_newer(self, last_seq, timeout=None):
+        """
+        Block until a frame newer than last_seq is available
+
+        Returns: newest FrameEntry, or None on timeout
+        """
+        with self._cond:
+            def has_newer():
+                return self._head >= 0 and (last_seq is None or self._slots[self._head].seq > last_seq)
+
+            if not self._cond.wait_for(has_newer, timeout=timeout):
+                return None
+            entry = self._slots[self._head]
+            self._mark_read(entry)
+            return entry
+
+    def recent(self):
+        """All buffered frames, oldest first (by reference)"""
+        with self._cond:
+            entries = [e for e in self._slots if e is not None]
+        return sorted(entries, key=lambda e: e.seq)
+
+    def _mark_read(self, entry):
+        self._unread = False
+        self._latest_read_seq = entry.seq
+        self._latest_read_age_ms = (time.time() - entry.timestamp) * 1000
+
+    def get_stats(self):
+        with self._cond:
+            latest = self._slots[self._head] if self._head >= 0 else None
+            now = time.time()
+            return {
+                'capacity': self.capacity,
+                'frames_received': self.frames_received,
+                'frames_dropped': self.frames_dropped,
+                'frames_rejected': self.frames_rejected,
+                'producer_resets': self.producer_resets,
+                'latest_seq': latest.seq if latest else None,
+                'latest_frame_age_ms': round((now - latest.timestamp) * 1000, 1) if latest else None,
+                'latest_read_seq': self._latest_read_seq,
+                'latest_read_frame_age_ms': round(self._latest_read_age_ms, 1),
+                'frames_behind': (latest.seq - self._latest_read_seq)
+                                 if latest and self._latest_read_seq is not None else None
+            }
+
+
+class FrameStore:
+    """Per-camera ring buffers, created on first use"""
+
+    def __init__(self, capacity=3):
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def buffer(self, camera_id):
+        with self._lock:
+            buf = self._buffers.get(camera_id)
+            if buf is None:
+                buf = FrameRingBuffer(self.capacity)
+                self._buffers[camera_id] = buf
+            return buf
+
+    def __contains__(self, camera_id):
+        with self._lock:
+            return camera_id in self._buffers
+
+    def put(self, camera_id, frame, seq=None, timestamp=None):
+        return self.buffer(camera_id).put(frame, seq=seq, timestamp=timestamp)
+
+    def latest(self, camera_id):
+        with self._lock:
+            buf = self._buffers.get(camera_id)
+        return buf.latest() if buf is not None else None
+
+    def wait_for_newer(self, camera_id, last_seq, timeout=None):
+        return self.buffer(camera_id).wait_for_newer(last_seq, timeout=timeout)
+
+    def get_stats(self):
+        with self._lock:
+            buffers = dict(self._buffers)
+        return {camera_id: buf.get_stats() for camera_id, buf in buffers.items()}
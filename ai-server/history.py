@@ -0,0 +1,344 @@
+"""
+Durable Detection History (Parquet)
+Detection results are buffered in memory and flushed as small Parquet segments,
+partitioned by intersection and day. A background compactor merges segments into
+hourly detection files and minute/hour rollups, which answer range and peak-hour
+queries by reading only the partitions and rollup level a query needs
+
+Layout: <root>/<intersection>/<YYYY-MM-DD>/
+    segment-*.parquet        recent raw rows, not compacted yet (queries include them)
+    detections-HH.parquet    raw rows per hour, tagged with the segment they came from
+    minute.parquet           per-minute rollup
+    hour.parquet             per-hour rollup
+
+Compaction is idempotent: hourly files replace rows of the segments being merged instead of
+appending, and rollups of the touched hours are recomputed from the hourly files, so a crash
+before the segments are deleted only repeats the same work on the next run.
+"""
+
+import itertools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import polars as pl
+
+# Range queries longer than this use the hour rollup instead of the minute rollup
+MINUTE_QUERY_MAX_HOURS = 6
+
+# Cached peak-hour answers (intersection, days, top), least recently used evicted first
+PEAK_CACHE_SIZE = 256
+
+# Bookkeeping columns that are neither summed nor returned
+INTERNAL_COLUMNS = ('segment',)
+
+
+def partition_name(intersection_id):
+    """Directory-safe intersection name"""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(intersection_id)) or '_'
+
+
+def parse_time(value, default=None):
+    """ISO datetime or epoch seconds (string or number) -> naive local datetime"""
+    if value is None or value == '':
+        return default
+    if not isinstance(value, datetime):
+        try:
+            return datetime.fromtimestamp(float(value))
+        except ValueError:
+            value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)  # History is stored in server local time
+    return value
+
+
+class HistoryStore:
+    """
+    Append-only detection history with background compaction
+
+    Columns: timestamp, camera_id, frames (1 per raw row), count_<type> (vehicles in the
+    frame) and arrivals_<type> (newly tracked vehicles). Rollups sum every column except
+    timestamp and camera_id.
+    """
+
+    def __init__(self, root, vehicle_types, flush_interval=5.0, compact_interval=60.0):
+        self.root = root
+        self.vehicle_types = list(vehicle_types)
+        self.count_columns = [f'count_{t}' for t in self.vehicle_types]
+        self.arrival_columns = [f'arrivals_{t}' for t in self.vehicle_types]
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._partition_locks = {}  # Partition directory -> lock held while compacting or reading it
+        self._partition_locks_lock = threading.Lock()
+        self._segment_ids = itertools.count()
+        self._peak_cache = OrderedDict()
+        self._peak_cache_lock = threading.Lock()
+
+        # Statistics
+        self.rows_recorded = 0
+        self.segments_written = 0
+        self.compactions = 0
+        self.last_compaction_ms = 0.0
+
+        os.makedirs(root, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, intersection_id, camera_id, vehicle_counts, arrivals=None, timestamp=None):
+        """Buffer one detection result (cheap; written by the background thread)"""
+        row = (intersection_id, camera_id, timestamp if timestamp is not None else time.time(),
+               [vehicle_counts.get(t, 0) for t in self.vehicle_types],
+               [(arrivals or {}).get(t, 0) for t in self.vehicle_types])
+        with self._buffer_lock:
+            self._buffer.append(row)
+            self.rows_recorded += 1
+
+    # WRITING
+
+    def _partition_dir(self, intersection_id, day):
+        return os.path.join(self.root, partition_name(intersection_id), day.strftime('%Y-%m-%d'))
+
+    def _partition_lock(self, directory):
+        with self._partition_locks_lock:
+            return self._partition_locks.setdefault(directory, threading.Lock())
+
+    @staticmethod
+    def _segments(directory):
+        return sorted(e.path for e in os.scandir(directory)
+                      if e.name.startswith('segment-') and e.name.endswith('.parquet'))
+
+    def flush(self):
+        """Write buffered rows as one segment per intersection and day"""
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+
+        groups = {}
+        for intersection_id, camera_id, timestamp, counts, arrivals in rows:
+            ts = datetime.fromtimestamp(timestamp)
+            groups.setdefault((intersection_id, ts.date()), []).append((ts, camera_id, counts, arrivals))
+
+        for (intersection_id, day), group in groups.items():
+            columns = {
+                'timestamp': [r[0] for r in group],
+                'camera_id': [r[1] for r in group],
+                'frames': [1] * len(group),
+            }
+            for i, name in enumerate(self.count_columns):
+                columns[name] = [r[2][i] for r in group]
+            for i, name in enumerate(self.arrival_columns):
+                columns[name] = [r[3][i] for r in group]
+
+            directory = self._partition_dir(intersection_id, day)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'segment-{time.time_ns()}-{next(self._segment_ids)}.parquet')
+            pl.DataFrame(columns, schema_overrides={'camera_id': pl.Utf8}).write_parquet(path + '.tmp')
+            os.replace(path + '.tmp', path)
+            self.segments_written += 1
+
+    def _write(self, df, path):
+        df.write_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def _sum_by(self, df, key):
+        columns = [c for c in df.columns if c not in ('timestamp', 'camera_id', key) + INTERNAL_COLUMNS]
+        return df.group_by(key).agg(pl.col(columns).sum()).sort(key)
+
+    def compact(self):
+        """Merge segments into hourly detection files and update the minute/hour rollups"""
+        start = time.perf_counter()
+        with self._compact_lock:
+            for intersection_dir in os.scandir(self.root):
+                if not intersection_dir.is_dir():
+                    continue
+                for day_dir in os.scandir(intersection_dir.path):
+                    with self._partition_lock(day_dir.path):
+                        segments = self._segments(day_dir.path)
+                        if segments:
+                            self._compact_partition(day_dir.path, segments)
+            self.compactions += 1
+        self.last_compaction_ms = (time.perf_counter() - start) * 1000
+
+    def _read_segments(self, segments):
+        return pl.concat([pl.read_parquet(p).with_columns(pl.lit(os.path.basename(p)).alias('segment'))
+                          for p in segments], how='diagonal_relaxed').fill_null(0)
+
+    def _compact_partition(self, directory, segments):
+        names = [os.path.basename(p) for p in segments]
+        new_rows = self._read_segments(segments)
+
+        # Raw rows, one file per hour (only the hours touched by the new rows are rewritten).
+        # Rows already merged from these segments are replaced, so a repeated compaction adds nothing
+        new_rows = new_rows.with_columns(pl.col('timestamp').dt.hour().alias('_hour'))
+        touched = {}
+        for (hour,), rows in new_rows.group_by('_hour'):
+            path = os.path.join(directory, f'detections-{hour:02d}.parquet')
+            rows = rows.drop('_hour')
+            if os.path.exists(path):
+                existing = pl.read_parquet(path)
+                if 'segment' in existing.columns:
+                    existing = existing.filter(~pl.col('segment').is_in(names))
+                rows = pl.concat([existing, rows], how='diagonal_relaxed').fill_null(0)
+            rows = rows.sort('timestamp')
+            self._write(rows, path)
+            touched[hour] = rows
+
+        # Minute rollup: touched hours are recomputed from their hourly files, other minutes kept
+        minute_path = os.path.join(directory, 'minute.parquet')
+        minutes = self._sum_by(pl.concat(list(touched.values()), how='diagonal_relaxed').fill_null(0)
+                               .with_columns(pl.col('timestamp').dt.truncate('1m').alias('minute')), 'minute')
+        if os.path.exists(minute_path):
+            kept = pl.read_parquet(minute_path).filter(~pl.col('minute').dt.hour().is_in(list(touched)))
+            minutes = pl.concat([kept, minutes], how='diagonal_relaxed').fill_null(0).sort('minute')
+        self._write(minutes, minute_path)
+
+        # Hour rollup from the (small) minute rollup
+        hours = self._sum_by(minutes.with_columns(pl.col('minute').dt.truncate('1h').alias('hour')).drop('minute'),
+                             'hour')
+        self._write(hours, os.path.join(directory, 'hour.parquet'))
+
+        for path in segments:
+            os.remove(path)
+
+    def _run(self):
+        last_compaction = time.time()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - last_compaction >= self.compact_interval:
+                    self.compact()
+                    last_compaction = time.time()
+            except Exception as e:
+                print(f"❌ History writer error: {str(e)}")
+
+    def close(self):
+        """Flush and compact everything (e.g. at shutdown)"""
+        self._stop.set()
+        self.flush()
+        self.compact()
+
+    # QUERIES
+
+    def _days(self, start, end):
+        day = start.date()
+        while day <= end.date():
+            yield day
+            day += timedelta(days=1)
+
+    def query(self, intersection_id, start, end, resolution='auto'):
+        """
+        Aggregated history for a time range
+
+        Args:
+            start, end: datetimes (inclusive start, exclusive end)
+            resolution: 'minute', 'hour', 'raw' or 'auto' (minute for ranges up to
+                        MINUTE_QUERY_MAX_HOURS, hour beyond)
+
+        Returns: (resolution used, polars DataFrame sorted by time)
+        """
+        if resolution == 'auto':
+            resolution = 'minute' if end - start <= timedelta(hours=MINUTE_QUERY_MAX_HOURS) else 'hour'
+        if resolution not in ('minute', 'hour', 'raw'):
+            raise ValueError(f"Unknown resolution '{resolution}' (available: auto, minute, hour, raw)")
+
+        key = 'timestamp' if resolution == 'raw' else resolution
+        frames = []
+        for day in self._days(start, end):
+            directory = self._partition_dir(intersection_id, day)
+            if not os.path.isdir(directory):
+                continue
+            if resolution == 'raw':
+                first = start.hour if day == start.date() else 0
+                last = end.hour if day == end.date() else 23
+                candidates = [os.path.join(directory, f'detections-{h:02d}.parquet') for h in range(first, last + 1)]
+            else:
+                candidates = [os.path.join(directory, f'{resolution}.parquet')]
+            # Compacted files and pending segments are read together, so a compaction in between
+            # can neither hide nor double-count rows
+            with self._partition_lock(directory):
+                frames += [pl.read_parquet(p) for p in candidates if os.path.exists(p)]
+                segments = self._segments(directory)
+                pending = self._read_segments(segments) if segments else None
+            if pending is not None:
+                if resolution != 'raw':
+                    unit = '1m' if resolution == 'minute' else '1h'
+                    pending = self._sum_by(pending.with_columns(pl.col('timestamp').dt.truncate(unit)
+                                                                .alias(resolution)), resolution)
+                frames.append(pending)
+
+        if not frames:
+            return resolution, pl.DataFrame()
+        df = (pl.concat(frames, how='diagonal_relaxed')
+              .fill_null(0)
+              .filter((pl.col(key) >= start) & (pl.col(key) < end)))
+        df = df.drop([c for c in INTERNAL_COLUMNS if c in df.columns])
+        if resolution != 'raw':
+            df = self._sum_by(df, key)  # Merge rollup rows with the same minute/hour from pending segments
+        return resolution, df.sort(key)
+
+    def traffic_volume(self, df):
+        """Arrivals (unique tracked vehicles) where tracked, else average vehicles present per frame"""
+        arrivals = pl.sum_horizontal([pl.col(c) for c in self.arrival_columns if c in df.columns])
+        present = pl.sum_horizontal([pl.col(c) for c in self.count_columns if c in df.columns]) / pl.col('frames')
+        return pl.when(arrivals > 0).then(arrivals).otherwise(present)
+
+    def peak_hours(self, intersection_id, days=7, top=3, cache_seconds=300):
+        """
+        Busiest hours of the day over the last `days` days (from the hour rollups)
+
+        Returns: list of 'H:00-H:00' ranges (adjacent busy hours are merged), busiest first
+        """
+        cache_key = (intersection_id, days, top)
+        with self._peak_cache_lock:
+            cached = self._peak_cache.get(cache_key)
+            if cached and time.time() - cached[0] < cache_seconds:
+                self._peak_cache.move_to_end(cache_key)
+                return cached[1]
+
+        end = datetime.now()
+        _, df = self.query(intersection_id, end - timedelta(days=days), end, resolution='hour')
+        ranges = []
+        if df.height:
+            by_hour = (df.with_columns(self.traffic_volume(df).alias('volume'))
+                       .group_by(pl.col('hour').dt.hour().alias('hour_of_day'))
+                       .agg(pl.col('volume').mean())
+                       .filter(pl.col('volume') > 0)
+                       .sort('volume', descending=True)
+                       .head(top))
+            hours = sorted(by_hour['hour_of_day'].to_list())
+            volumes = dict(zip(by_hour['hour_of_day'].to_list(), by_hour['volume'].to_list()))
+            groups = []
+            for hour in hours:
+                if groups and hour == groups[-1][-1] + 1:
+                    groups[-1].append(hour)
+                else:
+                    groups.append([hour])
+            groups.sort(key=lambda g: max(volumes[h] for h in g), reverse=True)
+            ranges = [f'{g[0]}:00-{g[-1] + 1}:00' for g in groups]
+
+        with self._peak_cache_lock:
+            self._peak_cache[cache_key] = (time.time(), ranges)
+            self._peak_cache.move_to_end(cache_key)
+            while len(self._peak_cache) > PEAK_CACHE_SIZE:
+                self._peak_cache.popitem(last=False)
+        return ranges
+
+    def get_stats(self):
+        with self._buffer_lock:
+            buffered = len(self._buffer)
+        return {
+            'root': self.root,
+            'rows_recorded': self.rows_recorded,
+            'rows_buffered': buffered,
+            'segments_written': self.segments_written,
+            'compactions': self.compactions,
+            'last_compaction_ms': round(self.last_compaction_ms, 2)
+        }
@@ -0,0 +1,390 @@
+"""
+Pre-Decoded Training Image Cache
+Decodes and letterboxes every dataset image once into a memory-mapped uint8 array
+per split, with an index of slots and labels, so training epochs read pixels from
+the page cache instead of decoding and resizing JPEGs again
+"""
+
+import os
+import json
+import hashlib
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import cv2
+import numpy as np
+import yaml
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.data.utils import img2label_paths
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from backends import letterbox
+from prepare_dataset import IMAGE_EXTENSIONS, MANIFEST_NAME, load_manifest
+
+CACHE_VERSION = 1
+CACHE_DIR_NAME = 'cache'
+
+
+def split_images(image_dir):
+    """Sorted image file names of a split directory"""
+    with os.scandir(image_dir) as it:
+        return sorted(e.name for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def dataset_fingerprint(dataset_dir, split):
+    """
+    Hash that changes whenever the images of a split change
+    Uses the prepare_dataset manifest (content hashes); without one, names, sizes and mtimes
+    """
+    if os.path.exists(os.path.join(dataset_dir, MANIFEST_NAME)):
+        files = load_manifest(dataset_dir)
+        entries = sorted((os.path.basename(rel), f['hash']) for rel, f in files.items() if f['split'] == split)
+    else:
+        image_dir = os.path.join(dataset_dir, 'images', split)
+        entries = []
+        for name in split_images(image_dir):
+            stat = os.stat(os.path.join(image_dir, name))
+            entries.append((name, stat.st_size, stat.st_mtime_ns))
+    return hashlib.blake2b(json.dumps(entries).encode(), digest_size=16).hexdigest()
+
+
+def read_labels(label_path):
+    """YOLO label rows [class, cx, cy, w, h] (normalized); empty if the file is missing"""
+    if not os.path.exists(label_path):
+        return []
+    with open(label_path) as f:
+        rows = [line.split() for line in f if line.strip()]
+    return [[float(v) for v in row[:5]] for row in rows if len(row) >= 5]
+
+
+def letterbox_labels(rows, w0, h0, ratio, pad, size):
+    """Map normalized labels of the original image onto the letterboxed size x size image"""
+    return [[cls, (cx * w0 * ratio + pad[0]) / size, (cy * h0 * ratio + pad[1]) / size,
+             w * w0 * ratio / size, h * h0 * ratio / size] for cls, cx, cy, w, h in rows]
+
+
+class TrainingImageCache:
+    """
+    One split of a dataset, letterboxed to img_size and stored as an (N, size, size, 3) .npy memmap
+
+    The index (JSON) records the dataset fingerprint it was built from, and for every image
+    its slot, original shape, letterbox ratio/padding and labels in letterboxed coordinates.
+    The memmap is opened lazily in each process and never pickled, so dataloader workers
+    started with spawn map the file themselves instead of receiving a copy of the array.
+    """
+
+    def __init__(self, dataset_dir, split, img_size=640):
+        self.dataset_dir = dataset_dir
+        self.split = split
+        self.img_size = img_size
+        cache_dir = os.path.join(dataset_dir, CACHE_DIR_NAME)
+        self.images_path = os.path.join(cache_dir, f'{split}_{img_size}.npy')
+        self.index_path = os.path.join(cache_dir, f'{split}_{img_size}.json')
+        self._images = None
+        self.index = None
+        self._entries = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_images'] = None  # Reopened from images_path on first use
+        return state
+
+    @property
+    def images(self):
+        """(N, size, size, 3) read-only memmap of the letterboxed images"""
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+        return self._images
+
+    @property
+    def image_dir(self):
+        return os.path.join(self.dataset_dir, 'images', self.split)
+
+    @property
+    def label_dir(self):
+        return os.path.join(self.dataset_dir, 'labels', self.split)
+
+    @property
+    def size_bytes(self):
+        return os.path.getsize(self.images_path) if os.path.exists(self.images_path) else 0
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path) or not os.path.exists(self.images_path):
+            return None
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def is_valid(self):
+        """True if the cache exists and was built from the current images at this size"""
+        index = self._load_index()
+        return (index is not None and index.get('version') == CACHE_VERSION and
+                index.get('img_size') == self.img_size and
+                index.get('fingerprint') == dataset_fingerprint(self.dataset_dir, self.split))
+
+    def _save_index(self, index):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+
+    def build(self, workers=None):
+        """Decode and letterbox every image of the split into a new memmap (threads, cv2 releases the GIL)"""
+        os.makedirs(os.path.dirname(self.images_path), exist_ok=True)
+        names = split_images(self.image_dir)
+        size = self.img_size
+        fingerprint = dataset_fingerprint(self.dataset_dir, self.split)
+        start = time.perf_counter()
+
+        tmp = self.images_path + '.tmp.npy'
+        images = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(len(names), size, size, 3))
+
+        def decode(slot):
+            name = names[slot]
+            img = cv2.imread(os.path.join(self.image_dir, name))
+            if img is None:
+                return None
+            h0, w0 = img.shape[:2]
+            images[slot], ratio, pad = letterbox(img, size)
+            label_path = os.path.join(self.label_dir, os.path.splitext(name)[0] + '.txt')
+            return {
+                'file': name,
+                'slot': slot,
+                'shape': [h0, w0],
+                'ratio': ratio,
+                'pad': list(pad),
+                'label_mtime_ns': os.stat(label_path).st_mtime_ns if os.path.exists(label_path) else None,
+                'labels': letterbox_labels(read_labels(label_path), w0, h0, ratio, pad, size)
+            }
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            entries = list(pool.map(decode, range(len(names))))
+        images.flush()
+        del images
+        os.replace(tmp, self.images_path)
+
+        unreadable = [names[i] for i, e in enumerate(entries) if e is None]
+        for name in unreadable:
+            print(f"⚠️  Unreadable image skipped: {name}")
+        self._save_index({
+            'version': CACHE_VERSION,
+            'split': self.split,
+            'img_size': size,
+            'fingerprint': fingerprint,
+            'built': datetime.now().isoformat(),
+            'build_seconds': round(time.perf_counter() - start, 2),
+            'files': [e for e in entries if e is not None]
+        })
+        return self
+
+    def refresh_labels(self):
+        """
+        Re-read label files edited since the cache was built (pixels stay as they are)
+        Returns: number of images whose labels were updated
+        """
+        index = self._load_index()
+        updated = 0
+        for entry in index['files']:
+            label_path = os.path.join(self.label_dir, os.path.splitext(entry['file'])[0] + '.txt')
+            mtime_ns = os.stat(label_path).st_mtime_ns if os.path.exists(label_path) else None
+            if mtime_ns != entry['label_mtime_ns']:
+                h0, w0 = entry['shape']
+                entry['labels'] = letterbox_labels(read_labels(label_path), w0, h0, entry['ratio'], entry['pad'],
+                                                   self.img_size)
+                entry['label_mtime_ns'] = mtime_ns
+                updated += 1
+        if updated:
+            self._save_index(index)
+        return updated
+
+    def open(self):
+        """Load the index (the image array is mapped on first access)"""
+        self.index = self._load_index()
+        self._images = None
+        self._entries = {e['file']: e for e in self.index['files']}
+        return self
+
+    def __contains__(self, file_name):
+        return file_name in self._entries
+
+    def entry(self, file_name):
+        if file_name not in self._entries:
+            raise KeyError(f"{file_name} is not in the {self.split} image cache - rebuild it")
+        return self._entries[file_name]
+
+    def measure(self, samples=50):
+        """Per-image load time in ms: decode + letterbox from disk vs. a copy out of the memmap"""
+        files = self.index['files']
+        step = max(1, len(files) // samples)
+        sample = files[::step][:samples]
+        if not sample:
+            return None, None
+
+        start = time.perf_counter()
+        for e in sample:
+            letterbox(cv2.imread(os.path.join(self.image_dir, e['file'])), self.img_size)
+        decode_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+        start = time.perf_counter()
+        for e in sample:
+            np.array(self.images[e['slot']])
+        cached_ms = (time.perf_counter() - start) * 1000 / len(sample)
+        return decode_ms, cached_ms
+
+
+def prepare_image_cache(data_yaml='datasets/toy_cars/data.yaml', img_size=640, splits=('train', 'val'),
+                        workers=None, loader_workers=8, rebuild=False):
+    """
+    Build (or reuse) the image caches of a dataset and report their size and load-time savings
+
+    Args:
+        data_yaml: Dataset configuration (its 'path' is the dataset directory)
+        img_size: Training image size
+        splits: Splits to cache
+        workers: Threads for decoding
+        loader_workers: Training dataloader workers, for the per-epoch estimate
+        rebuild: Rebuild even if the caches are current
+
+    Returns: dict of split -> opened TrainingImageCache
+    """
+    with open(data_yaml) as f:
+        dataset_dir = yaml.safe_load(f)['path']
+
+    print("\n" + "="*60)
+    print(f"🗃️  TRAINING IMAGE CACHE ({img_size}x{img_size})")
+    print("="*60)
+
+    caches = {}
+    report = {'img_size': img_size, 'timestamp': datetime.now().isoformat(), 'splits': {}}
+    for split in splits:
+        cache = TrainingImageCache(dataset_dir, split, img_size)
+        if not os.path.isdir(cache.image_dir):
+            print(f"⚠️  {split}: {cache.image_dir} not found, skipping")
+            continue
+
+        if rebuild or not cache.is_valid():
+            print(f"🔨 {split}: decoding images (dataset changed or no cache yet)...")
+            cache.build(workers)
+            labels_updated = 0
+        else:
+            labels_updated = cache.refresh_labels()
+        cache.open()
+        caches[split] = cache
+
+        decode_ms, cached_ms = cache.measure()
+        n = len(cache.index['files'])
+        info = {
+            'images': n,
+            'size_mb': round(cache.size_bytes / 1024 / 1024, 1),
+            'build_seconds': cache.index['build_seconds'],
+            'labels_updated': labels_updated,
+            'decode_ms_per_image': round(decode_ms, 2) if decode_ms is not None else None,
+            'cached_ms_per_image': round(cached_ms, 2) if cached_ms is not None else None
+        }
+        if decode_ms is not None:
+            # Image loading time per epoch spread over the dataloader workers (augmentation not included)
+            info['epoch_load_seconds_before'] = round(n * decode_ms / 1000 / loader_workers, 2)
+            info['epoch_load_seconds_after'] = round(n * cached_ms / 1000 / loader_workers, 2)
+        report['splits'][split] = info
+
+        print(f"✅ {split:5s}: {n} images, {info['size_mb']:.1f} MB"
+              + (f", {labels_updated} label files refreshed" if labels_updated else ''))
+        if decode_ms is not None:
+            print(f"   Image load: {decode_ms:.1f} ms -> {cached_ms:.2f} ms per image; "
+                  f"~{info['epoch_load_seconds_before']:.1f}s -> ~{info['epoch_load_seconds_after']:.1f}s "
+                  f"per epoch with {loader_workers} workers")
+
+    report_path = os.path.join(dataset_dir, CACHE_DIR_NAME, f'cache_report_{img_size}.json')
+    if caches:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report: {report_path}")
+    print("="*60)
+    return caches
+
+
+class CachedYOLODataset(YOLODataset):
+    """YOLODataset reading pre-letterboxed images and labels from a TrainingImageCache (no decoding)"""
+
+    def __init__(self, *args, image_cache, **kwargs):
+        self.image_cache = image_cache  # get_labels() runs inside the base constructor
+        super().__init__(*args, **kwargs)
+
+    def get_labels(self):
+        # Images the cache could not decode are left out of the index; drop them here too
+        missing = [f for f in self.im_files if os.path.basename(f) not in self.image_cache]
+        for im_file in missing:
+            print(f"⚠️  {os.path.basename(im_file)} is not in the {self.image_cache.split} image cache (unreadable), skipped")
+        if missing:
+            self.im_files = [f for f in self.im_files if os.path.basename(f) in self.image_cache]
+        self.label_files = img2label_paths(self.im_files)
+        size = self.image_cache.img_size
+        labels = []
+        for im_file in self.im_files:
+            entry = self.image_cache.entry(os.path.basename(im_file))
+            rows = np.array(entry['labels'], dtype=np.float32).reshape(-1, 5)
+            labels.append({
+                'im_file': im_file,
+                'shape': (size, size),
+                'cls': rows[:, :1],
+                'bboxes': rows[:, 1:],
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh'
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        # Looked up by file name: rect mode reorders im_files after get_labels()
+        slot = self.image_cache.entry(os.path.basename(self.im_files[i]))['slot']
+        im = np.array(self.image_cache.images[slot])  # Copy: augmentations write into it
+        if self.augment:
+            # Mosaic picks its extra images from the buffer of recently loaded ones
+            self.buffer.append(i)
+            if len(self.buffer) > self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, im.shape[:2], im.shape[:2]
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose train/val dataloaders read from the image caches (see prepare_image_cache)"""
+
+    def build_dataset(self, img_path, mode='train', batch=None):
+        img_path = os.path.normpath(img_path)
+        cache = TrainingImageCache(os.path.dirname(os.path.dirname(img_path)), os.path.basename(img_path),
+                                   self.args.imgsz)
+        if not cache.is_valid():
+            raise RuntimeError(f"Image cache for {img_path} is missing or stale - run prepare_image_cache() first")
+        model = getattr(self.model, 'module', self.model)
+        stride = max(int(model.stride.max()) if model is not None else 0, 32)
+        return CachedYOLODataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == 'train',
+            hyp=self.args,
+            rect=self.args.rect or mode == 'val',
+            cache=None,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == 'train' else 0.5,
+            prefix=colorstr(f'{mode}: '),
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == 'train' else 1.0,
+            image_cache=cache.open()
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the pre-decoded training image cache')
+    parser.add_argument('--data', type=str, default='datasets/toy_cars/data.yaml', help='Dataset YAML')
+    parser.add_argument('--imgsz', type=int, default=640, help='Training image size')
+    parser.add_argument('--splits', type=str, nargs='+', default=['train', 'val'], help='Splits to cache')
+    parser.add_argument('--workers', type=int, default=None, help='Decoding threads')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild even if the cache is current')
+    args = parser.parse_args()
+
+    prepare_image_cache(args.data, args.imgsz, args.splits, workers=args.workers, rebuild=args.rebuild)
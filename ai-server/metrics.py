@@ -0,0 +1,180 @@
+"""
+Lightweight Prometheus Metrics
+Histograms and counters record into a fixed set of lock-striped shards, so
+concurrent requests rarely contend; shards are only summed when /metrics is scraped
+"""
+
+import bisect
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds (0.5 ms .. 10 s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """
+    Lock-striped state: a fixed number of shards, each thread sticks to one of them
+    Threads are spread round-robin over the shards, so with up to SHARDS busy threads the
+    locks are uncontended; memory stays fixed however many threads come and go
+    """
+
+    SHARDS = 16
+
+    def __init__(self):
+        self._local = threading.local()
+        self._next = itertools.count()
+        self._shards = [({}, threading.Lock()) for _ in range(self.SHARDS)]
+
+    def _shard(self):
+        index = getattr(self._local, 'index', None)
+        if index is None:
+            index = self._local.index = next(self._next) % self.SHARDS
+        return self._shards[index]
+
+    def _snapshot(self, copy=lambda value: value):
+        snapshot = []
+        for shard, lock in self._shards:
+            with lock:
+                snapshot.append({labels: copy(value) for labels, value in shard.items()})
+        return snapshot
+
+
+class Histogram(_Sharded):
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        bucket = bisect.bisect_left(self.buckets, value)
+        shard, lock = self._shard()
+        with lock:
+            state = shard.get(label_values)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0]  # Per-bucket counts (last = +Inf), sum
+                shard[label_values] = state
+            state[0][bucket] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def collect(self):
+        """label values -> (per-bucket counts, sum), merged over all threads"""
+        merged = {}
+        for shard in self._snapshot(lambda state: (list(state[0]), state[1])):
+            for labels, (counts, total) in shard.items():
+                entry = merged.setdefault(labels, [[0] * len(counts), 0.0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+        return merged
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {total!r}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+class Counter(_Sharded):
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__()
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+
+    def inc(self, *label_values, amount=1):
+        shard, lock = self._shard()
+        with lock:
+            shard[label_values] = shard.get(label_values, 0) + amount
+
+    def collect(self):
+        merged = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+
+class CallbackGauge:
+    """Gauge whose values are read from a callback at scrape time: fn() -> {label values tuple: value}"""
+
+    def __init__(self, name, help_text, fn, label_names=(), metric_type='gauge'):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.label_names = tuple(label_names)
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.metric_type}']
+        try:
+            values = self.fn()
+        except Exception as e:
+            return lines + [f'# error collecting {self.name}: {str(e)}']
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, fn, label_names=()):
+        return self.register(CallbackGauge(name, help_text, fn, label_names))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
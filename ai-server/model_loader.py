@@ -0,0 +1,123 @@
+"""
+Deferred Model Loading with Warm-Up
+The server binds its port immediately while the model is loaded and warmed up
+on a background thread; readiness is tracked for the /health endpoints
+"""
+
+import threading
+import time
+import psutil
+
+# Lifecycle states
+LOADING = 'loading'
+WARMING_UP = 'warming_up'
+READY = 'ready'
+FAILED = 'failed'
+
+# Process start, so startup time includes interpreter start-up and imports
+PROCESS_STARTED_AT = psutil.Process().create_time()
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when the model is needed before it finished loading (or after loading failed)"""
+
+    def __init__(self, state, error=None):
+        super().__init__(f"Model is not ready ({state})" + (f": {error}" if error else ''))
+        self.state = state
+        self.error = error
+
+
+class ModelLoader:
+    """
+    Loads a model on a background thread, warms it up and records how long startup took
+
+    Until the model is ready, get() raises ModelNotReady so request handlers can answer
+    503 instead of blocking; wait() blocks for callers that would rather wait.
+    """
+
+    def __init__(self, load_fn, warmup_fn=None):
+        """
+        Args:
+            load_fn: Callable returning the loaded model
+            warmup_fn: Callable (model) running warm-up inferences (optional)
+        """
+        self.load_fn = load_fn
+        self.warmup_fn = warmup_fn
+        self.model = None
+        self.state = LOADING
+        self.error = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+
+        # Timings
+        self.started_at = None
+        self.ready_at = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.first_request_ms = None
+        self._first_request_lock = threading.Lock()
+
+    def start(self):
+        """Load in the background"""
+        threading.Thread(target=self.run, name='model-loader', daemon=True).start()
+        return self
+
+    def run(self):
+        """Load and warm up on the calling thread (errors are recorded, not raised)"""
+        self.started_at = time.time()
+        try:
+            start = time.perf_counter()
+            model = self.load_fn()
+            self.load_ms = (time.perf_counter() - start) * 1000
+            print(f"✅ Model loaded in {self.load_ms / 1000:.1f}s")
+
+            if self.warmup_fn is not None:
+                self.state = WARMING_UP
+                start = time.perf_counter()
+                self.warmup_fn(model)
+                self.warmup_ms = (time.perf_counter() - start) * 1000
+                print(f"🔥 Warm-up finished in {self.warmup_ms / 1000:.1f}s")
+
+            self.model = model
+            self.ready_at = time.time()
+            self.state = READY
+            self._ready.set()
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+            print(f"❌ Model loading failed: {str(e)}")
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def get(self):
+        """The loaded model, or ModelNotReady"""
+        if not self._ready.is_set():
+            raise ModelNotReady(self.state, self.error)
+        return self.model
+
+    def wait(self, timeout=None):
+        """Block until loading finished; returns the model or raises ModelNotReady"""
+        self._done.wait(timeout)
+        return self.get()
+
+    def record_request(self, latency_ms):
+        """Remember the latency of the first request served after the model became ready"""
+        if self.first_request_ms is None:
+            with self._first_request_lock:
+                if self.first_request_ms is None:
+                    self.first_request_ms = latency_ms
+                    print(f"⏱️  First request after startup: {latency_ms:.1f} ms")
+
+    def get_stats(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'load_ms': round(self.load_ms, 1) if self.load_ms is not None else None,
+            'warmup_ms': round(self.warmup_ms, 1) if self.warmup_ms is not None else None,
+            'startup_seconds': round(self.ready_at - PROCESS_STARTED_AT, 2) if self.ready_at else None,
+            'first_request_ms': round(self.first_request_ms, 2) if self.first_request_ms is not None else None
+        }
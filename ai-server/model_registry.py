@@ -0,0 +1,297 @@
+"""
+Model Registry with Hot Swapping
+New model versions are loaded, warmed up and validated in the background, then
+swapped in atomically. Requests pin the version they started on, so in-flight work
+finishes on the old model; the previous version stays loaded for instant rollback
+and older versions are released once their last request drains
+"""
+
+import gc
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from model_loader import ModelLoader, ModelNotReady, PROCESS_STARTED_AT
+
+# Version states
+LOADING = 'loading'
+VALIDATING = 'validating'
+ACTIVE = 'active'
+STANDBY = 'standby'      # Previous version, kept loaded for rollback
+DRAINING = 'draining'    # Retired, released when its last request finishes
+RELEASED = 'released'
+FAILED = 'failed'
+REJECTED = 'rejected'    # Loaded but failed validation
+
+
+class ModelVersion:
+    """One loaded (or loading) model with the number of requests currently using it"""
+
+    def __init__(self, version_id, backend, weights, loader):
+        self.id = version_id
+        self.backend = backend
+        self.weights = weights
+        self.name = os.path.basename(os.path.normpath(weights))
+        self.loader = loader
+        self.state = LOADING
+        self.refs = 0
+        self.validation = None
+        self.created_at = time.time()
+        self.activated_at = None
+        self.supports_augment = False
+
+    @property
+    def model(self):
+        return self.loader.model
+
+    def info(self):
+        stats = self.loader.get_stats()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'backend': self.backend,
+            'weights': self.weights,
+            'state': self.state,
+            'in_flight': self.refs,
+            'error': stats['error'],
+            'load_ms': stats['load_ms'],
+            'warmup_ms': stats['warmup_ms'],
+            'validation': self.validation,
+            'created_at': self.created_at,
+            'activated_at': self.activated_at
+        }
+
+
+class ModelRegistry:
+    """
+    Active model version plus the versions being deployed, kept for rollback or draining
+
+    Request path: `with registry.acquire() as version:` pins the active version;
+    version.model stays usable until the block exits, even if a swap happens meanwhile.
+    """
+
+    def __init__(self, load_fn, warmup_fn=None, validate_fn=None, keep_previous=True, on_swap=None,
+                 max_history=10):
+        """
+        Args:
+            load_fn: Callable (backend, weights) returning a loaded model
+            warmup_fn: Callable (model) running warm-up inferences (optional)
+            validate_fn: Callable (candidate model, active ModelVersion) returning a report
+                         dict with 'passed' (optional; without it every loaded model is accepted)
+            keep_previous: Keep the replaced version loaded for instant rollback
+            on_swap: Callable (old version or None, new version) run after every swap or rollback
+            max_history: Number of released/failed versions listed in the stats
+        """
+        self.load_fn = load_fn
+        self.warmup_fn = warmup_fn
+        self.validate_fn = validate_fn
+        self.keep_previous = keep_previous
+        self.on_swap = on_swap
+        self.max_history = max_history
+
+        self.active = None
+        self.standby = None
+        self.deploying = None
+        self.startup = None  # Loader of the first version (startup timings)
+        self._versions = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # STATE
+
+    @property
+    def ready(self):
+        return self.active is not None
+
+    @property
+    def state(self):
+        """'ready' once a version is active, else the startup loader's state"""
+        if self.active is not None:
+            return 'ready'
+        return self.startup.state if self.startup is not None else 'loading'
+
+    def _new_version(self, backend, weights):
+        loader = ModelLoader(lambda: self.load_fn(backend, weights), self.warmup_fn)
+        version = ModelVersion(next(self._ids), backend, weights, loader)
+        with self._lock:
+            self._versions.append(version)
+            done = [v for v in self._versions if v.state in (RELEASED, FAILED, REJECTED)]
+            for old in done[:max(0, len(done) - self.max_history)]:
+                self._versions.remove(old)
+        return version
+
+    # LOADING AND SWAPPING
+
+    def start(self, backend, weights):
+        """Load the first version in the background; it becomes active without validation"""
+        version = self._new_version(backend, weights)
+        self.startup = version.loader
+        threading.Thread(target=self._load, args=(version, False), name='model-loader', daemon=True).start()
+        return version
+
+    def deploy(self, weights, backend):
+        """
+        Load, warm up and validate a new version in the background, then swap it in
+
+        Raises: ValueError if the weights do not exist, RuntimeError if a deployment is already running
+        """
+        if not os.path.exists(weights):
+            raise ValueError(f"Model not found: {weights}")
+        with self._lock:
+            if self.active is None:
+                raise RuntimeError('The startup model is not ready yet')
+            if self.deploying is not None:
+                raise RuntimeError(f"Deployment of version {self.deploying.id} is still running")
+        version = self._new_version(backend, weights)
+        with self._lock:
+            self.deploying = version
+        print(f"📦 Deploying model version {version.id}: {weights} ({backend})")
+        threading.Thread(target=self._load, args=(version, True), name=f'model-deploy-{version.id}',
+                         daemon=True).start()
+        return version
+
+    def _load(self, version, validate):
+        try:
+            version.loader.run()
+            if version.loader.state != 'ready':
+                version.state = FAILED
+                print(f"❌ Model version {version.id} failed to load: {version.loader.error}")
+                return
+            version.supports_augment = getattr(version.model, 'supports_augment', False)
+
+            if validate and self.validate_fn is not None:
+                version.state = VALIDATING
+                with self.acquire() as active:
+                    version.validation = self.validate_fn(version.model, active)
+                if not version.validation.get('passed'):
+                    version.state = REJECTED
+                    print(f"❌ Model version {version.id} rejected: {version.validation}")
+                    self._release(version)
+                    return
+
+            self._swap(version)
+            if not validate:
+                print(f"🚀 Ready {version.loader.ready_at - PROCESS_STARTED_AT:.1f}s after process start")
+        except Exception as e:
+            if version.state == ACTIVE:
+                print(f"⚠️  Model version {version.id} swapped in, but on_swap failed: {str(e)}")
+                return
+            version.state = REJECTED if version.state == VALIDATING else FAILED
+            version.validation = version.validation or {'passed': False, 'error': str(e)}
+            print(f"❌ Model version {version.id} not deployed: {str(e)}")
+            if version.model is not None:
+                self._release(version)
+        finally:
+            with self._lock:
+                if self.deploying is version:
+                    self.deploying = None
+
+    def _swap(self, version):
+        """Make version active; the old active version becomes standby (or drains)"""
+        with self._lock:
+            old, retired = self._swap_locked(version)
+        self._after_swap(old, version, retired)
+
+    def _swap_locked(self, version):
+        """The state changes of a swap (caller holds the lock); returns (old active, versions to retire)"""
+        old = self.active
+        version.state = ACTIVE
+        version.activated_at = time.time()
+        self.active = version
+        retired = []
+        if old is not None:
+            if self.keep_previous:
+                if self.standby is not None and self.standby is not version:
+                    retired.append(self.standby)
+                old.state = STANDBY
+                self.standby = old
+            else:
+                retired.append(old)
+        if self.standby is version:
+            self.standby = None
+        return old, retired
+
+    def _after_swap(self, old, version, retired):
+        for v in retired:
+            self._retire(v)
+        if old is not None:
+            print(f"🔄 Model swapped: version {old.id} ({old.name}) -> {version.id} ({version.name})")
+        if self.on_swap:
+            self.on_swap(old, version)
+
+    def rollback(self):
+        """
+        Swap the standby (previous) version back in immediately
+
+        Raises: RuntimeError if there is no previous version loaded
+        """
+        # Checked and swapped in one critical section, so two concurrent rollbacks (or a
+        # rollback racing a deployment) cannot swap in a version that was retired meanwhile
+        with self._lock:
+            standby = self.standby
+            if standby is None or standby.state != STANDBY:
+                raise RuntimeError('No previous model version loaded to roll back to')
+            print(f"⏪ Rolling back to model version {standby.id} ({standby.name})")
+            old, retired = self._swap_locked(standby)
+        self._after_swap(old, standby, retired)
+        return standby
+
+    # REQUEST PINNING AND RELEASE
+
+    @contextmanager
+    def acquire(self):
+        """Pin the active version for the duration of the block (raises ModelNotReady before startup)"""
+        with self._lock:
+            version = self.active
+            if version is None:
+                raise ModelNotReady(self.state, self.startup.error if self.startup else None)
+            version.refs += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.refs -= 1
+                drained = version.state == DRAINING and version.refs == 0
+            if drained:
+                self._release(version)
+
+    def get(self, version_id):
+        """Model of a pinned version (used by the inference batcher)"""
+        with self._lock:
+            for version in self._versions:
+                if version.id == version_id and version.model is not None:
+                    return version.model
+        raise ModelNotReady(f'version {version_id} unavailable')
+
+    def _retire(self, version):
+        with self._lock:
+            version.state = DRAINING
+            drained = version.refs == 0
+        if drained:
+            self._release(version)
+
+    def _release(self, version):
+        """Free a version's model (worker pools shut down their processes) off the request path"""
+        def release():
+            model, version.loader.model = version.loader.model, None
+            if version.state != REJECTED:
+                version.state = RELEASED
+            if hasattr(model, 'close'):
+                model.close()
+            del model
+            gc.collect()
+            print(f"🗑️  Model version {version.id} ({version.name}) released")
+        threading.Thread(target=release, name=f'model-release-{version.id}', daemon=True).start()
+
+    def get_stats(self):
+        with self._lock:
+            versions = list(self._versions)
+            active, standby, deploying = self.active, self.standby, self.deploying
+        return {
+            'active': active.id if active else None,
+            'standby': standby.id if standby else None,
+            'deploying': deploying.id if deploying else None,
+            'keep_previous': self.keep_previous,
+            'versions': [v.info() for v in reversed(versions)]
+        }
@@ -0,0 +1,149 @@
+"""
+Motion-Gated Inference for Camera Streams
+A cheap per-camera change detector (downsampled grayscale frame differencing)
+decides whether a frame needs a full preprocess + YOLO pass or whether the
+previous detection result can be reused
+"""
+
+import threading
+import time
+import cv2
+import numpy as np
+
+# Default gate settings, overridable per camera
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'motion_threshold': 0.005,     # Fraction of changed pixels that counts as motion
+    'pixel_threshold': 20,         # Gray-level difference for a pixel to count as changed
+    'max_staleness_seconds': 2.0,  # Re-run inference at least this often, motion or not
+}
+
+# Width of the grayscale thumbnail used for differencing
+THUMBNAIL_WIDTH = 96
+
+
+class MotionGate:
+    """
+    Change detector for one camera
+
+    Frames are compared against the thumbnail of the last frame that went through
+    inference, so slow changes accumulate until they trigger a new pass.
+    """
+
+    def __init__(self, camera_id, **settings):
+        self.camera_id = camera_id
+        self._lock = threading.Lock()
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.configure(**settings)
+
+        self._reference = None   # Thumbnail of the last inferred frame
+        self._candidate = None   # Thumbnail of the frame currently being checked
+        self.last_result = None
+        self.last_inference_at = 0.0
+
+        # Statistics
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.trigger_reasons = {'first_frame': 0, 'motion': 0, 'staleness': 0, 'disabled': 0}
+        self.last_motion_score = 0.0
+        self._check_ms_total = 0.0
+
+    def configure(self, **settings):
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown motion settings: {', '.join(sorted(unknown))}")
+        updated = dict(self.settings)
+        for key, value in settings.items():
+            updated[key] = bool(value) if key == 'enabled' else float(value)
+        with self._lock:
+            self.settings = updated
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        size = (THUMBNAIL_WIDTH, max(1, round(h * THUMBNAIL_WIDTH / w)))
+        gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)  # Suppress sensor noise
+
+    def check(self, frame):
+        """
+        Decide whether the frame needs inference
+
+        Returns: (run_inference, motion_score)
+        """
+        start = time.perf_counter()
+        thumb = self._thumbnail(frame)
+        now = time.time()
+
+        with self._lock:
+            settings = self.settings
+            self.frames_checked += 1
+
+            if self._reference is None or self._reference.shape != thumb.shape or self.last_result is None:
+                score, reason = 1.0, 'first_frame'
+            else:
+                diff = cv2.absdiff(thumb, self._reference)
+                score = float(np.count_nonzero(diff > settings['pixel_threshold'])) / diff.size
+                if not settings['enabled']:
+                    reason = 'disabled'
+                elif score >= settings['motion_threshold']:
+                    reason = 'motion'
+                elif now - self.last_inference_at >= settings['max_staleness_seconds']:
+                    reason = 'staleness'
+                else:
+                    reason = None
+
+            self.last_motion_score = score
+            self._check_ms_total += (time.perf_counter() - start) * 1000
+            if reason is None:
+                self.frames_skipped += 1
+                return False, score
+
+            self.trigger_reasons[reason] += 1
+            self._candidate = thumb
+            return True, score
+
+    def accept(self, result):
+        """Record the result of the inference that check() asked for; it becomes the new reference"""
+        with self._lock:
+            self._reference = self._candidate
+            self.last_result = result
+            self.last_inference_at = time.time()
+
+    def get_stats(self):
+        with self._lock:
+            checked = self.frames_checked
+            return {
+                **self.settings,
+                'frames_checked': checked,
+                'frames_skipped': self.frames_skipped,
+                'skip_ratio': round(self.frames_skipped / checked, 3) if checked else 0,
+                'trigger_reasons': dict(self.trigger_reasons),
+                'last_motion_score': round(self.last_motion_score, 4),
+                'average_check_ms': round(self._check_ms_total / checked, 3) if checked else 0
+            }
+
+
+class MotionGateRegistry:
+    """Per-camera gates with per-camera setting overrides"""
+
+    def __init__(self, **defaults):
+        self.defaults = dict(DEFAULT_SETTINGS, **defaults)
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def gate(self, camera_id):
+        with self._lock:
+            gate = self._gates.get(camera_id)
+            if gate is None:
+                gate = MotionGate(camera_id, **self.defaults)
+                self._gates[camera_id] = gate
+            return gate
+
+    def configure(self, camera_id, **settings):
+        """Update settings for one camera (raises ValueError for unknown keys or bad values)"""
+        self.gate(camera_id).configure(**settings)
+
+    def get_stats(self):
+        with self._lock:
+            gates = dict(self._gates)
+        return {camera_id: gate.get_stats() for camera_id, gate in gates.items()}
@@ -0,0 +1,141 @@
+"""
+Vectorized Detection Post-Processing
+Class filtering, box geometry, orientation and counts computed on whole arrays,
+shared by /detect and the stream workers
+"""
+
+from collections import namedtuple
+import numpy as np
+
+ORIENTATIONS = ('front', 'back', 'left', 'right', 'unknown')
+
+# Aspect ratio above which a box is treated as a side view
+SIDE_VIEW_ASPECT_RATIO = 1.4
+
+# Column-oriented vehicle detections for one image (original image coordinates)
+#   boxes: (N, 4) xyxy, scores: (N,), type_ids: (N,) index into vehicle_types,
+#   width/height/center_x/center_y/area/aspect_ratio: (N,), orientation_ids: (N,) index into ORIENTATIONS
+FrameDetections = namedtuple('FrameDetections', [
+    'boxes', 'scores', 'type_ids', 'width', 'height', 'center_x', 'center_y',
+    'area', 'aspect_ratio', 'orientation_ids', 'image_shape'
+])
+
+
+class DetectionPostprocessor:
+    """
+    Turns raw model detections into vehicle detections
+
+    Vehicle classes are filtered through a lookup table indexed by class id, so the
+    whole result is processed with a handful of NumPy operations instead of per-box
+    Python code.
+    """
+
+    def __init__(self, vehicle_classes):
+        """
+        Args:
+            vehicle_classes: Model class id -> vehicle type name (e.g. VEHICLE_CLASSES in app.py)
+        """
+        self.vehicle_types = list(dict.fromkeys(vehicle_classes.values()))
+        self.lookup = np.full(max(vehicle_classes) + 1, -1, dtype=np.int64)
+        for cls_id, name in vehicle_classes.items():
+            self.lookup[cls_id] = self.vehicle_types.index(name)
+
+    def process(self, detections, image_shape, scale=1.0, offset=(0, 0)):
+        """
+        Filter to vehicle classes and derive geometry and orientation
+
+        Args:
+            detections: backends.Detections for one image
+            image_shape: Shape of the original image (h, w, ...)
+            scale: Scale that was applied to the image before inference (boxes are divided by it)
+            offset: (x, y) of the crop the model saw within the original image (added after scaling)
+
+        Returns: FrameDetections
+        """
+        class_ids = detections.class_ids
+        in_table = class_ids < len(self.lookup)
+        type_ids = np.full(len(class_ids), -1, dtype=np.int64)
+        type_ids[in_table] = self.lookup[class_ids[in_table]]
+        keep = type_ids >= 0
+
+        boxes = detections.boxes[keep].astype(np.float64)
+        if scale != 1.0:
+            boxes /= scale
+        if offset != (0, 0):
+            boxes += [offset[0], offset[1], offset[0], offset[1]]
+        return self.build(boxes, detections.scores[keep].astype(np.float64), type_ids[keep], image_shape)
+
+    def build(self, boxes, scores, type_ids, image_shape):
+        """
+        Derive geometry and orientation for vehicle boxes that are already in image coordinates
+        (e.g. boxes propagated by the tracker)
+        """
+        width = boxes[:, 2] - boxes[:, 0]
+        height = boxes[:, 3] - boxes[:, 1]
+        center_x = (boxes[:, 0] + boxes[:, 2]) / 2
+        center_y = (boxes[:, 1] + boxes[:, 3]) / 2
+        area = width * height
+        aspect_ratio = np.divide(width, height, out=np.ones_like(width), where=height > 0)
+
+        # Orientation heuristic: side views are wide (left/right by horizontal position),
+        # front/back views are squarer (front/back by vertical position)
+        img_h, img_w = image_shape[:2]
+        orientation_ids = np.where(
+            aspect_ratio > SIDE_VIEW_ASPECT_RATIO,
+            np.where(center_x < img_w / 2, 2, 3),
+            np.where(center_y < img_h / 2, 0, 1)
+        )
+
+        return FrameDetections(boxes, scores, type_ids, width, height, center_x, center_y,
+                               area, aspect_ratio, orientation_ids, image_shape)
+
+    def select(self, frame, keep):
+        """Subset of the detections (boolean mask or index array)"""
+        return FrameDetections(*(column[keep] for column in frame[:-1]), frame.image_shape)
+
+    def vehicle_counts(self, frame):
+        counts = np.bincount(frame.type_ids, minlength=len(self.vehicle_types))
+        return dict(zip(self.vehicle_types, counts.tolist()))
+
+    def orientation_counts(self, frame):
+        counts = np.bincount(frame.orientation_ids, minlength=len(ORIENTATIONS))
+        return dict(zip(ORIENTATIONS, counts.tolist()))
+
+    def to_list(self, frame, detailed=True):
+        """
+        Convert to the per-detection JSON shape
+
+        Args:
+            detailed: Include orientation and derived bbox geometry (the /detect shape);
+                      False gives the compact stream shape (class, confidence, corners)
+        """
+        names = [self.vehicle_types[i] for i in frame.type_ids.tolist()]
+        scores = frame.scores.tolist()
+        boxes = frame.boxes.tolist()
+
+        if not detailed:
+            return [
+                {'class': name, 'confidence': conf,
+                 'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}}
+                for name, conf, (x1, y1, x2, y2) in zip(names, scores, boxes)
+            ]
+
+        orientations = [ORIENTATIONS[i] for i in frame.orientation_ids.tolist()]
+        geometry = np.column_stack([frame.width, frame.height, frame.center_x, frame.center_y,
+                                    frame.area, frame.aspect_ratio]).tolist()
+        return [
+            {
+                'class': name,
+                'confidence': conf,
+                'orientation': orientation,
+                'bbox': {
+                    'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+                    'width': w, 'height': h,
+                    'center_x': cx, 'center_y': cy,
+                    'area': area,
+                    'aspect_ratio': aspect
+                }
+            }
+            for name, conf, orientation, (x1, y1, x2, y2), (w, h, cx, cy, area, aspect)
+            in zip(names, scores, orientations, boxes, geometry)
+        ]
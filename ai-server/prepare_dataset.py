@@ -4,11 +4,26 @@ Splits collected images into train/val/test sets and creates YOLO format labels
 """
 
 import os
+import json
 import shutil
-import random
-from pathlib import Path
+import hashlib
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import yaml
 
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, hardlinks or copies only
+    fcntl = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SPLITS = ('train', 'val', 'test')
+MANIFEST_NAME = 'split_manifest.json'
+LINK_MODES = ('auto', 'reflink', 'hardlink', 'copy')
+FICLONE = 0x40049409  # Linux ioctl that clones a file's extents
+
 def create_directory_structure(base_dir='datasets/toy_cars'):
     """
     Create YOLO dataset directory structure
@@ -27,38 +42,134 @@ def create_directory_structure(base_dir='datasets/toy_cars'):
         print(f"✅ Created: {d}")
 
 
+def file_hash(path, chunk_size=1 << 20):
+    """Content hash of a file (BLAKE2b, 128-bit)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_key(rel_path, seed=0):
+    """Stable pseudo-random sort key for an image (same order on every run and machine)"""
+    return hashlib.blake2b(f'{seed}:{rel_path}'.encode(), digest_size=8).hexdigest()
+
+
+def _reflink(src, dst):
+    """Copy-on-write clone (Btrfs, XFS, APFS-style filesystems on Linux); raises OSError if unsupported"""
+    if fcntl is None:
+        raise OSError('reflinks are not supported on this platform')
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def place_file(src, dst, mode='auto'):
+    """
+    Put a copy of src at dst without duplicating its data where the filesystem allows it
+    'auto' tries a reflink, then a hardlink, then a plain copy; an explicit mode still falls back to copy
+    Returns: the method used
+    """
+    methods = ['reflink', 'hardlink', 'copy'] if mode == 'auto' else list(dict.fromkeys([mode, 'copy']))
+    tmp = dst + '.tmp'
+    for method in methods:
+        try:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if method == 'reflink':
+                _reflink(src, tmp)
+            elif method == 'hardlink':
+                os.link(src, tmp)
+            else:
+                shutil.copy2(src, tmp)
+            os.replace(tmp, dst)  # Atomic, so an interrupted run never leaves a half-written image
+            return method
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if method == methods[-1]:
+                raise
+
+
+def load_manifest(dest_dir):
+    path = os.path.join(dest_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('files', {})
+
+
+def save_manifest(dest_dir, files):
+    path = os.path.join(dest_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': 1, 'updated': datetime.now().isoformat(), 'files': files}, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def assign_splits(keys, existing, ratios):
+    """
+    Assign new images to the split furthest below its target share
+    Images that already have a split keep it; new ones are taken in split_key order,
+    so a fresh dataset gets exact ratios and adding images never moves old ones
+    """
+    counts = {name: sum(1 for split in existing.values() if split == name) for name in SPLITS}
+    assigned = {}
+    for rel in sorted(keys, key=lambda k: keys[k]):
+        n = sum(counts.values()) + 1
+        split = max(SPLITS, key=lambda name: ratios[name] * n - counts[name])
+        counts[split] += 1
+        assigned[rel] = split
+    return assigned
+
+
 def split_dataset(source_dir='datasets/toy_cars/images', 
                   dest_dir='datasets/toy_cars',
                   train_ratio=0.7, 
                   val_ratio=0.2, 
-                  test_ratio=0.1):
+                  test_ratio=0.1,
+                  link_mode='auto',
+                  workers=None,
+                  seed=0,
+                  resplit=False,
+                  prune=False):
     """
     Split images into train/val/test sets
     
+    Incremental: a manifest (dest_dir/split_manifest.json) records every image's hash,
+    size, modification time and split, so re-runs only place new or changed images.
+    Images whose source was deleted stay in the manifest (marked removed) until --prune
+    deletes their split copies.
+    Images are hardlinked/reflinked instead of copied where possible, on a thread pool.
+    Existing label files are never overwritten.
+    
     Args:
         source_dir: Source directory with angle subdirectories
         dest_dir: Destination base directory
         train_ratio: Proportion for training (0.7 = 70%)
         val_ratio: Proportion for validation (0.2 = 20%)
         test_ratio: Proportion for testing (0.1 = 10%)
+        link_mode: 'auto', 'reflink', 'hardlink' or 'copy'
+        workers: Threads for hashing and placing files (default: 4 per CPU, max 32)
+        seed: Changes the split order (the same seed always gives the same split)
+        resplit: Reassign every image instead of keeping its recorded split
+        prune: Delete split images whose source image no longer exists (labels are kept)
+    
+    Returns: dict with the per-split counts and what this run did
     """
     
     angles = ['front', 'back', 'left', 'right']
-    class_map = {
-        'front': 0,
-        'back': 1,
-        'left': 2,
-        'right': 3
-    }
+    ratios = {'train': train_ratio, 'val': val_ratio, 'test': test_ratio}
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
     
     print("\n" + "="*60)
     print("SPLITTING DATASET")
     print("="*60)
     
-    total_train = 0
-    total_val = 0
-    total_test = 0
+    started = time.perf_counter()
+    manifest = load_manifest(dest_dir)
     
+    # Scan the sources (one scandir per angle, stat info comes with the directory listing)
+    sources = {}  # "angle/file" -> (path, size, mtime_ns)
     for angle in angles:
         angle_dir = os.path.join(source_dir, angle)
         
@@ -66,65 +177,136 @@ def split_dataset(source_dir='datasets/toy_cars/images',
             print(f"⚠️  {angle}: Directory not found, skipping")
             continue
         
-        # Get all image files
-        image_files = [f for f in os.listdir(angle_dir) 
-                      if f.endswith(('.jpg', '.jpeg', '.png'))]
-        
-        if not image_files:
-            print(f"⚠️  {angle}: No images found, skipping")
+        with os.scandir(angle_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    sources[f'{angle}/{entry.name}'] = (entry.path, stat.st_size, stat.st_mtime_ns)
+    
+    # Only new images and images whose size or mtime changed are hashed
+    def unchanged(rel):
+        old = manifest.get(rel)
+        _, size, mtime_ns = sources[rel]
+        return old is not None and old['size'] == size and old['mtime_ns'] == mtime_ns
+    
+    to_hash = [rel for rel in sources if not unchanged(rel)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = dict(zip(to_hash, pool.map(lambda rel: file_hash(sources[rel][0]), to_hash)))
+    
+    # Stable split assignment per angle, so every orientation gets the same ratios
+    splits = {}
+    for angle in angles:
+        rels = [rel for rel in sources if rel.startswith(angle + '/')]
+        if not rels:
+            if os.path.exists(os.path.join(source_dir, angle)):
+                print(f"⚠️  {angle}: No images found, skipping")
             continue
+        existing = {} if resplit else {rel: manifest[rel]['split'] for rel in rels if rel in manifest}
+        new = {rel: split_key(rel, seed) for rel in rels if rel not in existing}
+        splits.update(existing)
+        splits.update(assign_splits(new, existing, ratios))
+    
+    # Plan the file operations
+    placements = []  # (rel, src, dst, old image path to remove or None)
+    files = {}
+    stats = {'new': 0, 'changed': 0, 'moved': 0, 'restored': 0, 'unchanged': 0, 'labels_created': 0}
+    for rel, (path, size, mtime_ns) in sources.items():
+        old = manifest.get(rel)
+        split = splits[rel]
+        img_file = os.path.basename(rel)
+        dst_img = os.path.join(dest_dir, 'images', split, img_file)
+        content_hash = hashes.get(rel) or old['hash']
+        files[rel] = {'hash': content_hash, 'size': size, 'mtime_ns': mtime_ns, 'split': split,
+                      'method': old.get('method') if old else None}
         
-        # Shuffle for random split
-        random.shuffle(image_files)
-        
-        # Calculate split indices
-        total = len(image_files)
-        train_end = int(total * train_ratio)
-        val_end = train_end + int(total * val_ratio)
-        
-        train_files = image_files[:train_end]
-        val_files = image_files[train_end:val_end]
-        test_files = image_files[val_end:]
-        
-        # Copy files to respective directories
-        class_id = class_map[angle]
-        
-        for split_name, split_files in [('train', train_files), 
-                                         ('val', val_files), 
-                                         ('test', test_files)]:
-            for img_file in split_files:
-                # Copy image
-                src_img = os.path.join(angle_dir, img_file)
-                dst_img = os.path.join(dest_dir, 'images', split_name, img_file)
-                shutil.copy2(src_img, dst_img)
-                
-                # Create placeholder label file (you'll need to label these properly)
-                # For now, create empty label files - you need to label them with bounding boxes
-                label_file = os.path.splitext(img_file)[0] + '.txt'
-                label_path = os.path.join(dest_dir, 'labels', split_name, label_file)
-                
-                # Note: This creates an empty label file
-                # You MUST label these images with actual bounding boxes using labelImg or similar
-                with open(label_path, 'w') as f:
-                    # Empty file - needs manual labeling
-                    # Format should be: class_id center_x center_y width height (normalized 0-1)
-                    # Example: 0 0.5 0.5 0.3 0.2
-                    pass
-        
-        total_train += len(train_files)
-        total_val += len(val_files)
-        total_test += len(test_files)
-        
-        print(f"✅ {angle:8s}: {len(train_files):3d} train, {len(val_files):3d} val, {len(test_files):3d} test")
+        if old is None:
+            stats['new'] += 1
+        elif old['split'] != split:
+            stats['moved'] += 1
+        elif old['hash'] != content_hash:
+            stats['changed'] += 1
+        elif os.path.exists(dst_img):
+            stats['unchanged'] += 1
+            continue
+        else:
+            stats['restored'] += 1  # Split image was deleted
+        moved_from = (os.path.join(dest_dir, 'images', old['split'], img_file)
+                      if old is not None and old['split'] != split else None)
+        placements.append((rel, path, dst_img, moved_from))
     
+    def place(item):
+        rel, src, dst, moved_from = item
+        method = place_file(src, dst, link_mode)
+        if moved_from and os.path.exists(moved_from):
+            os.remove(moved_from)
+        return rel, method
+    
+    methods = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rel, method in pool.map(place, placements):
+            files[rel]['method'] = method
+            methods[method] = methods.get(method, 0) + 1
+    
+    # Labels: move with their image when the split changed, create empty placeholders for
+    # images without one, and never touch a label that already exists
+    for rel, split in splits.items():
+        label_file = os.path.splitext(os.path.basename(rel))[0] + '.txt'
+        label_path = os.path.join(dest_dir, 'labels', split, label_file)
+        if os.path.exists(label_path):
+            continue
+        old = manifest.get(rel)
+        old_label = os.path.join(dest_dir, 'labels', old['split'], label_file) if old else None
+        if old_label and old['split'] != split and os.path.exists(old_label):
+            os.replace(old_label, label_path)
+            continue
+        # Empty file - needs manual labeling
+        # Format should be: class_id center_x center_y width height (normalized 0-1)
+        # Example: 0 0.5 0.5 0.3 0.2
+        open(label_path, 'w').close()
+        stats['labels_created'] += 1
+    
+    # Images whose source is gone: kept in the manifest (marked removed) until pruned,
+    # so a later --prune still knows which split copies to delete
+    removed = [rel for rel in manifest if rel not in sources]
+    for rel in removed:
+        if prune:
+            stale = os.path.join(dest_dir, 'images', manifest[rel]['split'], os.path.basename(rel))
+            if os.path.exists(stale):
+                os.remove(stale)
+        else:
+            files[rel] = dict(manifest[rel], removed=True)
+    
+    save_manifest(dest_dir, files)
+    
+    # Summary straight from the assignment (no directory re-listing)
+    totals = {name: 0 for name in SPLITS}
+    for angle in angles:
+        counts = {name: 0 for name in SPLITS}
+        for rel, split in splits.items():
+            if rel.startswith(angle + '/'):
+                counts[split] += 1
+        if sum(counts.values()):
+            print(f"✅ {angle:8s}: {counts['train']:3d} train, {counts['val']:3d} val, {counts['test']:3d} test")
+        for name in SPLITS:
+            totals[name] += counts[name]
+    
+    elapsed = time.perf_counter() - started
     print("="*60)
-    print(f"Total split: {total_train} train, {total_val} val, {total_test} test")
+    print(f"Total split: {totals['train']} train, {totals['val']} val, {totals['test']} test")
+    print(f"This run: {stats['new']} new, {stats['changed']} changed, {stats['moved']} moved, "
+          f"{stats['restored']} restored, {stats['unchanged']} unchanged, {len(removed)} removed{' (pruned)' if removed and prune else ''} "
+          f"in {elapsed:.1f}s")
+    if methods:
+        print(f"Placed by: {', '.join(f'{method} {count}' for method, count in sorted(methods.items()))}")
     print("="*60)
-    print("\n⚠️  IMPORTANT: Label files created but are EMPTY!")
-    print("   You must label the images with bounding boxes using:")
-    print("   - labelImg: pip install labelImg")
-    print("   - Roboflow: https://roboflow.com (recommended)")
-    print("   - CVAT: https://cvat.org")
+    if stats['labels_created']:
+        print(f"\n⚠️  IMPORTANT: {stats['labels_created']} label files created but are EMPTY!")
+        print("   You must label the images with bounding boxes using:")
+        print("   - labelImg: pip install labelImg")
+        print("   - Roboflow: https://roboflow.com (recommended)")
+        print("   - CVAT: https://cvat.org")
+    
+    return {'splits': totals, 'removed': len(removed), 'methods': methods, 'seconds': round(elapsed, 2), **stats}
 
 
 def create_data_yaml(base_dir='datasets/toy_cars'):
@@ -170,21 +352,39 @@ def create_classes_file(base_dir='datasets/toy_cars'):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Split collected toy car images into train/val/test')
+    parser.add_argument('--source', type=str, default='datasets/toy_cars/images',
+                       help='Directory with the angle subdirectories')
+    parser.add_argument('--dest', type=str, default='datasets/toy_cars', help='Dataset directory')
+    parser.add_argument('--train', type=float, default=0.7, help='Training share')
+    parser.add_argument('--val', type=float, default=0.2, help='Validation share')
+    parser.add_argument('--test', type=float, default=0.1, help='Test share')
+    parser.add_argument('--link', type=str, choices=LINK_MODES, default='auto',
+                       help='How split images are created (auto: reflink, else hardlink, else copy)')
+    parser.add_argument('--workers', type=int, default=None, help='Threads for hashing and linking')
+    parser.add_argument('--seed', type=int, default=0, help='Split seed (same seed, same split)')
+    parser.add_argument('--resplit', action='store_true',
+                       help='Reassign all images instead of keeping their recorded split')
+    parser.add_argument('--prune', action='store_true',
+                       help='Delete split images whose source image was removed (labels are kept)')
+    args = parser.parse_args()
+    
     print("\n🚗 TOY CAR DATASET PREPARATION TOOL 📦")
     print("="*60)
     
     # Step 1: Create directory structure
     print("\nStep 1: Creating directory structure...")
-    create_directory_structure()
+    create_directory_structure(args.dest)
     
     # Step 2: Split dataset
     print("\nStep 2: Splitting dataset into train/val/test...")
-    split_dataset()
+    split_dataset(args.source, args.dest, args.train, args.val, args.test, link_mode=args.link,
+                  workers=args.workers, seed=args.seed, resplit=args.resplit, prune=args.prune)
     
     # Step 3: Create configuration files
     print("\nStep 3: Creating configuration files...")
-    create_data_yaml()
-    create_classes_file()
+    create_data_yaml(args.dest)
+    create_classes_file(args.dest)
     
     print("\n" + "="*60)
     print("DATASET PREPARATION COMPLETE!")
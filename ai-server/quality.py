@@ -0,0 +1,198 @@
+"""
+Latency-SLO Adaptive Quality Control
+Watches recent request latencies and the inference queue against a latency target and
+steps down through cheaper quality levels under pressure, and back up once there is headroom
+"""
+
+import threading
+import time
+from collections import deque
+
+# Preprocessing profiles from cheapest to most expensive
+PROFILE_COST = ('none', 'fast', 'quality')
+
+# Quality ladder, best first. Each level keeps the savings of the levels above it
+#   augment:      test-time augmentation (~3x forward cost, torch backend only)
+#   max_profile:  most expensive preprocessing profile allowed (None = no cap)
+#   input_size:   model input size (None = the server's AI_INPUT_SIZE)
+#   stream_fps:   fraction of AI_STREAM_MAX_FPS for camera streams
+LEVELS = [
+    {'name': 'full', 'augment': True, 'max_profile': None, 'input_size': None, 'stream_fps': 1.0},
+    {'name': 'no_tta', 'augment': False, 'max_profile': None, 'input_size': None, 'stream_fps': 1.0},
+    {'name': 'fast_preprocessing', 'augment': False, 'max_profile': 'fast', 'input_size': None, 'stream_fps': 1.0},
+    {'name': 'small_input', 'augment': False, 'max_profile': 'fast', 'input_size': 480, 'stream_fps': 1.0},
+    {'name': 'low_stream_fps', 'augment': False, 'max_profile': 'fast', 'input_size': 480, 'stream_fps': 0.5},
+]
+
+
+def cap_profile(profile, max_profile):
+    """The cheaper of a preprocessing profile and the level's cap"""
+    if max_profile is None or profile not in PROFILE_COST:
+        return profile
+    return min(profile, max_profile, key=PROFILE_COST.index)
+
+
+class QualityController:
+    """
+    Picks the quality level from recent latencies
+
+    Requests report their latency with observe(); at most once per eval_interval the
+    controller compares the p95 of the current window with the target:
+      - p95 above the target, or the queue deeper than max_queue_depth -> one level down
+      - p95 below step_up_ratio x target and a short queue for step_up_seconds -> one level up
+    The window restarts after every transition, so each level is judged on its own latencies.
+    """
+
+    def __init__(self, target_ms, levels=LEVELS, queue_depth_fn=None, max_queue_depth=16,
+                 window_seconds=10.0, min_samples=10, min_dwell_seconds=3.0, step_up_ratio=0.6,
+                 step_up_seconds=30.0, eval_interval=1.0, on_change=None):
+        """
+        Args:
+            target_ms: p95 latency target in milliseconds (0 disables the controller: always level 0)
+            levels: Quality ladder, best first
+            queue_depth_fn: Callable returning the current inference queue depth
+            max_queue_depth: Queue depth that counts as pressure on its own
+            window_seconds: How far back latencies are considered
+            min_samples: Observations needed before latency can trigger a step down
+            min_dwell_seconds: Time a level is kept before stepping further down (lets it take effect)
+            step_up_ratio: Fraction of the target p95 must stay under before stepping up
+            step_up_seconds: How long the headroom must last before stepping up
+            eval_interval: Minimum time between evaluations
+            on_change: Callable (old level, new level) run after a transition
+        """
+        self.target_ms = target_ms
+        self.levels = levels
+        self.queue_depth_fn = queue_depth_fn
+        self.max_queue_depth = max_queue_depth
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.min_dwell_seconds = min_dwell_seconds
+        self.step_up_ratio = step_up_ratio
+        self.step_up_seconds = step_up_seconds
+        self.eval_interval = eval_interval
+        self.on_change = on_change
+
+        self.level = 0
+        self._samples = deque(maxlen=4096)  # (time, total ms, {stage: ms})
+        self._lock = threading.Lock()
+        self._last_eval = 0.0
+        self._level_since = time.time()
+        self._headroom_since = None
+        self.transitions = deque(maxlen=20)
+        self.steps_down = 0
+        self.steps_up = 0
+        self.last_p95_ms = None
+
+    @property
+    def enabled(self):
+        return self.target_ms > 0
+
+    def current(self):
+        """Settings of the current level (plus its index as 'level')"""
+        level = self.level
+        return dict(self.levels[level], level=level)
+
+    def observe(self, latency_ms, stages=None):
+        """
+        Report one request's latency (and optionally its per-stage breakdown in ms)
+        deque.append is atomic, so this only takes the lock when an evaluation is due
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        self._samples.append((now, latency_ms, stages))
+        if now - self._last_eval >= self.eval_interval:
+            self.evaluate(now)
+
+    def _window(self, now):
+        cutoff = now - self.window_seconds
+        return [s for s in list(self._samples) if s[0] >= cutoff and s[0] >= self._level_since]
+
+    @staticmethod
+    def _p95(values):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(0.95 * len(values)))]
+
+    def evaluate(self, now=None):
+        """Step the level down or up if the recent latencies call for it"""
+        if not self.enabled:
+            return
+        now = now if now is not None else time.time()
+        with self._lock:
+            if now - self._last_eval < self.eval_interval:
+                return
+            self._last_eval = now
+
+            window = self._window(now)
+            p95 = self._p95([s[1] for s in window]) if window else None
+            self.last_p95_ms = p95
+            queue_depth = self.queue_depth_fn() if self.queue_depth_fn else 0
+
+            if self.level < len(self.levels) - 1 and now - self._level_since >= self.min_dwell_seconds:
+                if queue_depth > self.max_queue_depth:
+                    self._transition(self.level + 1, now, f'queue depth {queue_depth} > {self.max_queue_depth}',
+                                     p95, queue_depth)
+                    return
+                if p95 is not None and len(window) >= self.min_samples and p95 > self.target_ms:
+                    self._transition(self.level + 1, now, self._slow_reason(window, p95), p95, queue_depth)
+                    return
+
+            headroom = (p95 is None or p95 < self.target_ms * self.step_up_ratio) and \
+                queue_depth <= self.max_queue_depth // 4
+            if not headroom or self.level == 0:
+                self._headroom_since = None
+            elif self._headroom_since is None:
+                self._headroom_since = now
+            elif now - self._headroom_since >= self.step_up_seconds:
+                reason = f'p95 {p95:.0f} ms < {self.step_up_ratio:.0%} of target' if p95 is not None else 'idle'
+                self._transition(self.level - 1, now, reason, p95, queue_depth)
+
+    def _slow_reason(self, window, p95):
+        reason = f'p95 {p95:.0f} ms > target {self.target_ms:.0f} ms'
+        stage_totals = {}
+        for _, _, stages in window:
+            for stage, ms in (stages or {}).items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+        if stage_totals:
+            slowest = max(stage_totals, key=stage_totals.get)
+            reason += f' (mostly {slowest}: {stage_totals[slowest] / len(window):.0f} ms avg)'
+        return reason
+
+    def _transition(self, level, now, reason, p95, queue_depth):
+        old = self.level
+        self.level = level
+        self._level_since = now
+        self._headroom_since = None
+        if level > old:
+            self.steps_down += 1
+        else:
+            self.steps_up += 1
+        self.transitions.append({
+            'time': now,
+            'from': self.levels[old]['name'],
+            'to': self.levels[level]['name'],
+            'reason': reason,
+            'p95_ms': round(p95, 2) if p95 is not None else None,
+            'queue_depth': queue_depth
+        })
+        arrow = '⬇️ ' if level > old else '⬆️ '
+        print(f"{arrow} Quality level {old} ({self.levels[old]['name']}) -> {level} ({self.levels[level]['name']}): {reason}")
+        if self.on_change:
+            self.on_change(old, level)
+
+    def get_stats(self):
+        with self._lock:
+            transitions = list(self.transitions)
+        return {
+            'enabled': self.enabled,
+            'target_p95_ms': self.target_ms,
+            'level': self.level,
+            'level_name': self.levels[self.level]['name'],
+            'settings': self.current(),
+            'levels': [level['name'] for level in self.levels],
+            'window_p95_ms': round(self.last_p95_ms, 2) if self.last_p95_ms is not None else None,
+            'max_queue_depth': self.max_queue_depth,
+            'steps_down': self.steps_down,
+            'steps_up': self.steps_up,
+            'recent_transitions': transitions
+        }
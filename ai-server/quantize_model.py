@@ -0,0 +1,298 @@
+"""
+Post-Training INT8 Quantization for the Toy Car Model
+Quantizes a trained model with a calibration subset of the validation images,
+compares accuracy and latency against FP32, and only publishes the INT8 model
+if the accuracy drop stays within the allowed threshold
+"""
+
+import os
+import json
+import shutil
+import time
+from pathlib import Path
+from datetime import datetime
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+from backends import load_backend, letterbox, to_blob
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def list_images(image_dir, limit=None):
+    """Sorted image paths, evenly sampled down to `limit` for a deterministic subset"""
+    paths = sorted(p for p in Path(image_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if limit and len(paths) > limit:
+        step = len(paths) / limit
+        paths = [paths[int(i * step)] for i in range(limit)]
+    return paths
+
+
+def quantize_openvino(weights, data_yaml, staging_dir, img_size, calib_fraction):
+    """
+    INT8 OpenVINO model via Ultralytics export (NNCF post-training quantization)
+    NNCF calibrates on the `val` split of the dataset YAML
+    Returns: (FP32 IR directory, INT8 IR directory); the FP32 export is the latency baseline
+    """
+    exports = {}
+    for precision, int8 in (('fp32', False), ('int8', True)):
+        # Separate copies so the two exports cannot land in the same output directory
+        staged = os.path.join(staging_dir, precision, 'model.pt')
+        os.makedirs(os.path.dirname(staged), exist_ok=True)
+        shutil.copy2(weights, staged)
+        exports[precision] = YOLO(staged).export(format='openvino', int8=int8, data=data_yaml,
+                                                 fraction=calib_fraction, imgsz=img_size, dynamic=True)
+    return exports['fp32'], exports['int8']
+
+
+def quantize_onnx(weights, calib_paths, staging_dir, img_size):
+    """
+    INT8 ONNX model via ONNX Runtime static quantization (QDQ, per-channel weights)
+    Calibrates on the given images, preprocessed exactly like the server does
+    Returns: (FP32 .onnx path, INT8 .onnx path); the FP32 export is the latency baseline
+    """
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+
+    staged = os.path.join(staging_dir, 'model.pt')
+    shutil.copy2(weights, staged)
+    fp32_path = YOLO(staged).export(format='onnx', imgsz=img_size, dynamic=True)
+    int8_path = os.path.join(staging_dir, 'model_int8.onnx')
+
+    class ValCalibrationReader(CalibrationDataReader):
+        def __init__(self, paths, input_name):
+            self.paths = iter(paths)
+            self.input_name = input_name
+
+        def get_next(self):
+            for path in self.paths:
+                img = cv2.imread(str(path))
+                if img is not None:
+                    return {self.input_name: to_blob([letterbox(img, img_size)[0]])}
+            return None
+
+    fp32_model = onnx.load(fp32_path)
+    input_name = fp32_model.graph.input[0].name
+    quantize_static(fp32_path, int8_path, ValCalibrationReader(calib_paths, input_name),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # Keep the Ultralytics metadata (class names, stride, imgsz) so the model can be validated/served
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    return fp32_path, int8_path
+
+
+def evaluate_accuracy(model_path, data_yaml, img_size):
+    """mAP50 / mAP50-95 on the validation split (same metrics as train_custom_model.py)"""
+    metrics = YOLO(model_path, task='detect').val(data=data_yaml, imgsz=img_size, split='val',
+                                                  batch=1, plots=False, verbose=False)
+    return {
+        'map50': round(float(metrics.box.map50), 4),
+        'map50_95': round(float(metrics.box.map), 4),
+        'precision': round(float(metrics.box.mp), 4),
+        'recall': round(float(metrics.box.mr), 4)
+    }
+
+
+def measure_latency(backend, images, warmup=5, **params):
+    """Single-image end-to-end predict() latency percentiles in milliseconds"""
+    for img in images[:warmup]:
+        backend.predict([img], **params)
+    latencies = []
+    for img in images:
+        start = time.perf_counter()
+        backend.predict([img], **params)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        'images': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'mean_ms': round(float(np.mean(latencies)), 2)
+    }
+
+
+def quantize_model(weights='runs/detect/toy_car_detection/weights/best.pt',
+                   data_yaml='datasets/toy_cars/data.yaml',
+                   fmt='openvino',
+                   img_size=640,
+                   calib_images=200,
+                   max_map_drop=0.01,
+                   publish_dir=None,
+                   latency_images=50,
+                   threads=None):
+    """
+    Quantize a trained model to INT8 and publish it only if accuracy holds
+
+    Args:
+        weights: Trained FP32 .pt model
+        data_yaml: Dataset YAML (its val split provides calibration and evaluation images)
+        fmt: 'openvino' (NNCF) or 'onnx' (ONNX Runtime static quantization)
+        img_size: Input image size
+        calib_images: Number of validation images used for calibration
+        max_map_drop: Maximum allowed absolute drop in mAP50 or mAP50-95 versus FP32
+        publish_dir: Where the accepted INT8 model is copied (default: next to the weights)
+        latency_images: Number of validation images used for the latency comparison
+        threads: CPU threads for the latency comparison (None = library default)
+
+    Returns: report dict (also written to <staging dir>/quantization_report.json)
+    """
+
+    print("\n" + "="*80)
+    print("🗜️  INT8 POST-TRAINING QUANTIZATION")
+    print("="*80)
+
+    if not os.path.exists(weights):
+        print(f"❌ Model not found: {weights}")
+        print("   Train the model first using train_custom_model.py")
+        return None
+    if not os.path.exists(data_yaml):
+        print(f"❌ Dataset configuration not found: {data_yaml}")
+        return None
+
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+    val_dir = os.path.join(data.get('path', os.path.dirname(data_yaml)), data['val'])
+    val_paths = list_images(val_dir)
+    if not val_paths:
+        print(f"❌ No validation images found in {val_dir}")
+        return None
+
+    calib_paths = list_images(val_dir, calib_images)
+    staging_dir = os.path.join('runs', 'quantize', datetime.now().strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(staging_dir, exist_ok=True)
+    publish_dir = publish_dir or os.path.dirname(weights)
+
+    print("\n📊 Configuration:")
+    print(f"   Model: {weights}")
+    print(f"   Format: {fmt}")
+    print(f"   Calibration images: {len(calib_paths)} of {len(val_paths)} in {val_dir}")
+    print(f"   Max mAP drop: {max_map_drop}")
+    print(f"   Staging: {staging_dir}")
+
+    # Step 1: Quantize
+    print("\n🔧 Quantizing...")
+    if fmt == 'openvino':
+        fp32_path, int8_path = quantize_openvino(weights, data_yaml, staging_dir, img_size,
+                                                 calib_fraction=min(1.0, len(calib_paths) / len(val_paths)))
+    elif fmt == 'onnx':
+        fp32_path, int8_path = quantize_onnx(weights, calib_paths, staging_dir, img_size)
+    else:
+        print(f"❌ Unsupported format: {fmt}")
+        return None
+    print(f"   FP32 model: {fp32_path}")
+    print(f"   INT8 model: {int8_path}")
+
+    # Step 2: Accuracy (FP32 vs INT8)
+    print("\n📈 Evaluating accuracy on validation split...")
+    fp32_acc = evaluate_accuracy(weights, data_yaml, img_size)
+    int8_acc = evaluate_accuracy(int8_path, data_yaml, img_size)
+
+    # Step 3: Latency (FP32 vs INT8 in the same runtime, so the speedup is the quantization's alone;
+    # PyTorch eager is timed too as the current server baseline), server detection parameters
+    print("\n⏱️  Measuring latency...")
+    images = [img for img in (cv2.imread(str(p)) for p in list_images(val_dir, latency_images)) if img is not None]
+    params = dict(conf=0.3, iou=0.4, max_det=20, agnostic_nms=True)
+    torch_lat = measure_latency(load_backend('torch', weights, imgsz=img_size, threads=threads), images, **params)
+    fp32_lat = measure_latency(load_backend(fmt, fp32_path, imgsz=img_size, threads=threads), images, **params)
+    int8_lat = measure_latency(load_backend(fmt, int8_path, imgsz=img_size, threads=threads), images, **params)
+
+    map50_drop = round(fp32_acc['map50'] - int8_acc['map50'], 4)
+    map_drop = round(fp32_acc['map50_95'] - int8_acc['map50_95'], 4)
+    passed = map50_drop <= max_map_drop and map_drop <= max_map_drop
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'weights': weights,
+        'format': fmt,
+        'int8_model': str(int8_path),
+        'calibration_images': len(calib_paths),
+        'fp32_model': str(fp32_path),
+        'torch': {'latency': torch_lat},
+        'fp32': {'accuracy': fp32_acc, 'latency': fp32_lat},
+        'int8': {'accuracy': int8_acc, 'latency': int8_lat},
+        'map50_drop': map50_drop,
+        'map50_95_drop': map_drop,
+        'max_map_drop': max_map_drop,
+        'speedup_p50': round(fp32_lat['p50_ms'] / int8_lat['p50_ms'], 2) if int8_lat['p50_ms'] else None,
+        'speedup_vs_torch_p50': round(torch_lat['p50_ms'] / int8_lat['p50_ms'], 2) if int8_lat['p50_ms'] else None,
+        'passed': passed,
+        'published_to': None
+    }
+
+    print("\n" + "="*80)
+    print("QUANTIZATION REPORT")
+    print("="*80)
+    print(f"{'':16s} {'mAP50':>8s} {'mAP50-95':>9s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    for name, acc, lat in [('FP32 ' + fmt, fp32_acc, fp32_lat), ('INT8 ' + fmt, int8_acc, int8_lat)]:
+        print(f"{name:16s} {acc['map50']:8.4f} {acc['map50_95']:9.4f} {lat['p50_ms']:8.2f} {lat['p95_ms']:8.2f}")
+    print(f"{'FP32 torch':16s} {'':8s} {'':9s} {torch_lat['p50_ms']:8.2f} {torch_lat['p95_ms']:8.2f}   (current server)")
+    print(f"\nmAP50 drop: {map50_drop}   mAP50-95 drop: {map_drop}   (allowed: {max_map_drop})")
+    print(f"Speedup (p50): {report['speedup_p50']}x vs FP32 {fmt}, {report['speedup_vs_torch_p50']}x vs FP32 torch")
+
+    # Step 4: Publish only if accuracy holds
+    if passed:
+        if fmt == 'onnx':
+            target = os.path.join(publish_dir, Path(weights).stem + '_int8.onnx')
+            shutil.copy2(int8_path, target)
+        else:
+            target = os.path.join(publish_dir, Path(weights).stem + '_int8_openvino_model')
+            shutil.copytree(int8_path, target, dirs_exist_ok=True)
+        report['published_to'] = target
+        print(f"\n✅ Accuracy within threshold - published: {target}")
+        print(f"   AI_BACKEND={fmt} AI_MODEL_PATH={target} python app.py")
+    else:
+        print(f"\n❌ Accuracy drop exceeds {max_map_drop} - INT8 model NOT published")
+        print(f"   Staged model kept for inspection: {int8_path}")
+
+    report_path = os.path.join(staging_dir, 'quantization_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Report: {report_path}")
+    print("="*80 + "\n")
+
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Quantize the trained toy car model to INT8')
+    parser.add_argument('--weights', type=str, default='runs/detect/toy_car_detection/weights/best.pt',
+                       help='Trained FP32 model')
+    parser.add_argument('--data', type=str, default='datasets/toy_cars/data.yaml',
+                       help='Dataset YAML (val split used for calibration and evaluation)')
+    parser.add_argument('--format', type=str, choices=['openvino', 'onnx'], default='openvino',
+                       help='INT8 runtime format')
+    parser.add_argument('--imgsz', type=int, default=640,
+                       help='Input image size')
+    parser.add_argument('--calib-images', type=int, default=200,
+                       help='Number of validation images for calibration')
+    parser.add_argument('--max-map-drop', type=float, default=0.01,
+                       help='Max allowed absolute mAP50 / mAP50-95 drop before refusing to publish')
+    parser.add_argument('--publish-dir', type=str, default=None,
+                       help='Where to publish the accepted INT8 model (default: next to weights)')
+    parser.add_argument('--latency-images', type=int, default=50,
+                       help='Number of images for the latency comparison')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='CPU threads for the latency comparison')
+
+    args = parser.parse_args()
+
+    report = quantize_model(
+        weights=args.weights,
+        data_yaml=args.data,
+        fmt=args.format,
+        img_size=args.imgsz,
+        calib_images=args.calib_images,
+        max_map_drop=args.max_map_drop,
+        publish_dir=args.publish_dir,
+        latency_images=args.latency_images,
+        threads=args.threads
+    )
+    sys.exit(0 if report and report['passed'] else 1)
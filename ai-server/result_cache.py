@@ -0,0 +1,121 @@
+"""
+Content-Addressed Detection Result Cache
+Byte-identical uploads (and optionally visually identical frames) reuse the
+serialized response of an earlier detection instead of running the pipeline again
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+def content_key(data, *params):
+    """Cache key for raw upload bytes plus everything else that shapes the response"""
+    return (hashlib.blake2b(data, digest_size=16).digest(),) + params
+
+
+def perceptual_hash(img):
+    """
+    64-bit difference hash of a decoded frame
+    Re-encoded or slightly noisy copies of the same scene hash identically
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a time-to-live
+
+    Entries are evicted when they expire, or least recently used first when the
+    entry count or the total size of the cached responses exceeds its limit.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl_seconds=10.0):
+        """
+        Args:
+            max_entries: Maximum number of cached results (0 disables the cache)
+            max_bytes: Maximum total size of the cached responses
+            ttl_seconds: How long a result may be reused
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = {}
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key, kind='exact'):
+        """Cached value or None; `kind` labels the hit in the statistics"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return entry[2]
+
+    def miss(self):
+        """Count a request that no key matched"""
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key, value, size):
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Drop every entry (e.g. after a setting that changes results)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            lookups = hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
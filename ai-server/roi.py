@@ -0,0 +1,124 @@
+"""
+Per-Camera Regions of Interest
+ROI polygons (normalized 0-1 coordinates) are persisted server-side as JSON.
+Frames are cropped to the polygon's bounding rectangle before preprocessing
+and inference, and detections whose center lies outside the polygon are dropped
+"""
+
+import json
+import os
+import threading
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# Pixel-space ROI for one frame size
+#   x0, y0, x1, y1: crop rectangle (x1/y1 exclusive), mask: uint8 polygon mask over the crop
+RoiRegion = namedtuple('RoiRegion', ['x0', 'y0', 'x1', 'y1', 'mask'])
+
+
+def validate_polygon(polygon):
+    """
+    Check and normalize an ROI polygon
+
+    Args:
+        polygon: Sequence of at least 3 [x, y] points with coordinates in 0..1
+
+    Returns: list of [x, y] float pairs
+    """
+    try:
+        points = [[float(x), float(y)] for x, y in polygon]
+    except (TypeError, ValueError):
+        raise ValueError('ROI polygon must be a list of [x, y] points')
+    if len(points) < 3:
+        raise ValueError('ROI polygon needs at least 3 points')
+    if any(not (0.0 <= v <= 1.0) for point in points for v in point):
+        raise ValueError('ROI coordinates are normalized and must be between 0 and 1')
+    return points
+
+
+def compute_region(polygon, shape):
+    """Crop rectangle and polygon mask of a normalized polygon for a frame of the given shape"""
+    h, w = shape[:2]
+    pts = np.round(np.asarray(polygon) * [w - 1, h - 1]).astype(np.int32)
+    x0, y0 = pts.min(axis=0)
+    x1, y1 = pts.max(axis=0) + 1
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.fillPoly(mask, [pts - [x0, y0]], 1)
+    return RoiRegion(int(x0), int(y0), int(x1), int(y1), mask)
+
+
+def crop(img, region):
+    """View of the ROI's bounding rectangle (no copy)"""
+    return img[region.y0:region.y1, region.x0:region.x1]
+
+
+def inside(region, xs, ys):
+    """Boolean array: which full-frame points fall inside the ROI polygon"""
+    h, w = region.mask.shape
+    cols = np.floor(xs).astype(np.int64) - region.x0
+    rows = np.floor(ys).astype(np.int64) - region.y0
+    in_rect = (cols >= 0) & (cols < w) & (rows >= 0) & (rows < h)
+    result = np.zeros(len(cols), dtype=bool)
+    result[in_rect] = region.mask[rows[in_rect], cols[in_rect]] > 0
+    return result
+
+
+class RoiStore:
+    """
+    ROI polygons per camera, persisted to a JSON file
+
+    Pixel regions are computed once per camera and frame size and cached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._polygons = {}
+        self._regions = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    stored = json.load(f)
+                self._polygons = {camera_id: validate_polygon(polygon) for camera_id, polygon in stored.items()}
+                print(f"📐 Loaded ROI for {len(self._polygons)} camera(s) from {path}")
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"⚠️  Could not load ROI file {path}: {str(e)}")
+
+    def get(self, camera_id):
+        with self._lock:
+            return self._polygons.get(camera_id)
+
+    def set(self, camera_id, polygon):
+        """Set (or clear with None) the ROI polygon of a camera and persist all ROIs"""
+        polygon = validate_polygon(polygon) if polygon is not None else None
+        with self._lock:
+            if polygon is None:
+                self._polygons.pop(camera_id, None)
+            else:
+                self._polygons[camera_id] = polygon
+            self._regions = {key: r for key, r in self._regions.items() if key[0] != camera_id}
+            self._save()
+
+    def _save(self):
+        # Write to a temporary file first so a crash never leaves a truncated file
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._polygons, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def region(self, camera_id, shape):
+        """RoiRegion for a camera and frame shape, or None if the camera has no ROI"""
+        if camera_id is None:
+            return None
+        key = (camera_id, shape[:2])
+        with self._lock:
+            region = self._regions.get(key)
+            if region is None:
+                polygon = self._polygons.get(camera_id)
+                if polygon is None:
+                    return None
+                region = compute_region(polygon, shape)
+                self._regions[key] = region
+            return region
@@ -0,0 +1,153 @@
+"""
+Detection Response Formats
+Verbose JSON (default), columnar JSON, MessagePack and packed binary, rendered
+straight from the column-oriented FrameDetections arrays
+"""
+
+import base64
+import json
+import struct
+import threading
+import numpy as np
+from postprocess import ORIENTATIONS
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency
+    msgpack = None
+
+FORMATS = ('json', 'columnar', 'msgpack', 'binary')
+
+MIMETYPES = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.detections.columnar+json',
+    'msgpack': 'application/msgpack',
+    'binary': 'application/vnd.detections+binary',
+}
+
+ACCEPT_ALIASES = {
+    'application/json': 'json',
+    'application/vnd.detections.columnar+json': 'columnar',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.detections+binary': 'binary',
+    'application/octet-stream': 'binary',
+}
+
+# Packed binary layout (little-endian):
+#   b'DET1' | uint32 meta_len | uint32 n | meta (UTF-8 JSON) |
+#   float32[n*4] boxes (x1, y1, x2, y2) | float32[n] confidences |
+#   uint8[n] class_ids | uint8[n] orientation_ids
+BINARY_MAGIC = b'DET1'
+BINARY_HEADER = struct.Struct('<4sII')
+
+
+def negotiate_format(requested=None, accept=None):
+    """
+    Pick the response format: explicit ?format= wins, then the Accept header, then verbose JSON
+
+    Returns: format name, or None if an unsupported format was requested explicitly
+    """
+    if requested:
+        if requested not in FORMATS or (requested == 'msgpack' and msgpack is None):
+            return None
+        return requested
+    for part in (accept or '').split(','):
+        fmt = ACCEPT_ALIASES.get(part.split(';')[0].strip())
+        if fmt and (fmt != 'msgpack' or msgpack is not None):
+            return fmt
+    return 'json'
+
+
+class DetectionSerializer:
+    """Renders a response payload plus FrameDetections in any supported format"""
+
+    def __init__(self, postprocessor):
+        self.postprocessor = postprocessor
+
+    def columns(self, frame, detailed=True, packed=False):
+        """
+        Parallel arrays for the detections
+
+        Args:
+            detailed: Include orientations
+            packed: Boxes and confidences as raw float32 bytes (for MessagePack)
+        """
+        boxes = frame.boxes.astype(np.float32)
+        scores = frame.scores.astype(np.float32)
+        columns = {
+            'classes': self.postprocessor.vehicle_types,
+            'class_ids': frame.type_ids.tolist(),
+            'confidences': scores.tobytes() if packed else np.round(scores, 4).tolist(),
+            'boxes': boxes.tobytes() if packed else np.round(boxes, 1).ravel().tolist(),
+        }
+        if detailed:
+            columns['orientations'] = list(ORIENTATIONS)
+            columns['orientation_ids'] = frame.orientation_ids.tolist()
+        return columns
+
+    def serialize(self, fmt, payload, frame, detailed=True):
+        """
+        Args:
+            fmt: One of FORMATS
+            payload: Response fields except 'detections'
+            frame: FrameDetections
+            detailed: Verbose per-detection geometry/orientation (the /detect shape)
+
+        Returns: (body as str or bytes, mimetype)
+        """
+        if fmt == 'json':
+            body = dict(payload, detections=self.postprocessor.to_list(frame, detailed=detailed))
+            return json.dumps(body), MIMETYPES[fmt]
+
+        if fmt == 'columnar':
+            body = dict(payload, format='columnar', detections=self.columns(frame, detailed))
+            return json.dumps(body, separators=(',', ':')), MIMETYPES[fmt]
+
+        if fmt == 'msgpack':
+            body = dict(payload, format='msgpack', detections=self.columns(frame, detailed, packed=True))
+            return msgpack.packb(body, use_bin_type=True), MIMETYPES[fmt]
+
+        if fmt == 'binary':
+            meta = dict(payload, format='binary', classes=self.postprocessor.vehicle_types,
+                        orientations=list(ORIENTATIONS))
+            meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+            n = len(frame.scores)
+            body = b''.join([
+                BINARY_HEADER.pack(BINARY_MAGIC, len(meta_bytes), n),
+                meta_bytes,
+                frame.boxes.astype('<f4').tobytes(),
+                frame.scores.astype('<f4').tobytes(),
+                frame.type_ids.astype(np.uint8).tobytes(),
+                frame.orientation_ids.astype(np.uint8).tobytes(),
+            ])
+            return body, MIMETYPES[fmt]
+
+        raise ValueError(f"Unknown format '{fmt}'")
+
+
+class StreamEvent:
+    """
+    One stream result, rendered lazily as an SSE message per format
+
+    Each format is serialized at most once and shared by every subscriber that
+    asked for it. Binary formats are base64-encoded since SSE is text-only.
+    """
+
+    def __init__(self, serializer, payload, frame):
+        self.serializer = serializer
+        self.payload = payload
+        self.frame = frame
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def render(self, fmt='json'):
+        with self._lock:
+            message = self._rendered.get(fmt)
+            if message is None:
+                body, _ = self.serializer.serialize(fmt, self.payload, self.frame, detailed=False)
+                if isinstance(body, bytes):
+                    body = base64.b64encode(body).decode('ascii')
+                message = f"data: {body}\n\n"
+                self._rendered[fmt] = message
+            return message
@@ -0,0 +1,244 @@
+"""
+Shared Per-Camera Inference Workers with Pub/Sub Fan-Out
+One background worker per camera infers each new frame exactly once and
+publishes the result to every subscribed SSE client
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class Subscription:
+    """
+    Latest-only mailbox for one stream client
+
+    Slow clients never build up a backlog: a new event replaces any event the
+    client has not picked up yet.
+    """
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self._cond = threading.Condition()
+        self._event = None
+        self.dropped = 0
+
+    def publish(self, event):
+        with self._cond:
+            if self._event is not None:
+                self.dropped += 1
+            self._event = event
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait for the next event, returns None on timeout"""
+        with self._cond:
+            if self._event is None:
+                self._cond.wait(timeout=timeout)
+            event, self._event = self._event, None
+            return event
+
+
+class AsyncSubscription:
+    """
+    Latest-only mailbox for one stream client served from an asyncio event loop
+
+    Publishing happens on the camera worker thread and is handed to the loop,
+    so an idle client costs only a suspended coroutine, not a thread.
+    """
+
+    def __init__(self, camera_id, loop):
+        self.camera_id = camera_id
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._event = None
+        self.dropped = 0
+
+    def publish(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:
+            pass  # Event loop already closed (server shutting down)
+
+    def _deliver(self, event):
+        if self._event is not None:
+            self.dropped += 1
+        self._event = event
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """Wait for the next event, returns None on timeout"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        event, self._event = self._event, None
+        return event
+
+
+class CameraStreamWorker:
+    """
+    Background inference loop for a single camera
+
+    Runs only while the camera has subscribers and skips frames whose sequence
+    number has already been processed.
+    """
+
+    def __init__(self, camera_id, frame_source, process_fn, max_fps=10.0, poll_interval=0.1):
+        """
+        Args:
+            camera_id: Camera identifier
+            frame_source: Callable (camera_id, last_seq, timeout) returning a newer (seq, frame, timestamp) or None
+            process_fn: Callable (camera_id, seq, frame, timestamp) returning the event to publish
+            max_fps: Upper bound on inference rate for this camera
+            poll_interval: How long to wait for a new frame before re-checking for shutdown
+        """
+        self.camera_id = camera_id
+        self.frame_source = frame_source
+        self.process_fn = process_fn
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.poll_interval = poll_interval
+
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.last_seq = None
+        self.frames_processed = 0
+        self.errors = 0
+        self.last_processing_ms = 0.0
+        self.started_at = time.time()
+        self._recent = deque(maxlen=30)  # Completion times of the last frames, for the FPS estimate
+
+        self._thread = threading.Thread(target=self._run, name=f'stream-{camera_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def add(self, subscription):
+        with self._lock:
+            self.subscribers.add(subscription)
+
+    def remove(self, subscription):
+        """Remove a subscriber, returns the number of subscribers left"""
+        with self._lock:
+            self.subscribers.discard(subscription)
+            return len(self.subscribers)
+
+    def set_max_fps(self, max_fps):
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            entry = self.frame_source(self.camera_id, self.last_seq, self.poll_interval)
+            if entry is None:
+                continue
+
+            seq, frame, timestamp = entry
+            start = time.perf_counter()
+            try:
+                event = self.process_fn(self.camera_id, seq, frame, timestamp)
+            except Exception as e:
+                print(f"❌ Stream error ({self.camera_id}): {str(e)}")
+                self.errors += 1
+                event = None
+            elapsed = time.perf_counter() - start
+
+            self.last_seq = seq
+            self.frames_processed += 1
+            self.last_processing_ms = elapsed * 1000
+            self._recent.append(time.perf_counter())
+
+            if event is not None:
+                with self._lock:
+                    subscribers = list(self.subscribers)
+                for subscription in subscribers:
+                    subscription.publish(event)
+
+            # Respect the max FPS for this camera
+            if elapsed < self.min_interval:
+                self._stop.wait(self.min_interval - elapsed)
+
+    def fps(self):
+        """Processing rate over the last few frames (0 if the camera stalled for over a second)"""
+        recent = list(self._recent)
+        if len(recent) < 2 or time.perf_counter() - recent[-1] > 1.0:
+            return 0.0
+        return (len(recent) - 1) / (recent[-1] - recent[0])
+
+    def get_stats(self):
+        with self._lock:
+            subscribers = len(self.subscribers)
+        return {
+            'subscribers': subscribers,
+            'last_frame_seq': self.last_seq,
+            'frames_processed': self.frames_processed,
+            'fps': round(self.fps(), 2),
+            'errors': self.errors,
+            'last_processing_ms': round(self.last_processing_ms, 2),
+            'uptime_seconds': round(time.time() - self.started_at, 1)
+        }
+
+
+class StreamHub:
+    """
+    Registry of per-camera workers
+
+    A worker is started by the first subscriber of a camera and stopped when
+    the last subscriber leaves, so idle cameras use no CPU.
+    """
+
+    def __init__(self, frame_source, process_fn, max_fps=10.0):
+        self.frame_source = frame_source
+        self.process_fn = process_fn
+        self.max_fps = max_fps
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, camera_id, subscription=None):
+        """
+        Subscribe to a camera's results (a thread-blocking Subscription unless one is given,
+        e.g. an AsyncSubscription)
+        """
+        if subscription is None:
+            subscription = Subscription(camera_id)
+        with self._lock:
+            worker = self._workers.get(camera_id)
+            if worker is None:
+                worker = CameraStreamWorker(camera_id, self.frame_source, self.process_fn, max_fps=self.max_fps)
+                self._workers[camera_id] = worker
+                worker.add(subscription)
+                worker.start()
+                print(f"▶️  Stream worker started: {camera_id}")
+            else:
+                worker.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        camera_id = subscription.camera_id
+        with self._lock:
+            worker = self._workers.get(camera_id)
+            if worker is None:
+                return
+            if worker.remove(subscription) == 0:
+                worker.stop()
+                del self._workers[camera_id]
+                print(f"⏹️  Stream worker stopped: {camera_id} (no subscribers)")
+
+    def set_max_fps(self, max_fps):
+        """Change the inference rate cap of all current and future camera workers"""
+        with self._lock:
+            self.max_fps = max_fps
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.set_max_fps(max_fps)
+
+    def get_stats(self):
+        with self._lock:
+            workers = dict(self._workers)
+        return {camera_id: worker.get_stats() for camera_id, worker in workers.items()}
@@ -1,25 +1,196 @@
 """
 Test Custom Model
-Test the trained model on sample images
+Evaluate the trained model on the labeled test images (precision, recall, mAP, latency)
 """
 
 from ultralytics import YOLO
 import cv2
 import os
+import csv
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
+import numpy as np
+from backends import Detections, load_backend, box_iou
+from benchmark import summarize
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CLASS_NAMES = ['toy_car_front', 'toy_car_back', 'toy_car_left', 'toy_car_right']
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)  # mAP50-95 (COCO)
+EVAL_CONF = 0.001  # Detections down to this confidence feed the PR curves (mAP); P/R use conf_threshold
+
+
+def load_batches(paths, batch_size, workers, prefetch=2):
+    """Decode images on a thread pool, yielding (path, image) batches while the next ones decode"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        
+        def fill():
+            while len(pending) < batch_size * (prefetch + 1):
+                path = next(remaining, None)
+                if path is None:
+                    return
+                pending.append((path, pool.submit(cv2.imread, str(path))))
+        
+        fill()
+        while pending:
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            fill()
+            yield [(path, future.result()) for path, future in batch]
+
+
+def label_path_for(img_path, test_dir, label_dir):
+    return Path(label_dir) / Path(img_path).relative_to(test_dir).with_suffix('.txt')
+
+
+def read_ground_truth(label_path, width, height):
+    """YOLO label file -> (xyxy pixel boxes, class ids)"""
+    rows = []
+    if label_path.exists():
+        with open(label_path) as f:
+            rows = [[float(v) for v in line.split()[:5]] for line in f if len(line.split()) >= 5]
+    rows = np.array(rows, np.float32).reshape(-1, 5)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, rows[:, 0].astype(np.int64)
+
+
+def match_detections(pred_boxes, pred_cls, gt_boxes, gt_cls):
+    """
+    True positives per IoU threshold: (P, T) bool for predictions sorted by confidence
+    Each ground-truth box matches at most one prediction of the same class (greedy, highest IoU)
+    """
+    tp = np.zeros((len(pred_boxes), len(IOU_THRESHOLDS)), bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return tp
+    iou = box_iou(pred_boxes, gt_boxes)
+    iou[pred_cls[:, None] != gt_cls[None, :]] = 0
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        matched = np.zeros(len(gt_boxes), bool)
+        for p in range(len(pred_boxes)):
+            candidates = np.flatnonzero((iou[p] >= threshold) & ~matched)
+            if len(candidates):
+                matched[candidates[iou[p, candidates].argmax()]] = True
+                tp[p, t] = True
+    return tp
+
+
+def average_precision(recall, precision):
+    """
+    101-point interpolated AP (COCO): mean over recall levels r of the best precision
+    at recall >= r (0 for recall levels the detections never reach)
+    """
+    envelope = np.append(np.flip(np.maximum.accumulate(np.flip(precision))), 0.0)
+    return float(envelope[np.searchsorted(recall, np.linspace(0, 1, 101), side='left')].mean())
+
+
+def class_metrics(tp, scores, n_gt, conf_threshold):
+    """Precision/recall at conf_threshold and AP50 / AP50-95 for one class"""
+    order = np.argsort(-scores)
+    tp, scores = tp[order], scores[order]
+    cum_tp = np.cumsum(tp, axis=0)
+    cum_fp = np.cumsum(~tp, axis=0)
+    recall = cum_tp / max(n_gt, 1)
+    precision = cum_tp / np.maximum(cum_tp + cum_fp, 1)
+    aps = [average_precision(recall[:, t], precision[:, t]) for t in range(len(IOU_THRESHOLDS))] \
+        if len(scores) else [0.0] * len(IOU_THRESHOLDS)
+    
+    kept = int((scores >= conf_threshold).sum())
+    tp50 = int(tp[:kept, 0].sum())
+    return {
+        'ground_truth': int(n_gt),
+        'detections': kept,
+        'true_positives': tp50,
+        'precision': round(tp50 / kept, 4) if kept else 0.0,
+        'recall': round(tp50 / n_gt, 4) if n_gt else 0.0,
+        'ap50': round(aps[0], 4),
+        'ap50_95': round(float(np.mean(aps)), 4)
+    }
+
+
+class AnnotationWriter:
+    """Draws and saves annotated images on a background thread, off the inference path"""
+    
+    def __init__(self, save_dir, class_names, max_queue=32):
+        self.save_dir = save_dir
+        self.class_names = class_names
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._run, name='annotation-writer', daemon=True)
+        self.thread.start()
+    
+    def submit(self, img_path, image, detections):
+        self.queue.put((img_path, image, detections))  # Blocks if far behind rather than dropping results
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            img_path, image, det = item
+            for box, score, cls_id in zip(det.boxes, det.scores, det.class_ids):
+                x1, y1, x2, y2 = (int(v) for v in box)
+                name = self.class_names[cls_id] if cls_id < len(self.class_names) else f"class_{cls_id}"
+                cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.putText(image, f"{name} {score:.2f}", (x1, max(y1 - 5, 12)),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            cv2.imwrite(os.path.join(self.save_dir, f"result_{Path(img_path).name}"), image)
+    
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def write_csv(path, rows):
+    if not rows:
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
 
 def test_model(model_path='runs/detect/toy_car_detection/weights/best.pt',
                test_dir='datasets/toy_cars/images/test',
                conf_threshold=0.3,
-               save_dir='test_results'):
+               save_dir='test_results',
+               label_dir=None,
+               backend='torch',
+               img_size=640,
+               batch_size=8,
+               workers=4,
+               warmup=1,
+               latency_samples=50,
+               save_images=False):
     """
-    Test the custom model on test images
+    Evaluate the custom model on the test images
+    
+    Images are decoded on a thread pool ahead of inference and run in batches. Detections are
+    matched against the YOLO labels for per-class precision/recall and mAP. Latency is reported
+    per batch, amortized per image (batch time / batch size) with throughput, and as true
+    single-image latency from a separate batch-size-1 pass. Writes evaluation.json,
+    per_class.csv and per_image.csv to save_dir.
     
     Args:
-        model_path: Path to trained model
+        model_path: Path to trained model (.pt, .onnx or OpenVINO export for the other backends)
         test_dir: Directory with test images
-        conf_threshold: Confidence threshold
+        conf_threshold: Confidence threshold for precision/recall
         save_dir: Directory to save results
+        label_dir: YOLO labels for test_dir (default: test_dir with images -> labels)
+        backend: 'torch', 'onnx' or 'openvino'
+        img_size: Model input size
+        batch_size: Images per inference call
+        workers: Threads decoding images
+        warmup: Untimed batches run before measuring
+        latency_samples: Images timed one at a time for single-image latency (0 = skip that pass)
+        save_images: Also save annotated images (written on a background thread)
+    
+    Returns: report dict
     """
     
     print("\n" + "="*80)
@@ -32,90 +203,184 @@ def test_model(model_path='runs/detect/toy_car_detection/weights/best.pt',
         print("   Train the model first using train_custom_model.py")
         return
     
-    # Load model
-    print(f"\n📥 Loading model: {model_path}")
-    model = YOLO(model_path)
-    
-    # Create output directory
-    os.makedirs(save_dir, exist_ok=True)
-    
     # Get test images
-    if os.path.exists(test_dir):
-        image_files = list(Path(test_dir).rglob('*.jpg')) + \
-                     list(Path(test_dir).rglob('*.jpeg')) + \
-                     list(Path(test_dir).rglob('*.png'))
-    else:
+    if not os.path.exists(test_dir):
         print(f"⚠️  Test directory not found: {test_dir}")
         print("   Please specify image paths manually")
         return
+    image_files = sorted(p for p in Path(test_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
     
     if not image_files:
         print(f"⚠️  No images found in {test_dir}")
         return
     
-    print(f"\n📸 Found {len(image_files)} test images")
+    if label_dir is None:
+        parts = list(Path(test_dir).parts)
+        if 'images' in parts:
+            parts[len(parts) - 1 - parts[::-1].index('images')] = 'labels'
+        label_dir = Path(*parts)
+    
+    # Load model
+    print(f"\n📥 Loading model: {model_path} ({backend} backend)")
+    model = load_backend(backend, model_path, imgsz=img_size)
+    class_names = [name for _, name in sorted(model.names.items())] if getattr(model, 'names', None) else CLASS_NAMES
+    
+    # Create output directory
+    os.makedirs(save_dir, exist_ok=True)
+    
+    print(f"\n📸 Found {len(image_files)} test images (labels: {label_dir})")
     print(f"💾 Results will be saved to: {save_dir}")
     print(f"🎯 Confidence threshold: {conf_threshold}")
+    print(f"📦 Batch size: {batch_size}, decode workers: {workers}")
+    
+    params = dict(conf=EVAL_CONF, iou=0.4, max_det=300, agnostic_nms=False, augment=False, half=False)
     
-    # Test on each image
+    # Warm-up on the first batch (first calls pay for lazy initialization)
+    first = [img for img in (cv2.imread(str(p)) for p in image_files[:batch_size]) if img is not None]
+    for _ in range(warmup if first else 0):
+        model.predict(first, **params)
+    
+    annotations = AnnotationWriter(save_dir, class_names) if save_images else None
+    per_class = {}  # class id -> {'tp': [(P, T) arrays], 'scores': [arrays], 'n_gt': int}
+    per_image = []
+    amortized_latencies = []
+    batch_latencies = []
+    latency_images = []  # Kept for the single-image pass
+    unreadable = 0
+    
+    # Test in batches
     print("\n" + "="*80)
     print("TESTING RESULTS")
     print("="*80)
     
-    class_names = ['toy_car_front', 'toy_car_back', 'toy_car_left', 'toy_car_right']
-    total_detections = 0
-    orientation_counts = {'front': 0, 'back': 0, 'left': 0, 'right': 0}
-    
-    for i, img_path in enumerate(image_files, 1):
-        print(f"\n[{i}/{len(image_files)}] Testing: {img_path.name}")
-        
-        # Run inference
-        results = model(
-            str(img_path),
-            conf=conf_threshold,
-            iou=0.4,
-            verbose=False
-        )
-        
-        # Process results
-        result = results[0]
-        boxes = result.boxes
-        
-        if len(boxes) == 0:
-            print(f"   ⚠️  No detections")
+    started = time.perf_counter()
+    for batch in load_batches(image_files, batch_size, workers):
+        for path, img in batch:
+            if img is None:
+                print(f"⚠️  Unreadable: {path}")
+                unreadable += 1
+        batch = [(path, img) for path, img in batch if img is not None]
+        if not batch:
             continue
         
-        print(f"   ✅ {len(boxes)} detection(s):")
+        start = time.perf_counter()
+        results = model.predict([img for _, img in batch], **params)
+        batch_ms = (time.perf_counter() - start) * 1000
+        batch_latencies.append(batch_ms)
         
-        for box in boxes:
-            cls_id = int(box.cls[0])
-            confidence = float(box.conf[0])
-            class_name = class_names[cls_id] if cls_id < len(class_names) else f"class_{cls_id}"
-            orientation = class_name.split('_')[-1]
+        for (img_path, img), det in zip(batch, results):
+            amortized_latencies.append(batch_ms / len(batch))  # Not a per-image measurement
+            if len(latency_images) < latency_samples:
+                latency_images.append(img)
+            gt_boxes, gt_cls = read_ground_truth(label_path_for(img_path, test_dir, label_dir), img.shape[1], img.shape[0])
+            order = np.argsort(-det.scores)
+            boxes, scores, class_ids = det.boxes[order], det.scores[order], det.class_ids[order]
+            tp = match_detections(boxes, class_ids, gt_boxes, gt_cls)
             
-            orientation_counts[orientation] += 1
-            total_detections += 1
+            for cls_id in set(class_ids.tolist()) | set(gt_cls.tolist()):
+                stats = per_class.setdefault(cls_id, {'tp': [], 'scores': [], 'n_gt': 0})
+                mask = class_ids == cls_id
+                stats['tp'].append(tp[mask])
+                stats['scores'].append(scores[mask])
+                stats['n_gt'] += int((gt_cls == cls_id).sum())
             
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            print(f"      • {class_name}: {confidence:.2f} confidence")
-            print(f"        BBox: [{x1:.0f}, {y1:.0f}, {x2:.0f}, {y2:.0f}]")
-        
-        # Save annotated image
-        annotated = result.plot()
-        save_path = os.path.join(save_dir, f"result_{img_path.name}")
-        cv2.imwrite(save_path, annotated)
+            kept = scores >= conf_threshold
+            per_image.append({
+                'image': str(img_path),
+                'ground_truth': len(gt_cls),
+                'detections': int(kept.sum()),
+                'true_positives': int(tp[kept, 0].sum()),
+                'amortized_latency_ms': round(batch_ms / len(batch), 3)
+            })
+            if annotations is not None:
+                keep = np.flatnonzero(kept)
+                annotations.submit(img_path, img, Detections(boxes[keep], scores[keep], class_ids[keep]))
+    wall_seconds = time.perf_counter() - started
+    
+    if annotations is not None:
+        annotations.close()
+    
+    # True per-image latency: the same model on one image per call
+    single_latencies = []
+    for img in latency_images:
+        start = time.perf_counter()
+        model.predict([img], **params)
+        single_latencies.append((time.perf_counter() - start) * 1000)
+    
+    # Per-class and overall metrics
+    classes = []
+    for cls_id in sorted(per_class):
+        stats = per_class[cls_id]
+        name = class_names[cls_id] if cls_id < len(class_names) else f"class_{cls_id}"
+        metrics = class_metrics(np.concatenate(stats['tp']), np.concatenate(stats['scores']), stats['n_gt'],
+                                conf_threshold)
+        classes.append({'class_id': cls_id, 'class': name, **metrics})
+    labeled = [c for c in classes if c['ground_truth'] > 0]
+    overall = {
+        'images': len(per_image),
+        'unreadable_images': unreadable,
+        'ground_truth': sum(c['ground_truth'] for c in classes),
+        'detections': sum(c['detections'] for c in classes),
+        'precision': round(float(np.mean([c['precision'] for c in labeled])), 4) if labeled else None,
+        'recall': round(float(np.mean([c['recall'] for c in labeled])), 4) if labeled else None,
+        'map50': round(float(np.mean([c['ap50'] for c in labeled])), 4) if labeled else None,
+        'map50_95': round(float(np.mean([c['ap50_95'] for c in labeled])), 4) if labeled else None
+    }
+    latency = {
+        'amortized_image': summarize(amortized_latencies, wall_seconds) if amortized_latencies else None,
+        'single_image': summarize(single_latencies) if single_latencies else None,
+        'batch': summarize(batch_latencies) if batch_latencies else None,
+        'wall_seconds': round(wall_seconds, 2)
+    }
+    
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'model': model_path,
+        'backend': backend,
+        'test_dir': str(test_dir),
+        'label_dir': str(label_dir),
+        'img_size': img_size,
+        'batch_size': batch_size,
+        'conf_threshold': conf_threshold,
+        'overall': overall,
+        'classes': classes,
+        'latency': latency
+    }
+    with open(os.path.join(save_dir, 'evaluation.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    write_csv(os.path.join(save_dir, 'per_class.csv'), classes)
+    write_csv(os.path.join(save_dir, 'per_image.csv'), per_image)
+    
+    print(f"{'Class':16s} {'GT':>5s} {'Det':>5s} {'P':>7s} {'R':>7s} {'AP50':>7s} {'AP50-95':>8s}")
+    for c in classes:
+        print(f"{c['class']:16s} {c['ground_truth']:5d} {c['detections']:5d} {c['precision']:7.3f} "
+              f"{c['recall']:7.3f} {c['ap50']:7.3f} {c['ap50_95']:8.3f}")
     
     print("\n" + "="*80)
     print("TEST SUMMARY")
     print("="*80)
-    print(f"Total images tested: {len(image_files)}")
-    print(f"Total detections: {total_detections}")
-    print(f"Average detections per image: {total_detections/len(image_files):.2f}")
-    print(f"\nOrientation breakdown:")
-    for orientation, count in orientation_counts.items():
-        print(f"  {orientation:8s}: {count:3d} ({count/total_detections*100:.1f}%)" if total_detections > 0 else f"  {orientation:8s}: 0")
-    print(f"\nAnnotated images saved to: {save_dir}")
+    print(f"Total images tested: {overall['images']}")
+    print(f"Total detections: {overall['detections']} (ground truth: {overall['ground_truth']})")
+    if labeled:
+        print(f"Precision: {overall['precision']:.4f}  Recall: {overall['recall']:.4f}  "
+              f"mAP50: {overall['map50']:.4f}  mAP50-95: {overall['map50_95']:.4f}")
+    else:
+        print(f"⚠️  No labels found in {label_dir} - precision/recall/mAP need labeled test images")
+    if latency['batch']:
+        print(f"Latency per batch of {batch_size}: p50 {latency['batch']['p50_ms']:.1f} ms, "
+              f"p95 {latency['batch']['p95_ms']:.1f} ms, p99 {latency['batch']['p99_ms']:.1f} ms "
+              f"(amortized p50 {latency['amortized_image']['p50_ms']:.1f} ms per image)")
+        print(f"Throughput: {latency['amortized_image']['throughput_per_s']:.1f} images/s ({wall_seconds:.1f}s total)")
+    if latency['single_image']:
+        print(f"Single-image latency ({len(single_latencies)} images, batch size 1): "
+              f"p50 {latency['single_image']['p50_ms']:.1f} ms, p95 {latency['single_image']['p95_ms']:.1f} ms, "
+              f"p99 {latency['single_image']['p99_ms']:.1f} ms")
+    print(f"\nReport saved to: {os.path.join(save_dir, 'evaluation.json')} (+ per_class.csv, per_image.csv)")
+    if save_images:
+        print(f"Annotated images saved to: {save_dir}")
     print("="*80 + "\n")
+    
+    return report
 
 
 def test_live_camera(model_path='runs/detect/toy_car_detection/weights/best.pt',
@@ -193,10 +458,23 @@ if __name__ == "__main__":
                        help='Test on live camera instead of images')
     parser.add_argument('--save-dir', type=str, default='test_results',
                        help='Directory to save test results')
+    parser.add_argument('--label-dir', type=str, default=None,
+                       help='YOLO labels for the test images (default: images -> labels)')
+    parser.add_argument('--backend', type=str, choices=['torch', 'onnx', 'openvino'], default='torch',
+                       help='Inference backend')
+    parser.add_argument('--imgsz', type=int, default=640, help='Model input size')
+    parser.add_argument('--batch', type=int, default=8, help='Images per inference call')
+    parser.add_argument('--workers', type=int, default=4, help='Image decoding threads')
+    parser.add_argument('--latency-samples', type=int, default=50,
+                       help='Images timed one at a time for single-image latency (0 = skip)')
+    parser.add_argument('--save-images', action='store_true',
+                       help='Save annotated images (written in the background)')
     
     args = parser.parse_args()
     
     if args.live:
         test_live_camera(args.model, args.conf)
     else:
-        test_model(args.model, args.test_dir, args.conf, args.save_dir)
+        test_model(args.model, args.test_dir, args.conf, args.save_dir, label_dir=args.label_dir,
+                   backend=args.backend, img_size=args.imgsz, batch_size=args.batch, workers=args.workers,
+                   latency_samples=args.latency_samples, save_images=args.save_images)
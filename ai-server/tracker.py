@@ -0,0 +1,336 @@
+"""
+Multi-Object Tracking for Camera Streams
+Kalman-filtered IoU tracker with ByteTrack-style two-stage association. The
+detector runs every N frames and tracks are propagated in between; per-track
+speed and dwell time come from the filtered motion and a per-camera calibration
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+import numpy as np
+from backends import box_iou
+
+# Kalman process / measurement noise, relative to the box size (per second for velocity)
+WEIGHT_POSITION = 1.0 / 20
+WEIGHT_VELOCITY = 1.0 / 16
+
+# Default tracker settings, overridable per camera
+DEFAULT_SETTINGS = {
+    'detect_every': 3,            # Run the detector on every Nth stream frame, propagate tracks in between
+    'meters_per_pixel': 0.0,      # Calibration for speeds in km/h (0 = uncalibrated, pixel speeds only)
+    'high_threshold': 0.5,        # Detections at or above this confidence can start tracks
+    'match_iou': 0.3,             # Min IoU for first-stage (high confidence) matches
+    'low_match_iou': 0.2,         # Min IoU for second-stage (low confidence) matches
+    'track_buffer_seconds': 1.0,  # How long an unmatched track is kept for re-association
+}
+
+_H = np.eye(4, 8)
+
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter over (center x, center y, width, height)"""
+
+    def __init__(self, measurement):
+        w, h = measurement[2], measurement[3]
+        self.mean = np.concatenate([measurement, np.zeros(4)])
+        std = np.array([2 * WEIGHT_POSITION * w, 2 * WEIGHT_POSITION * h, 2 * WEIGHT_POSITION * w, 2 * WEIGHT_POSITION * h,
+                        10 * WEIGHT_VELOCITY * w, 10 * WEIGHT_VELOCITY * h, 10 * WEIGHT_VELOCITY * w, 10 * WEIGHT_VELOCITY * h])
+        self.covariance = np.diag(np.square(std))
+
+    def predict(self, dt):
+        """State at dt seconds from the last update (does not modify the filter)"""
+        dt = max(dt, 0.0)
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        return F @ self.mean
+
+    def advance(self, dt):
+        dt = max(dt, 1e-3)
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        w, h = self.mean[2], self.mean[3]
+        std = np.array([WEIGHT_POSITION * w, WEIGHT_POSITION * h, WEIGHT_POSITION * w, WEIGHT_POSITION * h,
+                        WEIGHT_VELOCITY * w, WEIGHT_VELOCITY * h, WEIGHT_VELOCITY * w, WEIGHT_VELOCITY * h])
+        self.mean = F @ self.mean
+        self.covariance = F @ self.covariance @ F.T + np.diag(np.square(std)) * dt
+
+    def update(self, measurement):
+        w, h = self.mean[2], self.mean[3]
+        R = np.diag(np.square([WEIGHT_POSITION * w, WEIGHT_POSITION * h, WEIGHT_POSITION * w, WEIGHT_POSITION * h]))
+        S = _H @ self.covariance @ _H.T + R
+        K = self.covariance @ _H.T @ np.linalg.inv(S)
+        self.mean = self.mean + K @ (measurement - _H @ self.mean)
+        self.covariance = (np.eye(8) - K @ _H) @ self.covariance
+
+
+def xyxy_to_cxcywh(boxes):
+    return np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                            boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+
+
+def cxcywh_to_xyxy(states):
+    half_w, half_h = states[:, 2] / 2, states[:, 3] / 2
+    return np.column_stack([states[:, 0] - half_w, states[:, 1] - half_h,
+                            states[:, 0] + half_w, states[:, 1] + half_h])
+
+
+def greedy_match(iou, threshold):
+    """Greedy highest-IoU-first assignment; returns list of (row, col)"""
+    matches = []
+    if iou.size == 0:
+        return matches
+    iou = iou.copy()
+    while True:
+        row, col = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[row, col] < threshold:
+            return matches
+        matches.append((int(row), int(col)))
+        iou[row, :] = -1
+        iou[:, col] = -1
+
+
+class Track:
+    def __init__(self, track_id, box, score, type_id, timestamp):
+        self.track_id = track_id
+        self.kf = KalmanBoxFilter(xyxy_to_cxcywh(box[None])[0])
+        self.score = score
+        self.type_id = type_id
+        self.first_seen = timestamp
+        self.last_update = timestamp
+        self.hits = 1
+
+    def predict_state(self, timestamp):
+        return self.kf.predict(timestamp - self.last_update)
+
+    def update(self, box, score, type_id, timestamp):
+        self.kf.advance(timestamp - self.last_update)
+        self.kf.update(xyxy_to_cxcywh(box[None])[0])
+        self.score = score
+        self.type_id = type_id
+        self.last_update = timestamp
+        self.hits += 1
+
+    def speed_px_s(self):
+        """Filtered center speed in pixels per second (None until the track has been matched twice)"""
+        if self.hits < 2:
+            return None
+        return float(np.hypot(self.kf.mean[4], self.kf.mean[5]))
+
+
+class CameraTracker:
+    """
+    Tracker for one camera
+
+    Each detector run goes through two association stages: high-confidence detections
+    are matched to all live tracks first, then low-confidence detections to the tracks
+    that are left. Only high-confidence detections start new tracks, and a track counts
+    as an arrival once it is confirmed by a second match (one-off false positives don't).
+    """
+
+    def __init__(self, camera_id, **settings):
+        self.camera_id = camera_id
+        self._lock = threading.Lock()
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.configure(**settings)
+
+        self._ids = itertools.count(1)
+        self.tracks = []
+        self.frames_seen = 0
+        self.detector_runs = 0
+        self.frames_propagated = 0
+        self.tracks_started = 0
+        self.tracks_confirmed = 0
+        self._last_detection_at = 0.0
+        self._last_update_clock = None  # time.monotonic() of the last update(), to expire idle streams
+        self.last_arrivals = []  # type_ids of the tracks confirmed (second match) by the last update()
+        self._finished_dwell = deque(maxlen=200)  # Dwell times of recently ended tracks
+
+    def configure(self, **settings):
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown tracking settings: {', '.join(sorted(unknown))}")
+        updated = dict(self.settings)
+        for key, value in settings.items():
+            updated[key] = max(1, int(value)) if key == 'detect_every' else float(value)
+        with self._lock:
+            self.settings = updated
+
+    def needs_detection(self):
+        """Whether the current stream frame should go through the detector"""
+        with self._lock:
+            due = self.frames_seen % self.settings['detect_every'] == 0
+            self.frames_seen += 1
+            return due
+
+    def update(self, boxes, scores, type_ids, timestamp):
+        """
+        Associate one detector result with the tracks
+
+        Args:
+            boxes: (N, 4) xyxy full-frame boxes, scores: (N,), type_ids: (N,)
+            timestamp: Capture time of the frame (epoch seconds)
+
+        Returns: list of track ids aligned with the detections (None for unmatched low-confidence ones)
+        """
+        with self._lock:
+            settings = self.settings
+            self.detector_runs += 1
+            self._last_detection_at = timestamp
+            self._last_update_clock = time.monotonic()
+            self._expire(timestamp)
+
+            self.last_arrivals = []
+            track_ids = [None] * len(scores)
+            unmatched_tracks = list(range(len(self.tracks)))
+            predicted = cxcywh_to_xyxy(np.array([t.predict_state(timestamp)[:4] for t in self.tracks]).reshape(-1, 4))
+
+            high = np.flatnonzero(scores >= settings['high_threshold'])
+            low = np.flatnonzero(scores < settings['high_threshold'])
+            for det_indices, threshold in ((high, settings['match_iou']), (low, settings['low_match_iou'])):
+                if not len(det_indices) or not unmatched_tracks:
+                    continue
+                iou = box_iou(predicted[unmatched_tracks], boxes[det_indices])
+                matched = set()
+                for row, col in greedy_match(iou, threshold):
+                    track = self.tracks[unmatched_tracks[row]]
+                    det = det_indices[col]
+                    track.update(boxes[det], float(scores[det]), int(type_ids[det]), timestamp)
+                    if track.hits == 2:
+                        self.tracks_confirmed += 1
+                        self.last_arrivals.append(track.type_id)
+                    track_ids[det] = track.track_id
+                    matched.add(row)
+                unmatched_tracks = [t for i, t in enumerate(unmatched_tracks) if i not in matched]
+
+            for det in high:
+                if track_ids[det] is None:
+                    track = Track(next(self._ids), boxes[det], float(scores[det]), int(type_ids[det]), timestamp)
+                    self.tracks.append(track)
+                    self.tracks_started += 1
+                    track_ids[det] = track.track_id
+
+            return track_ids
+
+    def propagate(self, timestamp):
+        """
+        Predicted boxes of the tracks matched at the last detector run
+
+        Returns: (boxes, scores, type_ids, track_ids)
+        """
+        with self._lock:
+            self.frames_propagated += 1
+            self._expire(timestamp)
+            live = [t for t in self.tracks if t.last_update >= self._last_detection_at]
+            states = np.array([t.predict_state(timestamp)[:4] for t in live]).reshape(-1, 4)
+            states[:, 2:] = np.maximum(states[:, 2:], 1.0)  # Shrinking boxes must not invert
+            return (cxcywh_to_xyxy(states),
+                    np.array([t.score for t in live], dtype=np.float64),
+                    np.array([t.type_id for t in live], dtype=np.int64),
+                    [t.track_id for t in live])
+
+    def _expire(self, timestamp):
+        """Drop tracks that went unmatched for longer than the track buffer"""
+        keep = []
+        for track in self.tracks:
+            if timestamp - track.last_update > self.settings['track_buffer_seconds']:
+                if track.hits >= 2:
+                    self._finished_dwell.append(track.last_update - track.first_seen)
+            else:
+                keep.append(track)
+        self.tracks = keep
+
+    def track_info(self, track_ids, timestamp):
+        """Speed and dwell time per track id (None entries stay None)"""
+        with self._lock:
+            meters_per_pixel = self.settings['meters_per_pixel']
+            by_id = {t.track_id: t for t in self.tracks}
+            info = []
+            for track_id in track_ids:
+                track = by_id.get(track_id)
+                if track is None:
+                    info.append(None)
+                    continue
+                speed = track.speed_px_s()
+                info.append({
+                    'track_id': track_id,
+                    'speed_px_s': round(speed, 1) if speed is not None else None,
+                    'speed_kmh': round(speed * meters_per_pixel * 3.6, 2) if speed is not None and meters_per_pixel else None,
+                    'dwell_seconds': round(timestamp - track.first_seen, 2)
+                })
+            return info
+
+    def _expire_idle(self):
+        """
+        Expire tracks of a stream that stopped sending frames
+
+        Frame timestamps come from the client, so the stream clock is advanced by the
+        local time elapsed since the last update() instead of comparing against time.time().
+        """
+        if self._last_update_clock is None:
+            return self._last_detection_at
+        now = self._last_detection_at + (time.monotonic() - self._last_update_clock)
+        if now - self._last_detection_at > self.settings['track_buffer_seconds']:
+            self._expire(now)
+        return now
+
+    def summary(self):
+        """Active track count, average speeds and dwell times (tracks of an idle stream expire)"""
+        with self._lock:
+            meters_per_pixel = self.settings['meters_per_pixel']
+            now = self._expire_idle()
+            speeds = [s for s in (t.speed_px_s() for t in self.tracks) if s is not None]
+            dwell = list(self._finished_dwell) + [now - t.first_seen for t in self.tracks if t.hits >= 2]
+            detector_runs, propagated = self.detector_runs, self.frames_propagated
+            return {
+                **self.settings,
+                'active_tracks': len(self.tracks),
+                'tracks_started': self.tracks_started,
+                'tracks_confirmed': self.tracks_confirmed,
+                'detector_runs': detector_runs,
+                'frames_propagated': propagated,
+                'detector_ratio': round(detector_runs / (detector_runs + propagated), 3) if detector_runs else 0,
+                'average_speed_px_s': round(float(np.mean(speeds)), 1) if speeds else None,
+                'average_speed_kmh': (round(float(np.mean(speeds)) * meters_per_pixel * 3.6, 2)
+                                      if speeds and meters_per_pixel else None),
+                'average_dwell_seconds': round(float(np.mean(dwell)), 2) if dwell else None
+            }
+
+
+class TrackerRegistry:
+    """Per-camera trackers with per-camera setting overrides"""
+
+    def __init__(self, **defaults):
+        self.defaults = dict(DEFAULT_SETTINGS, **defaults)
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def tracker(self, camera_id):
+        with self._lock:
+            tracker = self._trackers.get(camera_id)
+            if tracker is None:
+                tracker = CameraTracker(camera_id, **self.defaults)
+                self._trackers[camera_id] = tracker
+            return tracker
+
+    def configure(self, camera_id, **settings):
+        """Update settings for one camera (raises ValueError for unknown keys or bad values)"""
+        self.tracker(camera_id).configure(**settings)
+
+    def get_stats(self):
+        with self._lock:
+            trackers = dict(self._trackers)
+        return {camera_id: tracker.summary() for camera_id, tracker in trackers.items()}
+
+    def camera_ids(self):
+        with self._lock:
+            return list(self._trackers)
+
+    def average_speed(self, camera_ids=None):
+        """Average speed over the active tracks of the given (default: all) cameras: (km/h or None, px/s or None)"""
+        stats = [s for camera_id, s in self.get_stats().items() if camera_ids is None or camera_id in camera_ids]
+        kmh = [s['average_speed_kmh'] for s in stats if s['average_speed_kmh'] is not None]
+        px = [s['average_speed_px_s'] for s in stats if s['average_speed_px_s'] is not None]
+        return (round(float(np.mean(kmh)), 2) if kmh else None,
+                round(float(np.mean(px)), 1) if px else None)
@@ -6,7 +6,9 @@ Trains a model to detect toy cars and identify their orientation (front/back/lef
 from ultralytics import YOLO
 import torch
 import os
+from pathlib import Path
 from datetime import datetime
+import cv2
 
 def train_toy_car_model(
     data_yaml='datasets/toy_cars/data.yaml',
@@ -14,7 +16,9 @@ def train_toy_car_model(
     epochs=100,
     img_size=640,
     batch_size=16,
-    device=None
+    device=None,
+    export_formats=None,
+    image_cache=False
 ):
     """
     Train YOLOv11 model on custom toy car dataset
@@ -26,6 +30,8 @@ def train_toy_car_model(
         img_size: Input image size
         batch_size: Batch size for training
         device: Device to use ('cpu', 'cuda', or None for auto-detect)
+        export_formats: Export best.pt to these CPU formats after training ('onnx', 'openvino')
+        image_cache: Train from the pre-decoded memmap image cache (built or refreshed first)
     """
     
     print("\n" + "="*80)
@@ -43,6 +49,7 @@ def train_toy_car_model(
     print(f"   Image size: {img_size}")
     print(f"   Batch size: {batch_size}")
     print(f"   Device: {device}")
+    print(f"   Image cache: {'yes' if image_cache else 'no'}")
     print(f"   GPU Available: {torch.cuda.is_available()}")
     if torch.cuda.is_available():
         print(f"   GPU Name: {torch.cuda.get_device_name(0)}")
@@ -53,6 +60,13 @@ def train_toy_car_model(
         print("   Run prepare_dataset.py first!")
         return None
     
+    # Decode every image once up front instead of on every epoch
+    trainer = None
+    if image_cache:
+        from image_cache import prepare_image_cache, CachedDetectionTrainer
+        prepare_image_cache(data_yaml, img_size, loader_workers=8)
+        trainer = CachedDetectionTrainer
+    
     # Load pretrained model
     print(f"\n📥 Loading base model: {base_model}")
     model = YOLO(base_model)
@@ -65,6 +79,7 @@ def train_toy_car_model(
     try:
         results = model.train(
             # Dataset
+            trainer=trainer,  # None = default trainer (decodes JPEGs every epoch)
             data=data_yaml,
             
             # Training duration
@@ -174,11 +189,15 @@ def train_toy_car_model(
         print("1. Review training results in runs/detect/toy_car_detection/")
         print("2. Check training curves and validation metrics")
         print("3. Test the model using test_model.py")
-        print("4. If satisfied, update app.py to use the custom model")
-        print("   Change: model = YOLO('yolo11n.pt')")
-        print("   To:     model = YOLO('runs/detect/toy_car_detection/weights/best.pt')")
+        print("4. If satisfied, point app.py at the custom model")
+        print(f"   PyTorch: set AI_MODEL_PATH={model_path}")
+        print("   ONNX:    python train_custom_model.py --export onnx --export-only")
+        print("            then AI_BACKEND=onnx AI_MODEL_PATH=runs/detect/toy_car_detection/weights/best.onnx")
         print("="*80 + "\n")
         
+        if export_formats:
+            export_model(model_path, export_formats, img_size=img_size)
+        
         return model
         
     except Exception as e:
@@ -189,6 +208,72 @@ def train_toy_car_model(
         return None
 
 
+def export_model(weights='runs/detect/toy_car_detection/weights/best.pt',
+                 formats=('onnx',),
+                 img_size=640,
+                 verify_dir='datasets/toy_cars/images/val',
+                 verify_count=20):
+    """
+    Export a trained model for CPU inference with ONNX Runtime / OpenVINO
+    and check that it reproduces the PyTorch detections
+    
+    Args:
+        weights: Trained .pt model to export
+        formats: Export formats ('onnx', 'openvino')
+        img_size: Input image size (must match AI_INPUT_SIZE on the server)
+        verify_dir: Images used to compare exported vs PyTorch results
+        verify_count: Number of images to compare
+    
+    Returns: dict of format -> (exported path, comparison report)
+    """
+    from backends import load_backend, compare_backends
+    
+    print("\n" + "="*80)
+    print("📦 EXPORTING MODEL FOR CPU INFERENCE")
+    print("="*80)
+    
+    if not os.path.exists(weights):
+        print(f"❌ Model not found: {weights}")
+        return {}
+    
+    # Reference images for the accuracy check
+    images = []
+    if os.path.exists(verify_dir):
+        paths = sorted(p for p in Path(verify_dir).rglob('*') if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+        images = [img for img in (cv2.imread(str(p)) for p in paths[:verify_count]) if img is not None]
+    if not images:
+        print(f"⚠️  No verification images in {verify_dir}, skipping accuracy check")
+    
+    reference = load_backend('torch', weights, imgsz=img_size) if images else None
+    exported = {}
+    
+    for fmt in formats:
+        print(f"\n📤 Exporting to {fmt} (imgsz={img_size}, dynamic batch)...")
+        # Dynamic axes let the server's micro-batcher send several frames per call
+        path = YOLO(weights).export(format=fmt, imgsz=img_size, dynamic=True, half=False)
+        print(f"   Saved: {path}")
+        
+        report = None
+        if reference is not None:
+            candidate = load_backend(fmt, path, imgsz=img_size)
+            report = compare_backends(reference, candidate, images, conf=0.3, iou=0.4, max_det=20, agnostic_nms=True)
+            status = "✅" if report['passed'] else "❌"
+            print(f"   {status} Matches PyTorch on {report['matched_detections']}/{report['reference_detections']} "
+                  f"detections (max confidence diff {report['max_confidence_diff']}, "
+                  f"mean IoU {report['mean_matched_iou']})")
+            if not report['passed']:
+                print("   ⚠️  Exported model differs from PyTorch beyond tolerance - do not deploy it")
+        
+        exported[fmt] = (str(path), report)
+    
+    print("\n💡 Run the server with the exported model:")
+    for fmt, (path, _) in exported.items():
+        print(f"   AI_BACKEND={fmt} AI_MODEL_PATH={path} python app.py")
+    print("="*80 + "\n")
+    
+    return exported
+
+
 def resume_training(checkpoint_path='runs/detect/toy_car_detection/weights/last.pt'):
     """
     Resume training from a checkpoint
@@ -223,10 +308,20 @@ if __name__ == "__main__":
                        help='Device to use (cpu, 0, 1, etc.)')
     parser.add_argument('--resume', type=str, default=None,
                        help='Resume from checkpoint')
+    parser.add_argument('--export', type=str, nargs='+', choices=['onnx', 'openvino'], default=None,
+                       help='Export the trained model for CPU inference (onnx, openvino)')
+    parser.add_argument('--export-only', action='store_true',
+                       help='Skip training and only export --weights')
+    parser.add_argument('--weights', type=str, default='runs/detect/toy_car_detection/weights/best.pt',
+                       help='Trained model to export with --export-only')
+    parser.add_argument('--image-cache', action='store_true',
+                       help='Train from a pre-decoded memory-mapped image cache (no per-epoch JPEG decoding)')
     
     args = parser.parse_args()
     
-    if args.resume:
+    if args.export_only:
+        export_model(args.weights, args.export or ['onnx'], img_size=args.imgsz)
+    elif args.resume:
         resume_training(args.resume)
     else:
         train_toy_car_model(
@@ -235,5 +330,7 @@ if __name__ == "__main__":
             epochs=args.epochs,
             img_size=args.imgsz,
             batch_size=args.batch,
-            device=args.device
+            device=args.device,
+            export_formats=args.export,
+            image_cache=args.image_cache
         )
@@ -0,0 +1,418 @@
+"""
+Multi-Process Model Worker Pool
+N worker processes each load the model once, pinned to disjoint CPU cores.
+Frames are handed over through shared memory instead of being pickled, and
+crashed or stuck workers are restarted automatically (with backoff; a worker
+that keeps crashing marks the pool failed).
+"""
+
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import numpy as np
+
+# Frames inside a shared memory segment start on this byte boundary
+ALIGNMENT = 64
+
+# Set in the environment of worker processes while they start; spawned workers re-import
+# the server's main module, which uses in_worker_process() to skip server-only setup.
+# (An explicit flag rather than multiprocessing.parent_process(), which is also set in
+# uvicorn --workers children and other spawned servers that do need the full setup.)
+WORKER_ENV = 'AI_MODEL_WORKER'
+
+# os.environ is process-wide: restarts by the monitor and pools created by deployments may
+# start workers at the same time, and one must not clear the flag while another is spawning
+_spawn_lock = threading.Lock()
+
+# Restart backoff: doubles per consecutive crash, from RESTART_BACKOFF_MIN up to RESTART_BACKOFF_MAX seconds.
+# A worker that exits within STABLE_SECONDS of starting counts as crashing again; after
+# MAX_CONSECUTIVE_CRASHES such exits the pool is marked failed instead of restarting forever
+RESTART_BACKOFF_MIN = 0.5
+RESTART_BACKOFF_MAX = 30.0
+STABLE_SECONDS = 60.0
+MAX_CONSECUTIVE_CRASHES = 5
+
+
+def in_worker_process():
+    """True inside a model worker process (set before the child re-imports the main module)"""
+    return os.environ.get(WORKER_ENV) == '1'
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process running a task died or was killed before finishing it"""
+
+
+def split_cores(num_workers):
+    """Disjoint core sets, one per worker (cores are shared only if workers outnumber cores)"""
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    if num_workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(num_workers)]
+    chunk = len(cores) // num_workers
+    return [cores[i * chunk:(i + 1) * chunk] for i in range(num_workers)]
+
+
+def _worker_main(worker_id, backend, weights, imgsz, cores, threads, tasks, results):
+    """Worker process: pin to cores, load the model once, then serve tasks until told to stop"""
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+    try:
+        from backends import load_backend
+        model = load_backend(backend, weights, imgsz=imgsz, threads=threads or len(cores) or None)
+    except Exception as e:
+        results.put(('load_error', worker_id, None, f'{type(e).__name__}: {e}', 0.0))
+        raise SystemExit(1)
+    results.put(('ready', worker_id, None, (os.getpid(), dict(model.names)), 0.0))
+
+    attached = OrderedDict()  # Recently used shared memory segments, by name
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, shm_name, layout, params = task
+
+        start = time.perf_counter()
+        try:
+            shm = attached.pop(shm_name, None) or shared_memory.SharedMemory(name=shm_name)
+            attached[shm_name] = shm
+            while len(attached) > 8:
+                _, old = attached.popitem(last=False)
+                old.close()
+
+            images = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+                      for offset, shape in layout]
+            detections = model.predict(images, **params)
+            del images
+            message = ('done', worker_id, task_id, detections, time.perf_counter() - start)
+        except Exception as e:
+            message = ('error', worker_id, task_id, f'{type(e).__name__}: {e}', time.perf_counter() - start)
+        results.put(message)
+
+
+class _SlabPool:
+    """Reusable shared memory segments for frame handoff"""
+
+    def __init__(self, min_size=8 * 1024 * 1024, max_free=8):
+        self.min_size = min_size
+        self.max_free = max_free
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        with self._lock:
+            fitting = [s for s in self._free if s.size >= size]
+            if fitting:
+                slab = min(fitting, key=lambda s: s.size)
+                self._free.remove(slab)
+                return slab
+        return shared_memory.SharedMemory(create=True, size=max(size, self.min_size))
+
+    def release(self, slab):
+        with self._lock:
+            self._free.append(slab)
+            if len(self._free) <= self.max_free:
+                return
+            # Drop the smallest segment; larger ones fit more frames
+            slab = min(self._free, key=lambda s: s.size)
+            self._free.remove(slab)
+        slab.close()
+        slab.unlink()
+
+    def close(self):
+        with self._lock:
+            free, self._free = self._free, []
+        for slab in free:
+            slab.close()
+            slab.unlink()
+
+
+class _WorkerSlot:
+    def __init__(self, worker_id, cores):
+        self.worker_id = worker_id
+        self.cores = cores
+        self.process = None
+        self.tasks = None
+        self.pid = None
+        self.ready = False
+        self.started_at = 0.0
+        self.outstanding = {}  # task_id -> submit time
+        self.tasks_completed = 0
+        self.errors = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.crash_streak = 0  # Consecutive exits within STABLE_SECONDS of starting
+        self.restart_at = None  # When the next restart is due (after a crash)
+        self.last_error = None
+
+
+class WorkerPool:
+    """
+    Pool of model processes with the same predict() interface as the in-process backends
+
+    Tasks are routed to the worker with the least outstanding work. A monitor
+    thread restarts workers that exit, and kills and restarts workers whose
+    current task has run longer than task_timeout seconds. Workers that keep
+    crashing mark the pool failed (`error`); predict() then raises WorkerCrashed.
+    """
+
+    def __init__(self, backend, weights, imgsz=640, num_workers=2, threads_per_worker=None, task_timeout=30.0):
+        """
+        Args:
+            backend: Backend name for the workers ('torch', 'onnx', 'openvino')
+            weights: Model path, loaded once per worker
+            imgsz: Model input size
+            num_workers: Number of worker processes
+            threads_per_worker: Inference threads per worker (None = size of its core set)
+            task_timeout: Seconds after which a running task counts as stuck (None = never)
+        """
+        self.name = f'{backend}-pool'
+        self.backend = backend
+        self.weights = str(weights)
+        self.imgsz = imgsz
+        self.threads_per_worker = threads_per_worker
+        self.task_timeout = task_timeout
+        self.supports_augment = backend == 'torch'
+        self.names = {}  # Filled in when the first worker has loaded the model
+
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._slabs = _SlabPool()
+        self._task_ids = itertools.count()
+        self._pending = {}  # task_id -> (future, slab)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._started = threading.Event()  # Set once every worker is ready, or the pool failed
+        self.error = None  # Why the pool failed (model load error or crash loop), None while healthy
+        self.started_at = time.time()
+
+        self._workers = [_WorkerSlot(i, cores) for i, cores in enumerate(split_cores(num_workers))]
+        for worker in self._workers:
+            self._start_worker(worker)
+
+        threading.Thread(target=self._collect_results, name='worker-pool-results', daemon=True).start()
+        threading.Thread(target=self._monitor, name='worker-pool-monitor', daemon=True).start()
+        atexit.register(self.close)
+
+    def _start_worker(self, worker):
+        worker.tasks = self._ctx.Queue()
+        worker.ready = False
+        worker.started_at = time.time()
+        worker.busy_seconds = 0.0
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.worker_id, self.backend, self.weights, self.imgsz, worker.cores,
+                  self.threads_per_worker, worker.tasks, self._results),
+            name=f'model-worker-{worker.worker_id}',
+            daemon=True
+        )
+        with _spawn_lock:
+            os.environ[WORKER_ENV] = '1'
+            try:
+                worker.process.start()
+            finally:
+                os.environ.pop(WORKER_ENV, None)
+        worker.pid = worker.process.pid
+        print(f"🧵 Model worker {worker.worker_id} started (pid {worker.pid}, cores {worker.cores})")
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until every worker has loaded the model
+
+        Raises: RuntimeError with the load error if the pool failed, TimeoutError on timeout
+        """
+        if not self._started.wait(timeout):
+            raise TimeoutError(f'Model workers not ready after {timeout}s')
+        if self.error:
+            raise RuntimeError(self.error)
+        return self
+
+    def _fail(self, error):
+        """Mark the pool failed (called with the lock held); returns the futures to fail"""
+        if self.error is None:
+            self.error = error
+            print(f"❌ Worker pool failed: {error}")
+        self._started.set()
+        pending, self._pending = list(self._pending.values()), {}
+        for worker in self._workers:
+            worker.outstanding.clear()
+        for _, slab in pending:
+            self._slabs.release(slab)
+        return [future for future, _ in pending]
+
+    def predict(self, images, **params):
+        """Copy the frames into shared memory, run them on the least busy worker and wait"""
+        if self.error:
+            raise WorkerCrashed(f'Worker pool failed: {self.error}')
+        layout = []
+        total = 0
+        arrays = []
+        for img in images:
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+            layout.append((total, img.shape))
+            arrays.append(img)
+            total += -(-img.nbytes // ALIGNMENT) * ALIGNMENT
+
+        slab = self._slabs.acquire(total)
+        for (offset, shape), img in zip(layout, arrays):
+            np.ndarray(shape, dtype=np.uint8, buffer=slab.buf, offset=offset)[...] = img
+
+        future = Future()
+        with self._lock:
+            running = [w for w in self._workers if w.restart_at is None] or self._workers
+            worker = min(running, key=lambda w: (len(w.outstanding), w.tasks_completed))
+            task_id = next(self._task_ids)
+            self._pending[task_id] = (future, slab)
+            worker.outstanding[task_id] = time.time()
+            worker.tasks.put((task_id, slab.name, layout, params))
+
+        return future.result()
+
+    def _finish(self, worker, task_id, busy_seconds):
+        """Forget a task; returns its (future, slab) or None if it was already failed"""
+        worker.outstanding.pop(task_id, None)
+        worker.busy_seconds += busy_seconds
+        entry = self._pending.pop(task_id, None)
+        if entry is not None:
+            self._slabs.release(entry[1])
+        return entry
+
+    def _collect_results(self):
+        while not self._closed:
+            try:
+                kind, worker_id, task_id, payload, busy = self._results.get(timeout=0.5)
+            except (queue.Empty, EOFError, OSError):
+                continue
+
+            with self._lock:
+                worker = self._workers[worker_id]
+                if kind == 'ready':
+                    worker.ready = True
+                    worker.pid, self.names = payload
+                    if all(w.ready for w in self._workers):
+                        self._started.set()
+                    continue
+                if kind == 'load_error':
+                    # Later load errors are retried by the monitor (with backoff); a failed first start fails the pool
+                    worker.last_error = payload
+                    print(f"❌ Model worker {worker_id} failed to load the model: {payload}")
+                    failed = [] if self._started.is_set() else self._fail(f'Worker {worker_id} failed to load the model: {payload}')
+                    entry = None
+                else:
+                    failed = []
+                    entry = self._finish(worker, task_id, busy)
+                    if kind == 'done':
+                        worker.tasks_completed += 1
+                    else:
+                        worker.errors += 1
+
+            for future in failed:
+                future.set_exception(WorkerCrashed(f'Worker pool failed: {self.error}'))
+            if entry is None:
+                continue
+            if kind == 'done':
+                entry[0].set_result(payload)
+            else:
+                entry[0].set_exception(RuntimeError(f'Worker {worker_id}: {payload}'))
+
+    def _monitor(self):
+        while not self._closed:
+            time.sleep(0.5)
+            now = time.time()
+            for worker in self._workers:
+                with self._lock:
+                    stuck = (self.task_timeout and worker.outstanding and
+                             now - min(worker.outstanding.values()) > self.task_timeout)
+                if stuck and worker.process.is_alive():
+                    print(f"⚠️  Model worker {worker.worker_id} stuck for >{self.task_timeout}s, killing")
+                    worker.process.kill()
+                    worker.process.join(timeout=5)
+
+                if worker.process.is_alive() or self._closed or self.error:
+                    continue
+
+                if worker.restart_at is None:
+                    # Just exited: fail its tasks and schedule the restart
+                    with self._lock:
+                        failed = [self._finish(worker, task_id, 0.0) for task_id in list(worker.outstanding)]
+                        worker.ready = False
+                        worker.crash_streak = worker.crash_streak + 1 if now - worker.started_at < STABLE_SECONDS else 1
+                        if worker.crash_streak > MAX_CONSECUTIVE_CRASHES:
+                            reason = f'; last error: {worker.last_error}' if worker.last_error else ''
+                            failed_futures = self._fail(f'Worker {worker.worker_id} crashed {worker.crash_streak} times '
+                                                        f'in a row (exit code {worker.process.exitcode}){reason}')
+                        else:
+                            failed_futures = []
+                            delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_MIN * 2 ** (worker.crash_streak - 1))
+                            worker.restart_at = now + delay
+                            print(f"❌ Model worker {worker.worker_id} exited (code {worker.process.exitcode}), "
+                                  f"restarting in {delay:.1f}s")
+                    for entry in failed:
+                        if entry is not None:
+                            entry[0].set_exception(WorkerCrashed(f'Worker {worker.worker_id} died during inference'))
+                    for future in failed_futures:
+                        future.set_exception(WorkerCrashed(f'Worker pool failed: {self.error}'))
+                elif now >= worker.restart_at:
+                    with self._lock:
+                        # Tasks routed here while every worker was down went to the dead worker's queue
+                        failed = [self._finish(worker, task_id, 0.0) for task_id in list(worker.outstanding)]
+                        worker.restart_at = None
+                        worker.restarts += 1
+                        self._start_worker(worker)
+                    for entry in failed:
+                        if entry is not None:
+                            entry[0].set_exception(WorkerCrashed(f'Worker {worker.worker_id} was restarting'))
+
+    def get_stats(self):
+        """Per-worker utilization (busy time / uptime), outstanding work and restarts"""
+        now = time.time()
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'error': self.error,
+                'workers': [
+                    {
+                        'worker_id': w.worker_id,
+                        'pid': w.pid,
+                        'cores': w.cores,
+                        'alive': w.process.is_alive(),
+                        'ready': w.ready,
+                        'outstanding': len(w.outstanding),
+                        'tasks_completed': w.tasks_completed,
+                        'errors': w.errors,
+                        'restarts': w.restarts,
+                        'last_error': w.last_error,
+                        'utilization': round(w.busy_seconds / max(now - w.started_at, 1e-6), 3)
+                    }
+                    for w in self._workers
+                ]
+            }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            try:
+                worker.tasks.put(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=2)
+            if worker.process.is_alive():
+                worker.process.kill()
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for future, slab in pending:
+            future.set_exception(WorkerCrashed('Worker pool closed'))
+            self._slabs.release(slab)
+        self._slabs.close()
@@ -365,6 +365,12 @@ app.post('/api/detect', upload.single('image'), async (req, res) => {
       filename: req.file.originalname,
       contentType: req.file.mimetype
     });
+    // Camera and intersection select the camera's ROI, tracker and analytics on the AI server
+    for (const field of ['camera_id', 'intersection_id', 'profile']) {
+      if (req.body && req.body[field]) {
+        formData.append(field, req.body[field]);
+      }
+    }
     
     // Forward to AI server
     const response = await axios.post(`${AI_SERVER_URL}/detect`, formData, {
@@ -406,6 +412,34 @@ app.get('/api/analytics/:intersectionId', async (req, res) => {
   }
 });
 
+// Get or set a camera's region of interest (normalized polygon, null = whole frame)
+app.get('/api/cameras/:cameraId/roi', async (req, res) => {
+  try {
+    const response = await axios.get(`${AI_SERVER_URL}/cameras/${encodeURIComponent(req.params.cameraId)}/roi`);
+    res.json(response.data);
+  } catch (error) {
+    console.error('ROI fetch error:', error.message);
+    res.status(error.response?.status || 500).json({
+      error: 'ROI fetch failed',
+      message: error.response?.data?.error || error.message
+    });
+  }
+});
+
+app.put('/api/cameras/:cameraId/roi', async (req, res) => {
+  try {
+    const response = await axios.put(`${AI_SERVER_URL}/cameras/${encodeURIComponent(req.params.cameraId)}/roi`,
+      { polygon: req.body.polygon ?? null });
+    res.json(response.data);
+  } catch (error) {
+    console.error('ROI update error:', error.message);
+    res.status(error.response?.status || 500).json({
+      error: 'ROI update failed',
+      message: error.response?.data?.error || error.message
+    });
+  }
+});
+
 // Stream detection endpoint (proxy SSE)
 app.get('/api/detect/stream/:cameraId', async (req, res) => {
   try {
@@ -457,6 +491,8 @@ app.listen(PORT, async () => {
     console.log('  POST /api/detect              - Detect vehicles in image');
     console.log('  GET  /api/analytics/:id       - Get traffic analytics');
     console.log('  GET  /api/detect/stream/:id   - Stream detection (SSE)');
+    console.log('  GET  /api/cameras/:id/roi     - Get camera region of interest');
+    console.log('  PUT  /api/cameras/:id/roi     - Set camera region of interest');
   } else {
     console.log('\n⚠️  Arduino not connected. Please check connection and try again.');
   }
@@ -48,6 +48,7 @@ import Header from './Header';
 import Sidebar from './Sidebar';
 import { TrafficLightOverlay } from './shared/TrafficLightOverlay';
 import { aiService, DetectionResponse } from '../services/aiService';
+import { RoiEditor } from './settings/RoiEditor';
 
 // Add pulse animation keyframes
 const pulseAnimation = `
@@ -411,7 +412,8 @@ const DynamicCameraStream = ({
         (error: Error) => {
           console.error('Detection error:', error);
         },
-        3000 // Detection interval: 3 seconds
+        3000, // Detection interval: 3 seconds
+        String(camera.id)
       );
 
       // Capture frames periodically (slightly before detection to ensure fresh frame)
@@ -454,7 +456,7 @@ const DynamicCameraStream = ({
         }
       };
     }
-  }, [enableDetection, onDetection]);
+  }, [enableDetection, onDetection, camera.id]);
 
   return (
     <>
@@ -862,7 +864,8 @@ const CameraFeed = ({
         (error: Error) => {
           console.error('Detection error:', error);
         },
-        3000 // Detection interval: 3 seconds
+        3000, // Detection interval: 3 seconds
+        String(camera.id)
       );
 
       // Capture frames periodically (slightly before detection to ensure fresh frame)
@@ -905,7 +908,7 @@ const CameraFeed = ({
         }
       };
     }
-  }, [enableDetection, onDetection]);
+  }, [enableDetection, onDetection, camera.id]);
 
   const handleZoomChange = (_event: Event, newValue: number | number[]) => {
     setZoom(newValue as number);
@@ -2158,6 +2161,10 @@ const CameraSettingsTab = ({ cameras }: { cameras: Camera[] }) => {
               </Box>
             </Box>
             
+            <Divider sx={{ my: 2 }} />
+            
+            <RoiEditor cameraId={String(camera.id)} />
+            
             <Box sx={{ mt: 2 }}>
               <FormControlLabel 
                 control={<Switch defaultChecked />} 
@@ -146,7 +146,8 @@ export const DynamicCameraStream: React.FC<DynamicCameraStreamProps> = ({
       (error) => {
         console.error('Detection error:', error);
       },
-      1000 // Detect every 1 second
+      1000, // Detect every 1 second
+      String(camera.id)
     );
 
     detectionIntervalRef.current = intervalId;
@@ -157,7 +158,7 @@ export const DynamicCameraStream: React.FC<DynamicCameraStreamProps> = ({
       }
       video.removeEventListener('loadedmetadata', updateCanvasSize);
     };
-  }, [enableDetection, isLoading, error, onDetection]);
+  }, [enableDetection, isLoading, error, onDetection, camera.id]);
 
   return (
     <>
@@ -1,6 +1,7 @@
 import React from 'react';
 import { Box, Button, Chip, Divider, FormControlLabel, Paper, Stack, Switch, Typography } from '@mui/material';
 import { Camera } from '../../types';
+import { RoiEditor } from './RoiEditor';
 
 interface CameraSettingsTabProps {
   cameras: Camera[];
@@ -63,6 +64,10 @@ export const CameraSettingsTab: React.FC<CameraSettingsTabProps> = ({ cameras })
               </Box>
             </Box>
             
+            <Divider sx={{ my: 2 }} />
+            
+            <RoiEditor cameraId={String(camera.id)} />
+            
             <Box sx={{ mt: 2 }}>
               <FormControlLabel 
                 control={<Switch defaultChecked />} 
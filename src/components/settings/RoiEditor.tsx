@@ -0,0 +1,95 @@
+import React, { useEffect, useRef, useState } from 'react';
+import axios from 'axios';
+import { Alert, Box, Button, Stack, Typography } from '@mui/material';
+import { aiService, RoiPolygon } from '../../services/aiService';
+
+interface RoiEditorProps {
+  cameraId: string;
+}
+
+// Region of interest editor: click the frame to add polygon points (normalized 0-1 coordinates).
+// Detections centered outside the saved polygon are ignored by the AI server.
+export const RoiEditor: React.FC<RoiEditorProps> = ({ cameraId }) => {
+  const frameRef = useRef<HTMLDivElement>(null);
+  const [points, setPoints] = useState<RoiPolygon>([]);
+  const [saved, setSaved] = useState<RoiPolygon | null>(null);
+  const [message, setMessage] = useState<{ severity: 'success' | 'error'; text: string } | null>(null);
+
+  useEffect(() => {
+    aiService.getCameraRoi(cameraId)
+      .then((roi) => {
+        setSaved(roi.polygon);
+        setPoints(roi.polygon || []);
+      })
+      .catch(() => setMessage({ severity: 'error', text: 'Could not load the ROI (is the AI server running?)' }));
+  }, [cameraId]);
+
+  const addPoint = (event: React.MouseEvent<HTMLDivElement>) => {
+    const rect = frameRef.current?.getBoundingClientRect();
+    if (!rect) return;
+    const x = Math.min(1, Math.max(0, (event.clientX - rect.left) / rect.width));
+    const y = Math.min(1, Math.max(0, (event.clientY - rect.top) / rect.height));
+    setPoints([...points, [Number(x.toFixed(4)), Number(y.toFixed(4))]]);
+  };
+
+  const save = async (polygon: RoiPolygon | null) => {
+    try {
+      const roi = await aiService.setCameraRoi(cameraId, polygon);
+      setSaved(roi.polygon);
+      setPoints(roi.polygon || []);
+      setMessage({ severity: 'success', text: polygon ? 'ROI saved' : 'ROI cleared (whole frame)' });
+    } catch (error) {
+      const text = axios.isAxiosError(error) ? error.response?.data?.message || error.message : 'ROI update failed';
+      setMessage({ severity: 'error', text });
+    }
+  };
+
+  const svgPoints = points.map(([x, y]) => `${x * 100},${y * 100}`).join(' ');
+
+  return (
+    <Box>
+      <Typography variant="subtitle2" gutterBottom>
+        Region of Interest
+      </Typography>
+      <Typography variant="body2" color="text.secondary" sx={{ mb: 1 }}>
+        Click the frame to outline the area to analyze (at least 3 points).
+      </Typography>
+
+      <Box
+        ref={frameRef}
+        onClick={addPoint}
+        sx={{ position: 'relative', width: '100%', aspectRatio: '16 / 9', bgcolor: '#222', borderRadius: 1, cursor: 'crosshair' }}
+      >
+        <svg viewBox="0 0 100 100" preserveAspectRatio="none" style={{ position: 'absolute', inset: 0, width: '100%', height: '100%' }}>
+          {points.length >= 3 && (
+            <polygon points={svgPoints} fill="rgba(103, 174, 110, 0.3)" stroke="#67AE6E" strokeWidth={0.5} />
+          )}
+          {points.length < 3 && points.length > 1 && (
+            <polyline points={svgPoints} fill="none" stroke="#67AE6E" strokeWidth={0.5} />
+          )}
+          {points.map(([x, y], i) => (
+            <circle key={i} cx={x * 100} cy={y * 100} r={1} fill="#ffffff" />
+          ))}
+        </svg>
+      </Box>
+
+      <Stack direction="row" spacing={1} sx={{ mt: 1 }}>
+        <Button size="small" variant="outlined" disabled={points.length < 3} onClick={() => save(points)}>
+          Save ROI
+        </Button>
+        <Button size="small" disabled={!points.length} onClick={() => setPoints(points.slice(0, -1))}>
+          Undo Point
+        </Button>
+        <Button size="small" color="error" disabled={!saved && !points.length} onClick={() => save(null)}>
+          Clear ROI
+        </Button>
+      </Stack>
+
+      {message && (
+        <Alert severity={message.severity} sx={{ mt: 1 }} onClose={() => setMessage(null)}>
+          {message.text}
+        </Alert>
+      )}
+    </Box>
+  );
+};
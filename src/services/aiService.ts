@@ -55,6 +55,14 @@ export interface DetectionResponse {
   };
 }
 
+// Region of interest: polygon in normalized 0-1 frame coordinates, null = whole frame
+export type RoiPolygon = [number, number][];
+
+export interface CameraRoi {
+  camera_id: string;
+  polygon: RoiPolygon | null;
+}
+
 export interface AnalyticsData {
   intersection_id: string;
   timestamp: string;
@@ -64,9 +72,11 @@ export interface AnalyticsData {
     fps: number;
   };
   analytics: {
-    vehicles_per_hour: number;
+    vehicles_per_hour: number | null;  // Unique tracked vehicles, null without camera streams or in the first 5 minutes
+    vehicles_per_hour_window_seconds?: number;  // Tracked time the rate covers (up to 3600)
     congestion_level: string;
-    average_speed: number;
+    average_speed: number | null;  // km/h, null until a camera is calibrated
+    average_speed_px_s?: number | null;
     peak_hours: string[];
   };
 }
@@ -93,10 +103,14 @@ class AIService {
 
   /**
    * Detect vehicles in an image
+   * (cameraId applies the camera's ROI and feeds its intersection's analytics)
    */
-  async detectVehicles(imageFile: File): Promise<DetectionResponse> {
+  async detectVehicles(imageFile: File, cameraId?: string): Promise<DetectionResponse> {
     const formData = new FormData();
     formData.append('image', imageFile);
+    if (cameraId) {
+      formData.append('camera_id', cameraId);
+    }
 
     const response = await axios.post(`${this.baseURL}/api/detect`, formData, {
       headers: {
@@ -110,7 +124,7 @@ class AIService {
   /**
    * Detect vehicles from canvas (camera stream)
    */
-  async detectFromCanvas(canvas: HTMLCanvasElement): Promise<DetectionResponse> {
+  async detectFromCanvas(canvas: HTMLCanvasElement, cameraId?: string): Promise<DetectionResponse> {
     return new Promise((resolve, reject) => {
       canvas.toBlob(async (blob) => {
         if (!blob) {
@@ -120,7 +134,7 @@ class AIService {
 
         const file = new File([blob], 'frame.jpg', { type: 'image/jpeg' });
         try {
-          const result = await this.detectVehicles(file);
+          const result = await this.detectVehicles(file, cameraId);
           resolve(result);
         } catch (error) {
           reject(error);
@@ -137,6 +151,22 @@ class AIService {
     return response.data;
   }
 
+  /**
+   * Get a camera's region of interest
+   */
+  async getCameraRoi(cameraId: string): Promise<CameraRoi> {
+    const response = await axios.get(`${this.baseURL}/api/cameras/${encodeURIComponent(cameraId)}/roi`);
+    return response.data;
+  }
+
+  /**
+   * Set (or clear with null) a camera's region of interest
+   */
+  async setCameraRoi(cameraId: string, polygon: RoiPolygon | null): Promise<CameraRoi> {
+    const response = await axios.put(`${this.baseURL}/api/cameras/${encodeURIComponent(cameraId)}/roi`, { polygon });
+    return response.data;
+  }
+
   /**
    * Start real-time detection (polling)
    */
@@ -144,11 +174,12 @@ class AIService {
     canvas: HTMLCanvasElement,
     onDetection: (result: DetectionResponse) => void,
     onError: (error: Error) => void,
-    interval: number = 1000 // 1 second
+    interval: number = 1000, // 1 second
+    cameraId?: string
   ): number {
     const intervalId = window.setInterval(async () => {
       try {
-        const result = await this.detectFromCanvas(canvas);
+        const result = await this.detectFromCanvas(canvas, cameraId);
         onDetection(result);
       } catch (error) {
         onError(error as Error);